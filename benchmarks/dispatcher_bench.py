@@ -0,0 +1,360 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import datetime
+import tempfile
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+
+# Добавляем родительский каталог в sys.path для импорта модулей бота
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Настройки по умолчанию задаются до импорта config: бенчмарк не должен
+# писать в рабочие логи, поднимать сервер показателей и ходить в Telegram или OpenAI
+BENCH_LOG_DIR = tempfile.mkdtemp(prefix="bot_bench_logs_")
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+os.environ.setdefault("METRICS_PORT", "0")
+os.environ["LOG_FILE_DIR"] = BENCH_LOG_DIR
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.client.session.base import BaseSession
+from aiogram.types import CallbackQuery, Chat, Message, MessageEntity, Update, User
+
+import middlewares.metrics as middleware_metrics
+import services.openai_service as openai_service
+from config import config
+from services.db import db
+from middlewares import setup_middlewares
+from handlers import register_all_handlers
+from utils.log_pipeline import event_log, log_pipeline
+
+
+# Каталог с эталонными результатами (сравниваются с текущим запуском)
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+DEFAULT_BASELINE = os.path.join(BASELINE_DIR, "dispatcher.json")
+
+# Маршруты: название -> (доля в нагрузке, тип события, функция текста/данных по номеру обновления).
+# Сообщения для OpenAI уникальны, чтобы кэш ответов не подменял запрос к API
+ROUTES = {
+    "cmd_start": (0.05, "message", lambda i: "/start"),
+    "cmd_help": (0.05, "message", lambda i: "/help"),
+    "keyword_greeting": (0.15, "message", lambda i: "привет всем"),
+    "keyword_ai": (0.15, "message", lambda i: "как нейросети помогают в работе"),
+    "keyword_business": (0.15, "message", lambda i: "хочу запустить стартап"),
+    "llm": (0.30, "message", lambda i: f"посоветуй книгу номер {i} для начинающего"),
+    "callback": (0.15, "callback_query", lambda i: "topic:business_plan"),
+}
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия Bot API без сети: методы отправки сообщений возвращают сообщение-заглушку,
+    остальные - True. Количество вызовов по методам считается для отчета.
+    Параметры метода сериализуются так же, как перед настоящей отправкой
+    (prepare_value), поэтому их стоимость входит в замер
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Dict[str, int] = {}
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        name = type(method).__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        files: Dict[str, Any] = {}
+        for value in method.model_dump(warnings=False).values():
+            self.prepare_value(value, bot=bot, files=files)
+        if method.__returning__ is Message:
+            chat_id = getattr(method, "chat_id", None) or 1
+            return Message(
+                message_id=1,
+                date=datetime.datetime.now(),
+                chat=Chat(id=chat_id, type="private"),
+                text=getattr(method, "text", None),
+            ).as_(bot)
+        return True
+
+    async def stream_content(self, *args, **kwargs) -> AsyncIterator[bytes]:
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class StubCompletions:
+    """
+    Заглушка chat.completions клиента OpenAI
+
+    Ответ приходит через latency секунд, в потоковом режиме - частями chunks штук,
+    с расходом токенов в последней части, как у настоящего API
+    """
+
+    def __init__(self, latency: float = 0.0, chunks: int = 20):
+        self.latency = latency
+        self.chunks = chunks
+        self.requests = 0
+
+    async def create(self, stream: bool = False, **kwargs) -> Any:
+        self.requests += 1
+        usage = SimpleNamespace(prompt_tokens=50, completion_tokens=self.chunks)
+        if stream:
+            return _StubStream(self.latency, self.chunks, usage)
+        await asyncio.sleep(self.latency)
+        message = SimpleNamespace(content="ответ " * self.chunks)
+        return SimpleNamespace(usage=usage, choices=[SimpleNamespace(message=message)])
+
+
+class _StubStream:
+    """Потоковый ответ заглушки: поддерживает async with и async for"""
+
+    def __init__(self, latency: float, chunks: int, usage: Any):
+        self.latency = latency
+        self.chunks = chunks
+        self.usage = usage
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.latency)
+        for _ in range(self.chunks):
+            delta = SimpleNamespace(content="ответ ")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=self.usage)
+
+
+class SampleRecorder:
+    """
+    Замена гистограммы показателей, сохраняющая каждое значение
+
+    Подставляется вместо гистограмм middleware и обработчиков, чтобы считать
+    точные перцентили, а не оценки по корзинам
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    def observe(self, value: float, *labels: str):
+        self.samples.setdefault(labels[0], []).append(value)
+
+
+def percentile(values: List[float], share: float) -> float:
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(share * len(values))) - 1))
+    return values[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, Any]:
+    """Количество и перцентили задержки в миллисекундах"""
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+    }
+
+
+def make_update(update_id: int, route: str, user_id: int) -> Update:
+    """Синтетическое обновление для маршрута"""
+    _, event_type, payload = ROUTES[route]
+    user = User(id=user_id, is_bot=False, first_name="Bench", username=f"bench{user_id}")
+    chat = Chat(id=user_id, type="private")
+    now = datetime.datetime.now()
+    if event_type == "callback_query":
+        message = Message(message_id=update_id, date=now, chat=chat, text="Темы")
+        return Update(update_id=update_id, callback_query=CallbackQuery(
+            id=str(update_id), from_user=user, chat_instance="bench", message=message, data=payload(update_id),
+        ))
+    text = payload(update_id)
+    entities = None
+    if text.startswith("/"):
+        entities = [MessageEntity(type="bot_command", offset=0, length=len(text))]
+    return Update(update_id=update_id, message=Message(
+        message_id=update_id, date=now, chat=chat, from_user=user, text=text, entities=entities,
+    ))
+
+
+def build_workload(count: int, users: int, seed: int) -> List[Tuple[str, Update]]:
+    """
+    Смесь обновлений по долям маршрутов
+
+    Обновления создаются заранее, чтобы построение объектов не входило в замер
+    """
+    rng = random.Random(seed)
+    routes = list(ROUTES)
+    weights = [ROUTES[route][0] for route in routes]
+    workload = []
+    for update_id in range(1, count + 1):
+        route = rng.choices(routes, weights)[0]
+        workload.append((route, make_update(update_id, route, 1000 + update_id % users)))
+    return workload
+
+
+async def run(count: int, users: int, concurrency: int, llm_latency: float, llm_chunks: int,
+              seed: int, warmup: int) -> Dict[str, Any]:
+    """
+    Прогон нагрузки через настоящий диспетчер со всеми middleware и обработчиками
+
+    :return: Результаты: пропускная способность и перцентили по маршрутам, middleware и обработчикам
+    """
+    # БД в бенчмарке не используется: так же, как без драйвера asyncpg,
+    # события не пишутся в БД, а диалоги не загружаются из нее
+    db.asyncpg = None
+    completions = StubCompletions(latency=llm_latency, chunks=llm_chunks)
+    openai_service.client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+    # Точные значения вместо гистограмм показателей
+    middleware_samples = middleware_metrics.middleware_duration = SampleRecorder()
+    handler_samples = middleware_metrics.handler_duration = SampleRecorder()
+
+    dp = Dispatcher()
+    setup_middlewares(dp)
+    register_all_handlers(dp)
+    session = FakeSession()
+    bot = Bot(token=config.bot.token, session=session)
+
+    route_samples: Dict[str, List[float]] = {route: [] for route in ROUTES}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def feed(route: str, update: Update, record: bool):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await dp.feed_update(bot, update)
+            # Обработчик мог вернуть метод Bot API вместо вызова (см. режим webhook)
+            if isinstance(result, TelegramMethod):
+                await dp.silent_call_request(bot=bot, result=result)
+            if record:
+                route_samples[route].append(time.perf_counter() - started)
+
+    # Прогрев: первые обновления компилируют фильтры и заполняют кэши aiogram
+    warmup_load = build_workload(warmup, users, seed + 1)
+    await asyncio.gather(*(feed(route, update, False) for route, update in warmup_load))
+    middleware_samples.samples.clear()
+    handler_samples.samples.clear()
+
+    workload = build_workload(count, users, seed)
+    started = time.perf_counter()
+    await asyncio.gather(*(feed(route, update, True) for route, update in workload))
+    elapsed = time.perf_counter() - started
+
+    await bot.session.close()
+    log_pipeline.stop()
+    event_log.stop()
+
+    return {
+        "settings": {
+            "updates": count,
+            "users": users,
+            "concurrency": concurrency,
+            "llm_latency_ms": llm_latency * 1000,
+            "llm_chunks": llm_chunks,
+            "streaming": config.openai.streaming,
+            "seed": seed,
+        },
+        "throughput_per_sec": round(count / elapsed, 1),
+        "routes": {route: summarize(samples) for route, samples in route_samples.items() if samples},
+        "middlewares": {name: summarize(samples) for name, samples in sorted(middleware_samples.samples.items())},
+        "handlers": {name: summarize(samples) for name, samples in sorted(handler_samples.samples.items())},
+        "bot_api_calls": dict(sorted(session.calls.items())),
+        "openai_requests": completions.requests,
+    }
+
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    """Вывод результатов (и изменения относительно эталона, если он задан)"""
+    def delta(current: float, previous: Optional[float]) -> str:
+        if not previous:
+            return ""
+        return f" ({(current - previous) / previous * 100:+.0f}%)"
+
+    previous_throughput = baseline.get("throughput_per_sec") if baseline else None
+    print(f"Пропускная способность: {results['throughput_per_sec']} обновлений/сек"
+          f"{delta(results['throughput_per_sec'], previous_throughput)}")
+
+    for section, title in (("routes", "Маршруты"), ("middlewares", "Middleware"), ("handlers", "Обработчики")):
+        print(f"\n{title}:")
+        print(f"  {'название':<28}{'кол-во':>8}{'p50, мс':>16}{'p95, мс':>16}{'p99, мс':>16}")
+        for name, row in results[section].items():
+            old = (baseline or {}).get(section, {}).get(name, {})
+            cells = "".join(
+                f"{str(row[key]) + delta(row[key], old.get(key)):>16}" for key in ("p50_ms", "p95_ms", "p99_ms")
+            )
+            print(f"  {name:<28}{row['count']:>8}{cells}")
+
+    print(f"\nВызовы Bot API: {results['bot_api_calls']}")
+    print(f"Запросов к OpenAI (заглушка): {results['openai_requests']}")
+
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Маршруты и middleware, у которых p95 вырос больше чем на threshold (доля)
+
+    :return: Описания регрессий
+    """
+    regressions = []
+    for section in ("routes", "middlewares"):
+        for name, row in results[section].items():
+            old = baseline.get(section, {}).get(name, {}).get("p95_ms")
+            if old and row["p95_ms"] > old * (1 + threshold):
+                regressions.append(f"{section}/{name}: p95 {old} -> {row['p95_ms']} мс")
+    return regressions
+
+
+# Проверяем, запущен ли скрипт напрямую (а не импортирован)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пропускная способность диспетчера бота на синтетических обновлениях")
+    parser.add_argument("--updates", type=int, default=5000, help="количество обновлений в замере")
+    parser.add_argument("--users", type=int, default=10000, help="количество разных пользователей")
+    parser.add_argument("--concurrency", type=int, default=40,
+                        help="обновлений, обрабатываемых одновременно (как WEBHOOK_MAX_CONNECTIONS)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="задержка заглушки OpenAI до ответа")
+    parser.add_argument("--llm-chunks", type=int, default=20, help="частей потокового ответа заглушки")
+    parser.add_argument("--warmup", type=int, default=500, help="обновлений для прогрева (не входят в замер)")
+    parser.add_argument("--seed", type=int, default=1, help="зерно генератора смеси обновлений")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="файл эталона для сравнения")
+    parser.add_argument("--save", action="store_true", help="сохранить результаты как новый эталон")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="допустимый рост p95 относительно эталона (доля, например 0.25); "
+                             "при превышении скрипт завершается с кодом 1")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(
+            args.updates, args.users, args.concurrency, args.llm_latency_ms / 1000,
+            args.llm_chunks, args.seed, args.warmup,
+        ))
+    finally:
+        shutil.rmtree(BENCH_LOG_DIR, ignore_errors=True)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_report(results, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+            file.write("\n")
+        print(f"\nЭталон сохранен: {args.baseline}")
+
+    if args.max_regression is not None and baseline:
+        regressions = find_regressions(results, baseline, args.max_regression)
+        if regressions:
+            print("\nРегрессии:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
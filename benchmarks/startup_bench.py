@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Any, Dict, List, Optional
+
+
+# Замер времени запуска: каждый прогон - отдельный процесс, который импортирует main.py,
+# выполняет хуки запуска и обрабатывает первое обновление (/start). Время считается
+# от запуска процесса родителем, поэтому в него входят запуск интерпретатора и все импорты
+
+
+# Каталог с эталонными результатами (сравниваются с текущим запуском)
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+DEFAULT_BASELINE = os.path.join(BASELINE_DIR, "startup.json")
+
+# Переменная окружения с моментом запуска процесса (time.time() в родителе)
+T0_ENV = "STARTUP_BENCH_T0"
+
+
+async def child(with_db: bool) -> Dict[str, Any]:
+    """
+    Один запуск бота в процессе-потомке
+
+    :return: Время до готовности и до ответа на первое обновление, разбивка по фазам
+    """
+    t0 = float(os.environ[T0_ENV])
+
+    # Первым импортируется main.py - так же, как при обычном запуске бота
+    import main
+    from aiogram.methods import TelegramMethod
+    from dispatcher_bench import BENCH_LOG_DIR, FakeSession, make_update
+    from utils.startup import startup_profiler
+    from config import config
+
+    # Каталог логов dispatcher_bench не используется: логи пишутся в каталог из окружения
+    shutil.rmtree(BENCH_LOG_DIR, ignore_errors=True)
+
+    # Сеть не используется: Bot API отвечает заглушка, планировщик отправки - тот же, что в bot.py
+    main.bot.session = FakeSession()
+    if config.outbound.enabled:
+        from services.outbound import outbound
+        main.bot.session.middleware(outbound)
+
+    # Без --with-db бот работает так же, как без драйвера asyncpg
+    if not with_db:
+        main.db.asyncpg = None
+
+    with startup_profiler.phase("настройка диспетчера"):
+        main.setup_dispatcher(main.dp)
+    main.dp.startup.register(main.mark_ready)
+    await main.dp.emit_startup(bot=main.bot, dispatcher=main.dp)
+
+    # Первое обновление: ответ обработчика (или возвращенный метод) отправляется через заглушку
+    result = await main.dp.feed_update(main.bot, make_update(1, "cmd_start", 1000))
+    if isinstance(result, TelegramMethod):
+        await main.dp.silent_call_request(bot=main.bot, result=result)
+    first_update = time.time() - t0
+    calls = dict(main.bot.session.calls)
+    # Сигнал готовности снимается при остановке - запоминаем время до нее
+    ready = startup_profiler.ready_at or 0.0
+
+    await main.dp.emit_shutdown(bot=main.bot, dispatcher=main.dp)
+
+    return {
+        "first_update_s": round(first_update, 4),
+        "ready_s": round(ready, 4),
+        "phases": {name: round(seconds, 4) for name, seconds in startup_profiler.phases},
+        "bot_api_calls": calls,
+    }
+
+
+def spawn(with_db: bool, workdir: str) -> Dict[str, Any]:
+    """
+    Запуск одного процесса-потомка
+
+    :return: Результаты потомка (последняя строка его вывода - JSON)
+    """
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "123456:bench")
+    env.setdefault("OPENAI_API_KEY", "sk-bench")
+    # Бенчмарк не должен писать в рабочие логи и файлы состояния и поднимать сервер показателей
+    env.update({
+        "METRICS_PORT": "0",
+        "LOG_FILE_DIR": os.path.join(workdir, "logs"),
+        "ACTIVE_USERS_PATH": os.path.join(workdir, "active_users.json"),
+        "LLM_USAGE_PATH": os.path.join(workdir, "token_usage.json"),
+        "STARTUP_READY_FILE": "",
+        "STARTUP_PROFILE": "false",
+        T0_ENV: repr(time.time()),
+    })
+    command = [sys.executable, os.path.abspath(__file__), "--child"]
+    if with_db:
+        command.append("--with-db")
+    completed = subprocess.run(command, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Процесс запуска завершился с кодом {completed.returncode}:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run(runs: int, with_db: bool) -> Dict[str, Any]:
+    """
+    Несколько запусков подряд и медианы по ним
+
+    :return: Результаты: время до первого обновления, до готовности и по фазам
+    """
+    samples: List[Dict[str, Any]] = []
+    for _ in range(runs):
+        workdir = tempfile.mkdtemp(prefix="bot_startup_bench_")
+        try:
+            samples.append(spawn(with_db, workdir))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def median_ms(values: List[float]) -> float:
+        return round(statistics.median(values) * 1000, 1)
+
+    phases: Dict[str, List[float]] = {}
+    for sample in samples:
+        for name, seconds in sample["phases"].items():
+            phases.setdefault(name, []).append(seconds)
+
+    first_update = [sample["first_update_s"] for sample in samples]
+    return {
+        "settings": {"runs": runs, "with_db": with_db},
+        "first_update_ms": median_ms(first_update),
+        "first_update_max_ms": round(max(first_update) * 1000, 1),
+        "ready_ms": median_ms([sample["ready_s"] for sample in samples]),
+        "phases": {name: median_ms(values) for name, values in phases.items()},
+        "bot_api_calls": samples[-1]["bot_api_calls"],
+    }
+
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    """Вывод результатов (и изменения относительно эталона, если он задан)"""
+    def delta(current: float, previous: Optional[float]) -> str:
+        if not previous:
+            return ""
+        return f" ({(current - previous) / previous * 100:+.0f}%)"
+
+    old = baseline or {}
+    print(f"Время до ответа на первое обновление: {results['first_update_ms']} мс"
+          f"{delta(results['first_update_ms'], old.get('first_update_ms'))}"
+          f" (макс. {results['first_update_max_ms']} мс)")
+    print(f"Время до готовности: {results['ready_ms']} мс{delta(results['ready_ms'], old.get('ready_ms'))}")
+
+    print("\nФазы запуска (медиана):")
+    for name, value in results["phases"].items():
+        cell = f"{value}{delta(value, old.get('phases', {}).get(name))}"
+        print(f"  {name:<45}{cell:>20} мс")
+
+    print(f"\nВызовы Bot API: {results['bot_api_calls']}")
+
+
+def find_regressions(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Показатели, выросшие больше чем на threshold (доля)
+
+    :return: Описания регрессий
+    """
+    regressions = []
+    for key in ("first_update_ms", "ready_ms"):
+        old = baseline.get(key)
+        if old and results[key] > old * (1 + threshold):
+            regressions.append(f"{key}: {old} -> {results[key]} мс")
+    return regressions
+
+
+# Проверяем, запущен ли скрипт напрямую (а не импортирован)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время запуска бота до ответа на первое обновление")
+    parser.add_argument("--runs", type=int, default=5, help="количество запусков (берется медиана)")
+    parser.add_argument("--with-db", action="store_true",
+                        help="создавать пул соединений с БД (по умолчанию - как без драйвера asyncpg)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="файл эталона для сравнения")
+    parser.add_argument("--save", action="store_true", help="сохранить результаты как новый эталон")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="допустимый рост времени запуска относительно эталона (доля, например 0.25); "
+                             "при превышении скрипт завершается с кодом 1")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Родительский каталог - для импорта модулей бота, как в остальных бенчмарках
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        print(json.dumps(asyncio.run(child(args.with_db)), ensure_ascii=False))
+        sys.exit(0)
+
+    results = run(args.runs, args.with_db)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_report(results, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+            file.write("\n")
+        print(f"\nЭталон сохранен: {args.baseline}")
+
+    if args.max_regression is not None and baseline:
+        regressions = find_regressions(results, baseline, args.max_regression)
+        if regressions:
+            print("\nРегрессии:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
@@ -13,3 +13,9 @@ bot = Bot(token=config.bot.token, default=DefaultBotProperties(parse_mode=ParseM
 
 # Диспетчер отвечает за маршрутизацию обновлений от Telegram к соответствующим обработчикам
 dp = Dispatcher()
+
+
+# Все отправки сообщений проходят через планировщик с учетом ограничений Telegram
+if config.outbound.enabled:
+    from services.outbound import outbound
+    bot.session.middleware(outbound)
@@ -15,6 +15,7 @@ class BotConfig:
     Использование dataclass упрощает создание классов для хранения данных
     """
     token: str                   # Токен бота Telegram
+    mode: str                    # Режим получения обновлений: polling, webhook или supervisor
     admin_ids: list[int]         # Список ID администраторов бота
     
     # Параметры подключения к базе данных PostgreSQL
@@ -24,26 +25,194 @@ class BotConfig:
     db_user: str                 # Имя пользователя БД
     db_password: str             # Пароль пользователя БД
     
+    # Параметры общего пула соединений с БД
+    db_pool_min_size: int        # Минимальное количество соединений в пуле
+    db_pool_max_size: int        # Максимальное количество соединений в пуле
+    db_acquire_timeout: float    # Время ожидания свободного соединения (в секундах)
+    db_command_timeout: float    # Максимальное время выполнения запроса (в секундах)
+    db_statement_cache_size: int # Размер кэша подготовленных запросов на соединение
+    db_health_check_interval: float  # Интервал проверки доступности БД (в секундах)
+    
     # Имена таблиц и колонок в базе данных
     basic_logs_db_table_name: str    # Имя таблицы для основных логов
     errors_logs_db_table_name: str   # Имя таблицы для логов ошибок
     basic_logs_db_column_name: str   # Имя колонки для основных логов
     errors_logs_db_column_name: str  # Имя колонки для логов ошибок
     
+    stats_cache_ttl: float       # Время жизни кэша статистики /stats (в секундах)
+    
 
 @dataclass
 class OpenAIConfig:
     """Конфигурация для API OpenAI"""
     api_key: str                 # API ключ OpenAI
     model: str                   # Название модели OpenAI (например, gpt-3.5-turbo)
-    
+    max_concurrency: int         # Максимальное количество одновременных запросов к API
+    request_timeout: float       # Таймаут одного HTTP-запроса к API (в секундах)
+    deadline: float              # Общий лимит времени на ответ, включая ожидание в очереди
+    cache_max_entries: int       # Максимальное количество ответов в кэше
+    cache_ttl: float             # Время жизни ответа в кэше (в секундах)
+    cache_max_bytes: int         # Ограничение памяти под кэш ответов (в байтах)
+    streaming: bool              # Показывать ответ по мере генерации (редактированием сообщения)
+    stream_edit_interval: float  # Минимальный интервал между редактированиями сообщения (в секундах)
+
+
+@dataclass
+class WebhookConfig:
+    """Конфигурация получения обновлений через webhook"""
+    url: str                     # Публичный адрес webhook (пусто - не регистрировать webhook в Telegram)
+    path: str                    # Путь, на который Telegram присылает обновления
+    host: str                    # Адрес, на котором слушает встроенный HTTP-сервер
+    port: int                    # Порт встроенного HTTP-сервера
+    secret_token: str            # Секрет из заголовка X-Telegram-Bot-Api-Secret-Token
+    max_connections: int         # Максимум одновременных соединений от Telegram (1-100)
+    answer_in_response: bool     # Отвечать простыми методами прямо в ответе на webhook
+    answer_timeout: float        # Сколько ждать обработчик, чтобы ответить в ответе на webhook (сек)
+    drop_pending_updates: bool   # Отбросить накопившиеся обновления при регистрации webhook
+
+
+@dataclass
+class SupervisorConfig:
+    """Конфигурация многопроцессного режима (супервизор и воркеры)"""
+    workers: int                 # Количество процессов-воркеров
+    queue_size: int              # Очередь обновлений каждого воркера в супервизоре
+    max_in_flight: int           # Максимум одновременно обрабатываемых обновлений в воркере
+    restart_delay: float         # Пауза перед перезапуском упавшего воркера (в секундах)
+    restart_max_delay: float     # Предел паузы, которая удваивается с каждым падением подряд (в секундах)
+    max_restarts: int            # Падений подряд, после которых воркер считается неработающим (0 - никогда)
+    metrics_interval: float      # Интервал отправки показателей воркеров (в секундах)
+    metrics_path: str            # Файл с показателями воркеров (читается командой /stats)
+
+
+@dataclass
+class ThrottlingConfig:
+    """Конфигурация ограничения частоты запросов пользователей"""
+    rate: float                  # Устойчивая скорость: единиц стоимости в секунду на пользователя
+    burst: float                 # Сколько единиц можно потратить подряд после паузы
+    llm_cost: float              # Стоимость сообщения, на которое отвечает OpenAI
+    notify: bool                 # Сообщать пользователю, что его сообщения ограничены
+    storage: str                 # Хранилище состояния: memory (в процессе) или redis (общее)
+    redis_url: str               # Адрес Redis для общего хранилища
+    lease_fraction: float        # Доля запаса пользователя, расходуемая без обращения к Redis
+    lease_ttl: float             # Время жизни локальной аренды запаса (в секундах)
+
+
+@dataclass
+class LogWriterConfig:
+    """Конфигурация фоновой записи событий в БД"""
+    queue_size: int              # Максимальное количество событий в очереди
+    batch_size: int              # Количество событий, при котором очередь сбрасывается в БД
+    flush_interval: float        # Максимальный интервал между сбросами (в секундах)
+    overflow_policy: str         # Политика при переполнении: drop_new, drop_oldest или block
+    block_timeout: float         # Сколько ждать места в очереди при политике block (в секундах)
+
+
+@dataclass
+class FileLogConfig:
+    """Конфигурация записи лога в файл"""
+    directory: str               # Каталог для файлов лога
+    max_bytes: int               # Размер файла, при котором он ротируется досрочно (0 - только по дням)
+    backup_days: int             # Сколько дней хранить ротированные файлы (0 - хранить всегда)
+    queue_size: int              # Максимум записей, ожидающих записи в файл (лишние отбрасываются)
+    compress: bool               # Сжимать ротированные файлы gzip
+    analyzer_workers: int        # Процессов для анализа журнала событий в /stats без БД (0 - по числу ядер)
+
+
+@dataclass
+class PartitionConfig:
+    """Конфигурация секционирования таблиц логов и ошибок по времени"""
+    interval: str                # Размер секции: day или month
+    premake: int                 # Сколько будущих секций создавать заранее
+    logs_retention_days: int     # Срок хранения логов в днях (0 - хранить всегда)
+    errors_retention_days: int   # Срок хранения ошибок в днях (0 - хранить всегда)
+    maintenance_interval: float  # Интервал создания/удаления секций (в секундах)
+
+
+@dataclass
+class ActiveUsersConfig:
+    """Конфигурация оценки количества активных пользователей (HyperLogLog)"""
+    path: str                    # Файл, в котором сохраняются дневные оценки
+    precision: int               # Точность оценки: 2^precision байт на день, ошибка ~1.04/sqrt(2^precision)
+    persist_interval: float      # Интервал сохранения оценок в файл (в секундах)
+
+
+@dataclass
+class TokenBudgetConfig:
+    """Конфигурация суточных квот токенов OpenAI на пользователя"""
+    daily_quota: int             # Токенов на пользователя за скользящие сутки (0 - без ограничения)
+    bucket_seconds: int          # Точность скользящего окна (длительность корзины учета, в секундах)
+    path: str                    # Файл, в котором сохраняется расход токенов
+    persist_interval: float      # Интервал сохранения расхода в файл (в секундах)
+
+
+@dataclass
+class ConversationConfig:
+    """Конфигурация памяти диалогов (контекст для OpenAI)"""
+    enabled: bool                # Передавать в OpenAI историю диалога
+    max_conversations: int       # Максимальное количество диалогов в памяти
+    max_turns: int               # Сколько последних реплик хранить в диалоге
+    max_turn_chars: int          # Максимальная длина сохраняемой реплики (в символах)
+    max_prompt_tokens: int       # Бюджет токенов на системную инструкцию, историю и вопрос
+    idle_timeout: float          # Через сколько секунд простоя диалог выгружается в БД
+    retention_days: int          # Срок хранения выгруженных диалогов в днях (0 - хранить всегда)
+    table: str                   # Таблица для выгруженных диалогов
+
+
+@dataclass
+class MetricsConfig:
+    """Конфигурация локального сервера показателей (формат Prometheus)"""
+    host: str                    # Адрес сервера показателей
+    port: int                    # Порт сервера показателей (0 - не запускать)
+
+
+@dataclass
+class OutboundConfig:
+    """Конфигурация планировщика исходящих сообщений"""
+    enabled: bool                # Пропускать отправку сообщений через планировщик
+    global_rate: float           # Сообщений в секунду для всего бота
+    chat_rate: float             # Сообщений в секунду в один личный чат
+    chat_burst: float            # Сколько сообщений можно отправить в личный чат подряд
+    group_per_minute: float      # Сообщений в минуту в одну группу
+    group_burst: float           # Сколько сообщений можно отправить в группу подряд
+    max_retries: int             # Сколько раз повторять отправку после ответа 429
+
+
+@dataclass
+class BroadcastConfig:
+    """Конфигурация рассылок администратора"""
+    table: str                   # Таблица рассылок (ход и контрольные точки)
+    blocked_table: str           # Таблица пользователей, заблокировавших бота
+    concurrency: int             # Максимум одновременных отправок
+    batch_size: int              # Получателей в пачке (и между контрольными точками)
+    progress_interval: float     # Интервал обновления хода рассылки у администратора (в секундах)
+
+
+@dataclass
+class StartupConfig:
+    """Конфигурация запуска процесса"""
+    ready_file: str              # Файл, создаваемый, когда бот готов принимать обновления (пусто - не создавать)
+    profile: bool                # Выводить в лог разбивку времени запуска по фазам
+
 
 @dataclass
 class Config:
     """Общая конфигурация приложения, объединяющая все подконфигурации"""
     bot: BotConfig               # Конфигурация бота
     openai: OpenAIConfig         # Конфигурация OpenAI
-    
+    webhook: WebhookConfig       # Конфигурация режима webhook
+    supervisor: SupervisorConfig # Конфигурация многопроцессного режима
+    throttling: ThrottlingConfig # Конфигурация ограничения частоты запросов
+    log_writer: LogWriterConfig  # Конфигурация фоновой записи событий
+    file_log: FileLogConfig      # Конфигурация записи лога в файл
+    active_users: ActiveUsersConfig  # Конфигурация оценки активных пользователей
+    partitions: PartitionConfig  # Конфигурация секционирования таблиц логов
+    token_budget: TokenBudgetConfig  # Конфигурация квот токенов OpenAI
+    conversation: ConversationConfig  # Конфигурация памяти диалогов
+    metrics: MetricsConfig       # Конфигурация сервера показателей
+    outbound: OutboundConfig     # Конфигурация планировщика исходящих сообщений
+    broadcast: BroadcastConfig   # Конфигурация рассылок
+    startup: StartupConfig       # Конфигурация запуска
+
 
 def load_config() -> Config:
     """
@@ -56,6 +225,9 @@ def load_config() -> Config:
             # Получаем токен бота из переменной окружения BOT_TOKEN
             token=os.getenv("BOT_TOKEN"),
             
+            # Режим получения обновлений: long polling (по умолчанию) или webhook
+            mode=os.getenv("BOT_MODE", "polling"),
+            
             # Получаем список ID администраторов, разделенных запятыми,
             # и преобразуем их в целые числа
             admin_ids=[int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").split(",") if admin_id],
@@ -69,16 +241,158 @@ def load_config() -> Config:
             db_user=os.getenv("DB_USER", "postgres"),
             db_password=os.getenv("DB_PASSWORD", ""),
             
+            # Настройки пула соединений
+            db_pool_min_size=int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+            db_pool_max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            db_acquire_timeout=float(os.getenv("DB_ACQUIRE_TIMEOUT", "5.0")),
+            db_command_timeout=float(os.getenv("DB_COMMAND_TIMEOUT", "30.0")),
+            db_statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+            db_health_check_interval=float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "30.0")),
+            
             # Имена таблиц и колонок
             basic_logs_db_table_name=os.getenv("BASIC_LOGS_DB_TABLE_NAME", "bot_logs"),
             errors_logs_db_table_name=os.getenv("ERRORS_LOGS_DB_TABLE_NAME", "bot_errors"),
             basic_logs_db_column_name=os.getenv("BASIC_LOGS_DB_COLUMN_NAME", "log_entry"),
             errors_logs_db_column_name=os.getenv("ERRORS_LOGS_DB_COLUMN_NAME", "error_entry"),
+            
+            stats_cache_ttl=float(os.getenv("STATS_CACHE_TTL", "30")),
         ),
         openai=OpenAIConfig(
             # Настройки OpenAI API
             api_key=os.getenv("OPENAI_API_KEY"),
             model=os.getenv("OPENAI_MODEL", "gpt-3.5-turbo"),
+            max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "8")),
+            request_timeout=float(os.getenv("OPENAI_REQUEST_TIMEOUT", "20.0")),
+            deadline=float(os.getenv("OPENAI_DEADLINE", "30.0")),
+            cache_max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+            cache_ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+            cache_max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(5 * 1024 * 1024))),
+            streaming=os.getenv("OPENAI_STREAMING", "true").lower() in ("1", "true", "yes"),
+            stream_edit_interval=float(os.getenv("STREAM_EDIT_INTERVAL", "1.0")),
+        ),
+        webhook=WebhookConfig(
+            # Настройки режима webhook (используются при BOT_MODE=webhook)
+            url=os.getenv("WEBHOOK_URL", ""),
+            path=os.getenv("WEBHOOK_PATH", "/webhook"),
+            host=os.getenv("WEBHOOK_HOST", "0.0.0.0"),
+            port=int(os.getenv("WEBHOOK_PORT", "8080")),
+            secret_token=os.getenv("WEBHOOK_SECRET", ""),
+            max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40")),
+            answer_in_response=os.getenv("WEBHOOK_ANSWER_IN_RESPONSE", "true").lower() in ("1", "true", "yes"),
+            answer_timeout=float(os.getenv("WEBHOOK_ANSWER_TIMEOUT", "0.5")),
+            drop_pending_updates=os.getenv("WEBHOOK_DROP_PENDING_UPDATES", "false").lower() in ("1", "true", "yes"),
+        ),
+        supervisor=SupervisorConfig(
+            # Настройки многопроцессного режима (используются при BOT_MODE=supervisor)
+            workers=int(os.getenv("SUPERVISOR_WORKERS", str(os.cpu_count() or 2))),
+            queue_size=int(os.getenv("WORKER_QUEUE_SIZE", "1000")),
+            max_in_flight=int(os.getenv("WORKER_MAX_IN_FLIGHT", "100")),
+            restart_delay=float(os.getenv("WORKER_RESTART_DELAY", "1.0")),
+            restart_max_delay=float(os.getenv("WORKER_RESTART_MAX_DELAY", "60")),
+            max_restarts=int(os.getenv("WORKER_MAX_RESTARTS", "10")),
+            metrics_interval=float(os.getenv("WORKER_METRICS_INTERVAL", "10")),
+            metrics_path=os.getenv(
+                "WORKER_METRICS_PATH",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "workers.json")
+            ),
+        ),
+        throttling=ThrottlingConfig(
+            # Настройки ограничения частоты запросов
+            rate=float(os.getenv("THROTTLE_RATE", "1.0")),
+            burst=float(os.getenv("THROTTLE_BURST", "5")),
+            llm_cost=float(os.getenv("THROTTLE_LLM_COST", "3")),
+            notify=os.getenv("THROTTLE_NOTIFY", "true").lower() in ("1", "true", "yes"),
+            storage=os.getenv("THROTTLE_STORAGE", "memory"),
+            redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            lease_fraction=float(os.getenv("THROTTLE_LEASE_FRACTION", "0.5")),
+            lease_ttl=float(os.getenv("THROTTLE_LEASE_TTL", "1.0")),
+        ),
+        log_writer=LogWriterConfig(
+            # Настройки фоновой записи событий в базу данных
+            queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+            batch_size=int(os.getenv("LOG_BATCH_SIZE", "500")),
+            flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL", "1.0")),
+            overflow_policy=os.getenv("LOG_OVERFLOW_POLICY", "drop_oldest"),
+            block_timeout=float(os.getenv("LOG_BLOCK_TIMEOUT", "0.05")),
+        ),
+        file_log=FileLogConfig(
+            # По умолчанию файлы лога хранятся в каталоге logs рядом с кодом бота
+            directory=os.getenv(
+                "LOG_FILE_DIR",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+            ),
+            max_bytes=int(os.getenv("LOG_FILE_MAX_BYTES", str(50 * 1024 * 1024))),
+            backup_days=int(os.getenv("LOG_FILE_BACKUP_DAYS", "14")),
+            queue_size=int(os.getenv("LOG_FILE_QUEUE_SIZE", "10000")),
+            compress=os.getenv("LOG_FILE_COMPRESS", "true").lower() in ("1", "true", "yes"),
+            analyzer_workers=int(os.getenv("LOG_ANALYZER_WORKERS", "0")),
+        ),
+        active_users=ActiveUsersConfig(
+            # По умолчанию оценки хранятся в каталоге data рядом с кодом бота
+            path=os.getenv(
+                "ACTIVE_USERS_PATH",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "active_users.json")
+            ),
+            precision=int(os.getenv("ACTIVE_USERS_PRECISION", "12")),
+            persist_interval=float(os.getenv("ACTIVE_USERS_PERSIST_INTERVAL", "60")),
+        ),
+        partitions=PartitionConfig(
+            # Настройки секционирования таблиц логов и ошибок
+            interval=os.getenv("LOG_PARTITION_INTERVAL", "month"),
+            premake=int(os.getenv("LOG_PARTITION_PREMAKE", "2")),
+            logs_retention_days=int(os.getenv("LOG_RETENTION_DAYS", "0")),
+            errors_retention_days=int(os.getenv("ERRORS_RETENTION_DAYS", "0")),
+            maintenance_interval=float(os.getenv("LOG_PARTITION_MAINTENANCE_INTERVAL", "3600")),
+        ),
+        token_budget=TokenBudgetConfig(
+            # Квоты токенов OpenAI на пользователя
+            daily_quota=int(os.getenv("LLM_DAILY_TOKEN_QUOTA", "20000")),
+            bucket_seconds=int(os.getenv("LLM_USAGE_BUCKET_SECONDS", "600")),
+            path=os.getenv(
+                "LLM_USAGE_PATH",
+                os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "token_usage.json")
+            ),
+            persist_interval=float(os.getenv("LLM_USAGE_PERSIST_INTERVAL", "60")),
+        ),
+        conversation=ConversationConfig(
+            # Настройки памяти диалогов
+            enabled=os.getenv("CONVERSATION_MEMORY", "true").lower() in ("1", "true", "yes"),
+            max_conversations=int(os.getenv("CONVERSATION_MAX_IN_MEMORY", "10000")),
+            max_turns=int(os.getenv("CONVERSATION_MAX_TURNS", "10")),
+            max_turn_chars=int(os.getenv("CONVERSATION_MAX_TURN_CHARS", "2000")),
+            max_prompt_tokens=int(os.getenv("CONVERSATION_MAX_PROMPT_TOKENS", "1500")),
+            idle_timeout=float(os.getenv("CONVERSATION_IDLE_TIMEOUT", "1800")),
+            retention_days=int(os.getenv("CONVERSATION_RETENTION_DAYS", "7")),
+            table=os.getenv("CONVERSATION_DB_TABLE_NAME", "bot_conversations"),
+        ),
+        metrics=MetricsConfig(
+            # Показатели отдаются только локально - для сборщика на той же машине.
+            # Сервер включается явно: стандартного порта у бота нет, а 9100 и соседние
+            # порты обычно заняты экспортерами Prometheus (node_exporter и др.)
+            host=os.getenv("METRICS_HOST", "127.0.0.1"),
+            port=int(os.getenv("METRICS_PORT", "0")),
+        ),
+        outbound=OutboundConfig(
+            enabled=os.getenv("OUTBOUND_ENABLED", "true").lower() in ("1", "true", "yes"),
+            # Ограничения Telegram: ~30 сообщений в секунду на бота, ~1 в секунду в чат, 20 в минуту в группу
+            global_rate=float(os.getenv("OUTBOUND_GLOBAL_RATE", "30")),
+            chat_rate=float(os.getenv("OUTBOUND_CHAT_RATE", "1")),
+            chat_burst=float(os.getenv("OUTBOUND_CHAT_BURST", "3")),
+            group_per_minute=float(os.getenv("OUTBOUND_GROUP_PER_MINUTE", "20")),
+            group_burst=float(os.getenv("OUTBOUND_GROUP_BURST", "3")),
+            max_retries=int(os.getenv("OUTBOUND_MAX_RETRIES", "3")),
+        ),
+        broadcast=BroadcastConfig(
+            table=os.getenv("BROADCAST_DB_TABLE_NAME", "bot_broadcasts"),
+            blocked_table=os.getenv("BROADCAST_BLOCKED_DB_TABLE_NAME", "bot_blocked_users"),
+            concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "20")),
+            batch_size=int(os.getenv("BROADCAST_BATCH_SIZE", "100")),
+            progress_interval=float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "5")),
+        ),
+        startup=StartupConfig(
+            # Для проверки готовности контейнера (exec-проба: test -f <файл>)
+            ready_file=os.getenv("STARTUP_READY_FILE", ""),
+            profile=os.getenv("STARTUP_PROFILE", "true").lower() in ("1", "true", "yes"),
         )
     )
 
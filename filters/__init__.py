@@ -1,7 +1,7 @@
-# Импорт фильтра IsAdmin из текущего пакета для удобства использования в других модулях
-from .custom_filters import IsAdmin
+# Импорт фильтров из текущего пакета для удобства использования в других модулях
+from .custom_filters import IsAdmin, KeywordTopic, CallbackRoute
 
 
 # __all__ определяет, какие имена будут импортированы при выполнении from package import *
-# В данном случае, при импорте из пакета будет доступен только класс IsAdmin
-__all__ = ["IsAdmin"]
+# В данном случае, при импорте из пакета будут доступны классы IsAdmin, KeywordTopic и CallbackRoute
+__all__ = ["IsAdmin", "KeywordTopic", "CallbackRoute"]
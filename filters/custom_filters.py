@@ -1,8 +1,12 @@
+import time
 import logging
 from config import config
-from aiogram.types import Message
+from services.metrics import filter_duration
+from aiogram.types import CallbackQuery, Message
 from typing import Union, Dict, Any
 from aiogram.filters import BaseFilter
+from utils.keyword_router import KeywordRouter
+from utils.callback_router import CallbackRouter
 
 
 # Получаем объект логгера с именем 'bot_logger'
@@ -17,6 +21,7 @@ class IsAdmin(BaseFilter):
         # Извлекаем ID пользователя из объекта сообщения
         # message.from_user содержит информацию об отправителе сообщения
         user_id = message.from_user.id
+        started = time.perf_counter()
         
         # Выводим подробное логирование для отладки
         # Это полезно для поиска проблем при работе с фильтрами
@@ -29,9 +34,60 @@ class IsAdmin(BaseFilter):
         is_admin = user_id in config.bot.admin_ids
         # Логируем результат проверки для удобства отладки
         logger.info(f"Результат проверки на админа: {is_admin}")
+        filter_duration.observe(time.perf_counter() - started, "IsAdmin")
         
         # Возвращаем результат проверки:
         # True - пользователь является администратором
         # False - пользователь не является администратором
         return is_admin
-    
\ No newline at end of file
+
+
+class KeywordTopic(BaseFilter):
+    """
+    Фильтр, определяющий тему сообщения по ключевым словам
+
+    Вместо цепочек F.text.lower().contains(...) сообщение один раз проходит через
+    скомпилированный KeywordRouter. Найденная тема передается в обработчик
+    как аргумент topic.
+    """
+    
+    def __init__(self, router: KeywordRouter):
+        # Маршрутизатор компилируется один раз при регистрации обработчиков
+        self.router = router
+    
+    async def __call__(self, message: Message) -> Union[bool, Dict[str, Any]]:
+        # Один проход по тексту сообщения - одно решение о маршруте
+        started = time.perf_counter()
+        topic = self.router.route(message.text)
+        filter_duration.observe(time.perf_counter() - started, "KeywordTopic")
+        
+        # Если тема не найдена, сообщение уходит следующим обработчикам
+        if topic is None:
+            return False
+        
+        # Словарь из фильтра aiogram добавляет к аргументам обработчика
+        return {"topic": topic}
+
+
+class CallbackRoute(BaseFilter):
+    """
+    Фильтр, находящий маршрут callback-запроса в таблице CallbackRouter
+
+    Найденный маршрут передается в обработчик (и в middleware логирования)
+    как аргумент route, поэтому данные кнопки разбираются один раз.
+    """
+    
+    def __init__(self, router: CallbackRouter):
+        # Таблица маршрутов собирается один раз при регистрации обработчиков
+        self.router = router
+    
+    async def __call__(self, callback: CallbackQuery) -> Union[bool, Dict[str, Any]]:
+        started = time.perf_counter()
+        route = self.router.resolve(callback.data)
+        filter_duration.observe(time.perf_counter() - started, "CallbackRoute")
+        
+        # Неизвестные кнопки уходят следующему обработчику
+        if route is None:
+            return False
+        
+        return {"route": route}
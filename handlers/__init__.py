@@ -2,6 +2,7 @@ from aiogram import Dispatcher
 from .user import register_user_handlers
 from .admin import register_admin_handlers
 from .common import register_common_handlers
+from .callbacks import register_callback_handlers
 
 
 def register_all_handlers(dp: Dispatcher):
@@ -13,6 +14,7 @@ def register_all_handlers(dp: Dispatcher):
         register_common_handlers,  # Общие обработчики (старт, помощь и т.д.)
         register_admin_handlers,   # Обработчики для администраторов
         register_user_handlers,    # Обработчики для обычных пользователей
+        register_callback_handlers,  # Обработчики нажатий на инлайн-кнопки
     )
     
     # Проходим по всем функциям-регистраторам и вызываем их,
@@ -1,89 +1,201 @@
-import os
 import logging
+from config import config
+from typing import Any, Dict
 from aiogram import Dispatcher, types
-from aiogram.filters import Command  # Фильтр для обработки команд вида /command
+from aiogram.filters import Command, CommandObject  # Фильтр для обработки команд вида /command
 from filters import IsAdmin  # Импорт созданного ранее фильтра для проверки прав администратора
-from services.stats_service import get_user_stats, get_message_stats  # Сервисы для получения статистики
+from services.stats_service import get_stats  # Сервис для получения статистики (с кэшированием)
+from services.log_writer import log_writer  # Фоновая запись событий (для показателей очереди)
+from utils.log_pipeline import log_pipeline  # Запись лога в файл (для показателей очереди)
+from utils.log_analyzer import analyze_async  # Статистика по журналу событий (без БД)
+from services.db import db  # Общий пул соединений с БД
+from services.openai_service import get_llm_stats  # Показатели нагрузки на OpenAI API
+from services.outbound import outbound  # Показатели планировщика исходящих сообщений
+from services.broadcast import broadcaster  # Рассылки всем пользователям
+from services.active_users import active_users  # Оценка активных пользователей (HyperLogLog)
+from services.token_budget import token_budget  # Расход токенов OpenAI по пользователям
+from supervisor import read_worker_stats  # Показатели воркеров многопроцессного режима
 
 
 # Получаем объект логгера с именем 'bot_logger'
 logger = logging.getLogger('bot_logger')
 
 
+def format_usage_stats(user_stats: Dict[str, Any], message_stats: Dict[str, Any], approximate: bool = False) -> str:
+    """
+    Текст статистики по пользователям и сообщениям (из БД или из журнала событий)
+    
+    :param approximate: количество пользователей - оценка (по журналу событий)
+    """
+    mark = "~" if approximate else ""
+    # Формируем текст с общей статистикой по пользователям и сообщениям
+    stats_text = (
+        "📊 <b>Статистика использования бота</b>\n\n"
+        f"👥 <b>Пользователи:</b>\n"
+        f"• Всего уникальных пользователей: {mark}{user_stats['total_users']}\n"
+        f"• Активных сегодня: {mark}{user_stats['active_today']}\n"
+        f"• Активных за неделю: {mark}{user_stats['active_week']}\n\n"
+        f"💬 <b>Сообщения:</b>\n"
+        f"• Всего сообщений: {message_stats['total_messages']}\n"
+        f"• Сообщений сегодня: {message_stats['today_messages']}\n"
+        f"• Сообщений за неделю: {message_stats['week_messages']}\n\n"
+    )
+    
+    # Добавляем топ пользователей, если данные доступны
+    if user_stats['top_users']:
+        stats_text += "<b>🏆 Топ-5 активных пользователей:</b>\n"
+        for i, (username, user_id, count) in enumerate(user_stats['top_users'], 1):
+            # Используем username, если он есть, иначе ID пользователя
+            display_name = username or f"ID: {user_id}"
+            stats_text += f"{i}. {display_name} - {count} сообщений\n"
+    
+    # Добавляем статистику по дням недели
+    days = ["Воскресенье", "Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
+    if message_stats['days_stats']:
+        stats_text += "\n<b>📅 Активность по дням недели:</b>\n"
+        for day_num, count in message_stats['days_stats']:
+            # Преобразуем номер дня недели в название
+            day_name = days[int(day_num)]
+            stats_text += f"• {day_name}: {count} сообщений\n"
+    
+    return stats_text
+
+
+async def get_file_stats_text(db_missing: bool = False) -> str:
+    """
+    Статистика по журналу событий (logs/events*.jsonl), если в БД нет данных
+    
+    Анализ выполняется в отдельных процессах и не блокирует обработку обновлений.
+    
+    :param db_missing: драйвер PostgreSQL не установлен
+    """
+    reason = ("❌ Драйвер PostgreSQL не установлен." if db_missing
+              else "❌ В базе данных нет информации для статистики.\n"
+                   "Если логи уже накоплены, пересчитайте агрегаты: "
+                   "<code>python utils/backfill_stats.py</code>")
+    try:
+        result = await analyze_async(config.file_log.directory, config.file_log.analyzer_workers)
+    except Exception as e:
+        logger.error(f"Ошибка анализа журнала событий: {e}")
+        return f"📊 <b>Статистика использования бота</b>\n\n{reason}\n\n❌ Не удалось прочитать журнал событий: {e}\n"
+    
+    if not result["events"]:
+        return f"📊 <b>Статистика использования бота</b>\n\n{reason}\n\n📁 Журнал событий пуст.\n"
+    
+    stats_text = format_usage_stats(result["users"], result["messages"], approximate=True)
+    stats_text += (
+        f"\n{reason}\n"
+        f"📁 Данные из журнала событий: {result['files']} файлов, "
+        f"{result['bytes'] / 1024 / 1024:.1f} МБ, {result['events']} событий"
+    )
+    if result["dropped"]:
+        stats_text += f" (пропущено при записи: {result['dropped']})"
+    return stats_text + "\n"
+
+
 async def cmd_stats(message: types.Message):
     """Обработчик команды /stats для администраторов"""
     # Отправляем сообщение о начале сбора статистики
     await message.answer("Собираю статистику использования бота...")
     
     try:
-        # Проверяем наличие psycopg2 - драйвера для работы с PostgreSQL
-        try:
-            import psycopg2
-            db_available = True
-        except ImportError:
-            # Если драйвер не установлен, сообщаем об этом и прерываем выполнение
-            db_available = False
-            await message.answer("❌ Драйвер PostgreSQL не установлен. Статистика из БД недоступна.")
-            return
-            
-        # Если драйвер установлен, пробуем получить статистику через сервисные функции
-        user_stats = await get_user_stats()  # Статистика по пользователям
-        message_stats = await get_message_stats()  # Статистика по сообщениям
+        # Без драйвера PostgreSQL или без данных в БД статистика считается по журналу событий
+        stats = await get_stats() if db.driver_available else None
         
         # Проверяем, есть ли данные статистики
-        if user_stats["total_users"] == 0 and message_stats["total_messages"] == 0:
-            # Если статистики нет, показываем информацию о логах как альтернативный источник данных
-            # Определяем путь к директории с логами относительно текущего файла
-            logs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
-            # Получаем список файлов в директории с логами (если она существует)
-            log_files = os.listdir(logs_dir) if os.path.exists(logs_dir) else []
-            
-            # Формируем текст сообщения со статистикой (в данном случае - отсутствие статистики)
-            stats_text = (
-                "📊 <b>Статистика использования бота</b>\n\n"
-                "❌ В базе данных нет информации для статистики.\n\n"
-                f"📁 <b>Файлы логов</b>: {len(log_files)} файлов\n"
-            )
-            
-            # Добавляем список последних 5 файлов логов (если они есть)
-            if log_files:
-                stats_text += "\nПоследние 5 файлов логов:\n"
-                for log_file in sorted(log_files, reverse=True)[:5]:
-                    stats_text += f"• {log_file}\n"
-            
-            # Отправляем сообщение пользователю
-            await message.answer(stats_text)
+        if stats is None or (stats["users"]["total_users"] == 0 and stats["messages"]["total_messages"] == 0):
+            await message.answer(await get_file_stats_text(db_missing=stats is None))
             return
-            
-        # Формируем текст с общей статистикой по пользователям и сообщениям
-        stats_text = (
-            "📊 <b>Статистика использования бота</b>\n\n"
-            f"👥 <b>Пользователи:</b>\n"
-            f"• Всего уникальных пользователей: {user_stats['total_users']}\n"
-            f"• Активных сегодня: {user_stats['active_today']}\n"
-            f"• Активных за неделю: {user_stats['active_week']}\n\n"
-            f"💬 <b>Сообщения:</b>\n"
-            f"• Всего сообщений: {message_stats['total_messages']}\n"
-            f"• Сообщений сегодня: {message_stats['today_messages']}\n"
-            f"• Сообщений за неделю: {message_stats['week_messages']}\n\n"
+        
+        # Части по пользователям и сообщениям собираются параллельно и кэшируются ненадолго
+        stats_text = format_usage_stats(stats["users"], stats["messages"])
+        
+        # Показываем, насколько свежие данные
+        generated_at = stats["generated_at"].strftime("%H:%M:%S")
+        if stats["cached"]:
+            stats_text += f"\n🕒 Данные на {generated_at} (из кэша, {stats['age']:.0f} сек назад)\n"
+        else:
+            stats_text += f"\n🕒 Данные на {generated_at}\n"
+        
+        # Добавляем показатели фоновой записи событий в БД
+        writer_stats = log_writer.get_stats()
+        stats_text += (
+            "\n<b>🗄 Запись событий в БД:</b>\n"
+            f"• В очереди: {writer_stats['queue_size']}\n"
+            f"• Записано: {writer_stats['written']}\n"
+            f"• Отброшено (переполнение): {writer_stats['dropped']}\n"
+            f"• Потеряно (ошибки БД): {writer_stats['failed']}\n"
+            f"• Сброс: посл. {writer_stats['last_flush_ms']:.1f} мс, "
+            f"сред. {writer_stats['avg_flush_ms']:.1f} мс, макс. {writer_stats['max_flush_ms']:.1f} мс\n"
+        )
+        
+        # Добавляем показатели записи лога в файл
+        file_stats = log_pipeline.get_stats()
+        if file_stats["running"]:
+            stats_text += (
+                f"• Лог в файл: в очереди {file_stats['queue_size']}, записано {file_stats['written']}, "
+                f"отброшено {file_stats['dropped']}, ротаций {file_stats['rotations']}\n"
+            )
+        
+        # Добавляем показатели очереди запросов к OpenAI
+        llm_stats = get_llm_stats()
+        stats_text += (
+            "\n<b>🤖 Запросы к OpenAI:</b>\n"
+            f"• В очереди: {llm_stats['waiting']}\n"
+            f"• Выполняется: {llm_stats['in_flight']} из {llm_stats['max_concurrency']}\n"
+            f"• Успешно: {llm_stats['completed']}, таймауты: {llm_stats['timeouts']}, "
+            f"ошибки: {llm_stats['errors']}\n"
+        )
+        cache_stats = llm_stats['cache']
+        stats_text += (
+            f"• Кэш ответов: {cache_stats['entries']} шт. ({cache_stats['bytes'] // 1024} КБ), "
+            f"попаданий {cache_stats['hit_ratio']:.0%}\n"
+            f"• Попадания/промахи/объединено: {cache_stats['hits']}/{cache_stats['misses']}/"
+            f"{cache_stats['coalesced']}\n"
+            f"• Вытеснено (LRU/TTL/память): {cache_stats['evictions_lru']}/"
+            f"{cache_stats['evictions_ttl']}/{cache_stats['evictions_memory']}\n"
+        )
+        token_stats = llm_stats['tokens']
+        stats_text += (
+            f"• Токенов за час/сутки: {token_stats['hour']}/{token_stats['day']}, "
+            f"отказов по квоте: {token_stats['denied']}\n"
+        )
+        memory_stats = llm_stats['conversations']
+        stats_text += (
+            f"• Диалогов в памяти: {memory_stats['conversations']} из {memory_stats['max_conversations']}, "
+            f"выгружено в БД: {memory_stats['evictions']}, загружено: {memory_stats['loads']}\n"
         )
         
-        # Добавляем топ пользователей, если данные доступны
-        if user_stats['top_users']:
-            stats_text += "<b>🏆 Топ-5 активных пользователей:</b>\n"
-            for i, (username, user_id, count) in enumerate(user_stats['top_users'], 1):
-                # Используем username, если он есть, иначе ID пользователя
-                display_name = username or f"ID: {user_id}"
-                stats_text += f"{i}. {display_name} - {count} сообщений\n"
+        # Добавляем показатели планировщика исходящих сообщений
+        if config.outbound.enabled:
+            outbound_stats = outbound.get_stats()
+            wait = outbound_stats['wait']
+            stats_text += (
+                "\n<b>📤 Отправка сообщений:</b>\n"
+                f"• В очереди: {outbound_stats['queued']}, отправлено: {outbound_stats['sent']}\n"
+                f"• Ожидание ответов: сред. {wait['interactive']['avg_ms']:.1f} мс, "
+                f"макс. {wait['interactive']['max_ms']:.1f} мс\n"
+                f"• Ожидание рассылок: сред. {wait['bulk']['avg_ms']:.1f} мс, "
+                f"макс. {wait['bulk']['max_ms']:.1f} мс\n"
+                f"• Ответов 429: {outbound_stats['retries']}, пауз: {outbound_stats['pauses']}, "
+                f"не отправлено: {outbound_stats['failed']}\n"
+            )
         
-        # Добавляем статистику по дням недели
-        days = ["Воскресенье", "Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
-        if message_stats['days_stats']:
-            stats_text += "\n<b>📅 Активность по дням недели:</b>\n"
-            for day_num, count in message_stats['days_stats']:
-                # Преобразуем номер дня недели в название
-                day_name = days[int(day_num)]
-                stats_text += f"• {day_name}: {count} сообщений\n"
+        # В многопроцессном режиме добавляем нагрузку по воркерам
+        worker_stats = read_worker_stats()
+        if worker_stats:
+            stats_text += "\n<b>⚙️ Воркеры:</b>\n"
+            for worker in worker_stats["workers"]:
+                status = "работает" if worker["alive"] else "остановлен"
+                stats_text += (
+                    f"• #{worker['index']} ({status}): очередь {worker['queue']}, "
+                    f"в работе {worker['in_flight']}, обработано {worker['processed']}, "
+                    f"сред. {worker['avg_ms']:.1f} мс, перезапусков {worker['restarts']}"
+                )
+                # Обновления неработающего воркера отбрасываются, чтобы не останавливать остальные чаты
+                if worker.get("dropped"):
+                    stats_text += f", отброшено {worker['dropped']}"
+                stats_text += "\n"
         
         # Отправляем сообщение со статистикой
         await message.answer(stats_text)
@@ -97,6 +209,139 @@ async def cmd_stats(message: types.Message):
         await message.answer(f"❌ {error_msg}\n\nВозможно, база данных не настроена или недоступна.")
 
 
+async def cmd_active_users(message: types.Message, command: CommandObject):
+    """
+    Обработчик команды /active_users для администраторов
+    
+    Показывает оценки активных пользователей из памяти - работает даже при недоступной БД.
+    С аргументом exact (/active_users exact) сравнивает оценки с точными значениями из БД
+    """
+    # В многопроцессном режиме оценки других воркеров перечитываются из их файлов
+    await active_users.refresh_peers()
+    estimates = active_users.get_stats()
+    text = (
+        "👥 <b>Активные пользователи (оценка)</b>\n\n"
+        f"• Сегодня: ~{estimates['today']}\n"
+        f"• За неделю: ~{estimates['week']}\n"
+        f"• За 30 дней: ~{estimates['month']}\n"
+        f"\nСтандартная ошибка оценки: ±{estimates['error']:.1%}\n"
+    )
+    
+    # Точные значения считаются только по явному запросу - это обращение к БД
+    if command.args and command.args.strip().lower() == "exact":
+        try:
+            comparison = await active_users.compare_with_exact()
+            names = {"today": "Сегодня", "week": "За неделю", "month": "За 30 дней"}
+            text += "\n<b>Сравнение с БД (оценка / точно / отклонение):</b>\n"
+            for window, row in comparison.items():
+                text += f"• {names[window]}: {row['estimate']} / {row['exact']} / {row['deviation']:+.1%}\n"
+        except Exception as e:
+            logger.error(f"Ошибка сравнения оценок активных пользователей: {e}")
+            text += f"\n❌ Не удалось получить точные значения из БД: {e}\n"
+    
+    await message.answer(text)
+
+
+async def cmd_usage(message: types.Message, command: CommandObject):
+    """
+    Обработчик команды /usage для администраторов
+    
+    Показывает расход токенов OpenAI: без аргумента - пользователей с наибольшим
+    расходом за сутки, с ID пользователя (/usage 123456) - расход этого пользователя
+    """
+    args = (command.args or "").strip()
+    if args and not args.isdigit():
+        await message.answer("Использование: /usage [ID пользователя]")
+        return
+    # В многопроцессном режиме расход других воркеров перечитывается из их файлов
+    await token_budget.refresh_peers()
+    if args:
+        user_id = int(args)
+        remaining = token_budget.remaining(user_id)
+        await message.answer(
+            f"🧮 <b>Расход токенов пользователя {user_id}</b>\n\n"
+            f"• За час: {token_budget.used(user_id, 'hour')}\n"
+            f"• За сутки: {token_budget.used(user_id, 'day')}\n"
+            f"• Всего: {token_budget.total(user_id)}\n"
+            f"• Остаток квоты: {'без ограничения' if remaining is None else remaining}\n"
+        )
+        return
+    
+    stats = token_budget.get_stats()
+    text = (
+        "🧮 <b>Расход токенов OpenAI</b>\n\n"
+        f"• За час: {stats['hour']}\n"
+        f"• За сутки: {stats['day']}\n"
+        f"• Пользователей за сутки: {stats['users']}\n"
+        f"• Суточная квота: {stats['daily_quota'] or 'без ограничения'}\n"
+        f"• Отказов по квоте: {stats['denied']}\n"
+    )
+    top = token_budget.top_users()
+    if top:
+        text += "\n<b>Больше всего за сутки:</b>\n"
+        for user_id, tokens in top:
+            text += f"• {user_id}: {tokens}\n"
+    
+    await message.answer(text)
+
+
+async def cmd_broadcast(message: types.Message, command: CommandObject):
+    """
+    Обработчик команды /broadcast для администраторов
+    
+    Рассылает всем пользователям текст после команды (/broadcast Текст) или копию сообщения,
+    на которое команда отправлена ответом. Рассылка выполняется в фоне, ее ход
+    показывается в отдельном сообщении, которое обновляется по мере отправки
+    """
+    text = (command.args or "").strip()
+    source = message.reply_to_message
+    if not text and source is None:
+        await message.answer(
+            "Использование: /broadcast Текст рассылки\n"
+            "или ответ командой /broadcast на сообщение, которое нужно разослать"
+        )
+        return
+    
+    progress = await message.answer("📣 Рассылка запускается...")
+    try:
+        broadcast_id = await broadcaster.create(
+            admin_chat_id=message.chat.id,
+            progress_message_id=progress.message_id,
+            text=text if source is None else None,
+            source_chat_id=source.chat.id if source is not None else None,
+            source_message_id=source.message_id if source is not None else None,
+        )
+    except Exception as e:
+        logger.error(f"Ошибка создания рассылки: {e}")
+        await progress.edit_text(f"❌ Не удалось создать рассылку: {e}")
+        return
+    
+    broadcaster.launch(message.bot, broadcast_id)
+    await progress.edit_text(f"📣 Рассылка #{broadcast_id} запущена. Остановить: /broadcast_stop {broadcast_id}")
+
+
+async def cmd_broadcast_stop(message: types.Message, command: CommandObject):
+    """
+    Обработчик команды /broadcast_stop для администраторов
+    
+    Останавливает рассылку с указанным ID (без аргумента - последнюю выполняющуюся)
+    """
+    args = (command.args or "").strip()
+    if args and not args.isdigit():
+        await message.answer("Использование: /broadcast_stop [ID рассылки]")
+        return
+    try:
+        broadcast_id = int(args) if args else await broadcaster.latest_running()
+        if broadcast_id is None or not await broadcaster.cancel(broadcast_id):
+            await message.answer("Нет выполняющейся рассылки с таким ID")
+            return
+    except Exception as e:
+        logger.error(f"Ошибка остановки рассылки: {e}")
+        await message.answer(f"❌ Не удалось остановить рассылку: {e}")
+        return
+    await message.answer(f"⏹ Рассылка #{broadcast_id} остановлена")
+
+
 async def cmd_reset_stats(message: types.Message):
     """Обработчик команды /reset_stats для очистки статистики (только для админов)"""
     # В реальном проекте здесь должна быть дополнительная проверка подтверждения
@@ -108,6 +353,13 @@ def register_admin_handlers(dp: Dispatcher):
     """Регистрация обработчиков администратора"""
     # Регистрируем обработчик команды /stats с фильтрами Command и IsAdmin
     dp.message.register(cmd_stats, Command("stats"), IsAdmin())
+    # Регистрируем обработчик команды /active_users с фильтрами Command и IsAdmin
+    dp.message.register(cmd_active_users, Command("active_users"), IsAdmin())
+    # Регистрируем обработчик команды /usage с фильтрами Command и IsAdmin
+    dp.message.register(cmd_usage, Command("usage"), IsAdmin())
+    # Регистрируем обработчики команд рассылки с фильтрами Command и IsAdmin
+    dp.message.register(cmd_broadcast, Command("broadcast"), IsAdmin())
+    dp.message.register(cmd_broadcast_stop, Command("broadcast_stop"), IsAdmin())
     # Регистрируем обработчик команды /reset_stats с фильтрами Command и IsAdmin
     dp.message.register(cmd_reset_stats, Command("reset_stats"), IsAdmin())
     
\ No newline at end of file
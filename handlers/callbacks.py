@@ -0,0 +1,35 @@
+from aiogram import Dispatcher, types
+from filters import CallbackRoute  # Фильтр, находящий маршрут кнопки в таблице
+from keyboards.menu import TOPIC_PREFIX, TOPICS, Topic  # Описание тем и готовых ответов
+from utils.callback_router import CallbackRouter, Route  # Таблица маршрутов callback-запросов
+
+
+async def handle_topic(callback: types.CallbackQuery, topic: Topic):
+    """Обработчик нажатия на кнопку темы: ответ подготовлен заранее в keyboards/menu.py"""
+    if callback.message is not None:
+        await callback.message.answer(topic.answer)
+    # Убираем индикатор загрузки на кнопке (метод возвращается без await
+    # и может быть отправлен прямо в ответе на webhook)
+    return callback.answer()
+
+
+async def handle_callback(callback: types.CallbackQuery, route: Route):
+    """Передача нажатия обработчику маршрута, найденного фильтром CallbackRoute"""
+    return await route.handler(callback, route.payload)
+
+
+async def handle_unknown_callback(callback: types.CallbackQuery):
+    """Обработчик кнопок, которых нет в таблице маршрутов (например, из старых сообщений)"""
+    return callback.answer("Эта кнопка больше не работает. Напишите /start, чтобы открыть меню.")
+
+
+def register_callback_handlers(dp: Dispatcher):
+    """Регистрация обработчиков нажатий на инлайн-кнопки"""
+    # Таблица маршрутов собирается один раз при запуске: данные каждой кнопки
+    # сразу сопоставлены обработчику и готовому ответу
+    router = CallbackRouter()
+    router.add(TOPIC_PREFIX, handle_topic, TOPICS)
+    dp.callback_query.register(handle_callback, CallbackRoute(router))
+    
+    # Неизвестные кнопки - чтобы у пользователя не зависал индикатор загрузки
+    dp.callback_query.register(handle_unknown_callback)
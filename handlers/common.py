@@ -5,8 +5,10 @@ from aiogram import Dispatcher, F, types  # F используется для с
 
 async def cmd_start(message: types.Message):
     """Обработчик команды /start"""
-    # Отправляем приветственное сообщение при запуске бота
-    await message.answer(
+    # Отправляем приветственное сообщение при запуске бота.
+    # Метод возвращается без await: в режиме webhook он уйдет прямо в ответе на webhook,
+    # а в режиме polling aiogram выполнит его сам
+    return message.answer(
         "Привет! 👋 Добро пожаловать в Startup House! 🚀\n\n"
         "Я бот-помощник, который может ответить на вопросы о стартапах, бизнесе и ИИ.\n\n"
         "Что вас интересует сегодня?",
@@ -16,8 +18,8 @@ async def cmd_start(message: types.Message):
 
 async def cmd_help(message: types.Message):
     """Обработчик команды /help"""
-    # Отправляем справочную информацию о возможностях бота
-    await message.answer(
+    # Отправляем справочную информацию о возможностях бота (метод возвращается без await)
+    return message.answer(
         "Я могу ответить на ваши вопросы о стартапах, бизнесе и ИИ.\n\n"
         "Просто напишите сообщение, содержащее интересующую вас тему!"
     )
@@ -26,6 +28,7 @@ async def cmd_help(message: types.Message):
 def register_common_handlers(dp: Dispatcher):
     """Регистрация общих обработчиков"""
     # Регистрируем обработчик команды /start
-    dp.message.register(cmd_start, Command("start"))
+    # Статические ответы дешевые, поэтому расходуют половину единицы лимита частоты
+    dp.message.register(cmd_start, Command("start"), flags={"throttling_cost": 0.5})
     # Регистрируем обработчик команды /help
-    dp.message.register(cmd_help, Command("help"))
+    dp.message.register(cmd_help, Command("help"), flags={"throttling_cost": 0.5})
@@ -1,76 +1,88 @@
-from aiogram import Dispatcher, F, types
+from aiogram import Dispatcher, types
+from filters import KeywordTopic  # Фильтр тем по ключевым словам
+from utils.keyword_router import KeywordRouter  # Автомат поиска ключевых слов
 from keyboards.inline import get_topics_keyboard # Импортируем клавиатуру
-from services.openai_service import generate_response  # Сервис для генерации ответов с помощью OpenAI
+from config import config
+from utils.streaming import send_streaming_reply  # Вывод ответа по мере генерации
+from services.openai_service import generate_response, stream_response  # Сервис для генерации ответов с помощью OpenAI
 
 
 # Обработчик приветствий
 async def handle_greeting(message: types.Message):
     """Обработчик приветствий"""
-    # Отвечаем на приветствие пользователя
-    await message.answer("Привет! Добро пожаловать в Startup House! 🚀")
+    # Отвечаем на приветствие пользователя (метод возвращается без await и может
+    # быть отправлен прямо в ответе на webhook)
+    return message.answer("Привет! Добро пожаловать в Startup House! 🚀")
 
 
 # Обработчик ключевых слов, связанных с ИИ
 async def handle_ai_keywords(message: types.Message):
     """Обработчик ключевых слов, связанных с ИИ"""
     # Отвечаем на сообщения, содержащие ключевые слова по теме ИИ
-    await message.answer("Интересная тема! Расскажи, как ты используешь ИИ в бизнесе? 💡")
+    return message.answer("Интересная тема! Расскажи, как ты используешь ИИ в бизнесе? 💡")
 
 
 # Обработчик ключевых слов, связанных с бизнесом
 async def handle_business_keywords(message: types.Message):
     """Обработчик ключевых слов, связанных с бизнесом"""
     # Отвечаем на сообщения, содержащие ключевые слова по теме бизнеса
-    await message.answer("Бизнес и стартапы - захватывающая тема! Что конкретно тебя интересует? 💼",
-                         reply_markup=get_topics_keyboard())
+    return message.answer("Бизнес и стартапы - захватывающая тема! Что конкретно тебя интересует? 💼",
+                          reply_markup=get_topics_keyboard())
+
+
+# Ключевые слова по темам
+# Порядок тем задает приоритет: если в сообщении есть слова нескольких тем, побеждает первая.
+# Слово без "*" совпадает только целиком ("hi" не найдется внутри "this"),
+# слово со "*" - с началом слова ("стартап*" найдется в "стартапы" и "стартапах")
+KEYWORD_TOPICS = {
+    # Приветствия
+    "greeting": ["привет*", "здравствуй*", "хай", "hello", "hi"],
+    # Ключевые слова, связанные с ИИ
+    "ai": ["ии", "искусственный интеллект", "искусственного интеллекта", "ai",
+           "нейросет*", "нейронк*", "chatgpt", "gpt"],
+    # Ключевые слова, связанные с бизнесом и предпринимательством
+    "business": ["бизнес*", "стартап*", "предпринимательств*", "startup*", "business*"],
+}
+
+
+# Обработчики тем по ключевым словам
+TOPIC_HANDLERS = {
+    "greeting": handle_greeting,
+    "ai": handle_ai_keywords,
+    "business": handle_business_keywords,
+}
+
+
+async def handle_keyword_topic(message: types.Message, topic: str):
+    """Передача сообщения обработчику темы, найденной фильтром KeywordTopic"""
+    return await TOPIC_HANDLERS[topic](message)
 
 
 # Обработчик для прочих сообщений (будет использовать OpenAI API)
 async def handle_other_messages(message: types.Message):
     """Обработчик для прочих сообщений"""
+    # В потоковом режиме пользователь сразу видит заглушку, которая дополняется по мере генерации
+    if config.openai.streaming:
+        await send_streaming_reply(message, stream_response(message.text, message.from_user.id),
+                                   edit_interval=config.openai.stream_edit_interval)
+        return
+    
     # Генерируем ответ с помощью OpenAI API для всех остальных сообщений
-    response = await generate_response(message.text)
+    # ID пользователя нужен для приоритета в очереди запросов и учета его квоты токенов
+    response = await generate_response(message.text, message.from_user.id)
     # Отправляем сгенерированный ответ пользователю
     await message.answer(response)
 
 
 def register_user_handlers(dp: Dispatcher):
     """Регистрация обработчиков пользователя"""
-    # Приветствия - используем F.text.contains вместо Text для проверки наличия ключевых слов
-    # | - оператор логического "ИЛИ" для объединения фильтров
-    dp.message.register(
-        handle_greeting, 
-        F.text.lower().contains("привет") | 
-        F.text.lower().contains("здравствуй") | 
-        F.text.lower().contains("хай") | 
-        F.text.lower().contains("hello") | 
-        F.text.lower().contains("hi")
-    )
-    
-    # Ключевые слова, связанные с ИИ - регистрируем обработчик для сообщений, 
-    # содержащих слова из области искусственного интеллекта
-    dp.message.register(
-        handle_ai_keywords,
-        F.text.lower().contains("ии") | 
-        F.text.lower().contains("искусственный интеллект") | 
-        F.text.lower().contains("ai") | 
-        F.text.lower().contains("нейросеть") | 
-        F.text.lower().contains("нейронка") | 
-        F.text.lower().contains("chatgpt") | 
-        F.text.lower().contains("gpt")
-    )
-    
-    # Ключевые слова, связанные с бизнесом - регистрируем обработчик для сообщений,
-    # содержащих слова из области бизнеса и предпринимательства
-    dp.message.register(
-        handle_business_keywords,
-        F.text.lower().contains("бизнес") | 
-        F.text.lower().contains("стартап") | 
-        F.text.lower().contains("предпринимательство") | 
-        F.text.lower().contains("startup") | 
-        F.text.lower().contains("business")
-    )
+    # Таблица ключевых слов компилируется один раз при запуске в единый автомат.
+    # Один фильтр на сообщение определяет тему за один проход по тексту,
+    # а обработчик темы выбирается по словарю
+    router = KeywordRouter(KEYWORD_TOPICS)
+    dp.message.register(handle_keyword_topic, KeywordTopic(router))
     
     # Прочие сообщения - этот обработчик сработает для всех остальных сообщений,
     # не попавших под предыдущие фильтры
-    dp.message.register(handle_other_messages)
+    # Ответ OpenAI - самый дорогой запрос, поэтому расходует больше лимита частоты
+    dp.message.register(handle_other_messages, flags={"throttling_cost": config.throttling.llm_cost})
@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Topic:
+    """Тема инлайн-меню: текст кнопки и заранее подготовленный ответ на ее нажатие"""
+    title: str                   # Текст кнопки
+    answer: str                  # Ответ пользователю
+
+
+# Главное меню (reply-клавиатура): ряды кнопок, текст кнопки приходит боту как обычное сообщение
+MAIN_MENU = (
+    ("🚀 О стартапах", "💡 Об ИИ"),
+    ("💼 О бизнесе", "❓ Помощь"),
+)
+# Подсказка в поле ввода сообщения
+MAIN_MENU_PLACEHOLDER = "Выберите тему или задайте вопрос..."
+
+
+# Префикс данных callback для кнопок тем: "topic:<ключ темы>"
+TOPIC_PREFIX = "topic"
+
+# Темы для обсуждения (ключ попадает в данные callback)
+TOPICS = {
+    "business_plan": Topic(
+        "Бизнес-план",
+        "📄 <b>Бизнес-план</b>\n\n"
+        "Хороший бизнес-план отвечает на несколько вопросов: какую проблему вы решаете, "
+        "кто ваш клиент, сколько он готов платить, как вы до него дотянетесь и когда проект выйдет "
+        "на окупаемость. Начните с одностраничного описания и финансовой модели на 12-18 месяцев.\n\n"
+        "Напишите, на каком этапе ваш проект, и я помогу с конкретным разделом.",
+    ),
+    "investments": Topic(
+        "Привлечение инвестиций",
+        "💰 <b>Привлечение инвестиций</b>\n\n"
+        "Инвесторы смотрят на команду, размер рынка и подтвержденный спрос. До раунда подготовьте "
+        "питч-дек на 10-12 слайдов, ключевые метрики и понимание, сколько денег нужно и на что.\n\n"
+        "Расскажите о своем проекте, и я подскажу, к каким инвесторам стоит идти.",
+    ),
+    "marketing": Topic(
+        "Маркетинг",
+        "📣 <b>Маркетинг</b>\n\n"
+        "Начните с одного канала, где точно есть ваши клиенты, и измеряйте стоимость привлечения "
+        "и удержание. Масштабируйте канал, только когда клиент окупается.\n\n"
+        "Напишите, кто ваша аудитория, и я предложу, с каких каналов начать.",
+    ),
+    "team": Topic(
+        "Команда",
+        "👥 <b>Команда</b>\n\n"
+        "На раннем этапе важнее всего сооснователи с дополняющими навыками и договоренности о долях "
+        "и ролях на бумаге. Первых сотрудников нанимайте под конкретные задачи, а не на вырост.\n\n"
+        "Опишите, кого вам не хватает, и я помогу составить профиль кандидата.",
+    ),
+    "ai_business": Topic(
+        "ИИ в бизнесе",
+        "🤖 <b>ИИ в бизнесе</b>\n\n"
+        "Быстрее всего ИИ окупается там, где много однотипной работы с текстом: поддержка клиентов, "
+        "обработка заявок, подготовка документов и аналитика. Начните с одного процесса и измерьте эффект.\n\n"
+        "Расскажите о своем бизнесе, и я подскажу, что можно автоматизировать.",
+    ),
+}
+
+# Расположение кнопок тем по рядам
+TOPICS_LAYOUT = (
+    ("business_plan", "investments"),
+    ("marketing", "team"),
+    ("ai_business",),
+)
@@ -0,0 +1,51 @@
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+from keyboards.menu import MAIN_MENU, MAIN_MENU_PLACEHOLDER, TOPIC_PREFIX, TOPICS, TOPICS_LAYOUT
+
+
+# Клавиатуры - обычные типы aiogram с рядами-списками: сессия aiogram при отправке обходит
+# только списки и словари, а кортежи кнопок (и собственные подклассы) ушли бы в Telegram
+# со всеми пустыми полями (null). Одна и та же клавиатура прикрепляется ко всем сообщениям,
+# поэтому обработчики ее не изменяют, а собирают свою (типы клавиатур aiogram изменяемые)
+
+
+def topic_callback_data(key: str) -> str:
+    """Данные callback кнопки темы"""
+    return f"{TOPIC_PREFIX}:{key}"
+
+
+class KeyboardRegistry:
+    """
+    Все клавиатуры бота, собранные по описанию из keyboards/menu.py
+
+    Клавиатуры собираются один раз при запуске (импорте модуля), а обработчики получают
+    готовые объекты вместо создания pydantic-моделей на каждый ответ.
+    """
+
+    def __init__(self):
+        # Основная клавиатура, которая появляется вместо клавиатуры устройства
+        self.main = ReplyKeyboardMarkup(
+            keyboard=[
+                # При нажатии на кнопку, её текст отправляется как обычное сообщение
+                [KeyboardButton(text=text) for text in row]
+                for row in MAIN_MENU
+            ],
+            # resize_keyboard=True делает кнопки меньше и компактнее
+            resize_keyboard=True,
+            # input_field_placeholder задает текст-подсказку в поле ввода сообщения
+            input_field_placeholder=MAIN_MENU_PLACEHOLDER,
+        )
+
+        # Инлайн-клавиатура с темами для обсуждения
+        self.topics = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(text=TOPICS[key].title, callback_data=topic_callback_data(key))
+                    for key in row
+                ]
+                for row in TOPICS_LAYOUT
+            ]
+        )
+
+
+# Клавиатуры собираются один раз на процесс
+keyboards = KeyboardRegistry()
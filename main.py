@@ -1,8 +1,31 @@
+# Замер запуска начинается до остальных импортов: время каждой группы импортов
+# и каждого хука запуска выводится в лог, когда бот готов принимать обновления
+from utils.startup import startup_profiler
+
 import asyncio
 import logging
-from bot import bot, dp
-from middlewares import setup_middlewares
-from handlers import register_all_handlers
+
+with startup_profiler.phase("импорт: aiogram, конфигурация, бот"):
+    from aiogram import Dispatcher
+    from bot import bot, dp
+    from config import config
+
+with startup_profiler.phase("импорт: сервисы"):
+    from services.db import db
+    from services.log_writer import log_writer
+    from services.partitions import partition_manager
+    from services.active_users import active_users
+    from services.token_budget import token_budget
+    from services.conversation import conversations
+    from services.broadcast import broadcaster
+    from services.metrics import metrics_server
+    from services.openai_service import warm_up as openai_warm_up
+    from utils.log_pipeline import event_log, log_pipeline
+
+with startup_profiler.phase("импорт: middleware и обработчики"):
+    from webhook import run_webhook
+    from middlewares import setup_middlewares
+    from handlers import register_all_handlers
 
 
 # Настройка логирования
@@ -13,9 +36,14 @@ logging.basicConfig(
 )
 
 
-async def main():
+def setup_dispatcher(dp: Dispatcher, maintenance: bool = True):
     """
-    Основная асинхронная функция, инициализирующая и запускающая бота
+    Регистрация middleware, обработчиков и хуков запуска/остановки
+
+    Используется во всех режимах работы, в том числе в каждом процессе-воркере супервизора
+
+    :param maintenance: запускать обслуживание секций таблиц логов (в многопроцессном
+        режиме - только в одном воркере)
     """
     # Установка middleware
     # Middleware обрабатывают сообщения до и после обработчиков
@@ -24,8 +52,80 @@ async def main():
     # Регистрация всех обработчиков сообщений и команд
     register_all_handlers(dp)
     
-    # Запуск бота в режиме long polling (постоянный опрос серверов Telegram)
-    await dp.start_polling(bot)
+    # Общий пул соединений с БД создается в фоне после запуска (или при первом запросе)
+    # и закрывается при остановке. Фоновая запись событий и выгрузка диалогов останавливаются
+    # до закрытия пула, чтобы успеть дописать оставшиеся в очереди события и диалоги
+    dp.startup.register(db.start)
+    dp.startup.register(log_writer.start)
+    dp.startup.register(conversations.start)
+    dp.shutdown.register(log_writer.stop)
+    dp.shutdown.register(conversations.stop)
+    dp.shutdown.register(db.stop)
+    
+    # Незавершенные рассылки продолжаются от контрольной точки после запуска пула,
+    # а при остановке прерываются до его закрытия
+    dp.startup.register(broadcaster.start)
+    dp.shutdown.register(broadcaster.stop)
+    
+    # Секции таблиц логов создаются заранее, а устаревшие удаляются по сроку хранения
+    if maintenance:
+        dp.startup.register(partition_manager.start)
+        dp.shutdown.register(partition_manager.stop)
+    
+    # Оценки активных пользователей загружаются из файла при запуске
+    # и сохраняются при остановке, чтобы пережить перезапуск бота
+    dp.startup.register(active_users.start)
+    dp.shutdown.register(active_users.stop)
+    
+    # Расход токенов OpenAI тоже сохраняется в файл, чтобы квоты пережили перезапуск
+    dp.startup.register(token_budget.start)
+    dp.shutdown.register(token_budget.stop)
+    
+    # Потоки записи лога и журнала событий в файлы запускаются вместе с middleware логирования,
+    # а при остановке дописывает оставшиеся в очереди записи
+    dp.shutdown.register(log_pipeline.stop)
+    dp.shutdown.register(event_log.stop)
+    
+    # Локальный сервер показателей для Prometheus (METRICS_PORT=0 - отключен)
+    dp.startup.register(metrics_server.start)
+    dp.shutdown.register(metrics_server.stop)
+    
+    # Клиент OpenAI создается в фоне после запуска, а не при импорте
+    dp.startup.register(openai_warm_up)
+    
+    # Время каждого хука запуска попадает в разбивку времени запуска
+    startup_profiler.instrument(dp.startup)
+    dp.shutdown.register(startup_profiler.clear_ready)
+
+
+async def mark_ready():
+    """Сигнал готовности: разбивка времени запуска в лог и файл готовности (STARTUP_READY_FILE)"""
+    startup_profiler.mark_ready(config.startup.ready_file, verbose=config.startup.profile)
+
+
+async def main():
+    """
+    Основная асинхронная функция, инициализирующая и запускающая бота
+    """
+    if config.bot.mode == "supervisor":
+        # Супервизор только получает обновления и распределяет их по процессам-воркерам,
+        # обработчики регистрируются в каждом воркере
+        from supervisor import run_supervisor
+        await run_supervisor(bot)
+        return
+    
+    with startup_profiler.phase("настройка диспетчера"):
+        setup_dispatcher(dp)
+    
+    if config.bot.mode == "webhook":
+        # Запуск встроенного HTTP-сервера: обновления присылает сам Telegram,
+        # поэтому несколько реплик бота могут работать за балансировщиком
+        await run_webhook(bot, dp)
+    else:
+        # Последний хук запуска - сигнал готовности: сразу после него начинается опрос
+        dp.startup.register(mark_ready)
+        # Запуск бота в режиме long polling (постоянный опрос серверов Telegram)
+        await dp.start_polling(bot)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,35 @@
+from config import config
 from aiogram import Dispatcher
 from .throttling import ThrottlingMiddleware
-from .logger import MessageLoggerMiddleware, CallbackLoggerMiddleware
+from .metrics import HandlerMetricsMiddleware, TimedMiddleware, UpdateMetricsMiddleware
+from services.throttle_storage import create_throttle_storage
+from .logger import MessageLoggerMiddleware, CallbackLoggerMiddleware, setup_file_logging
 
 
 def setup_middlewares(dp: Dispatcher):
     """Настройка middleware"""
+    # Показатели для /metrics: количество и полное время обработки обновлений.
+    # Остальные middleware обернуты в TimedMiddleware, чтобы видеть их собственное время
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    
     # Ограничение частоты запросов - защита от спама
-    # limit=1.0 означает, что обрабатывается не более одного сообщения в секунду от каждого пользователя
-    dp.message.middleware(ThrottlingMiddleware(limit=1.0))
+    # rate - сколько единиц стоимости в секунду восстанавливается у пользователя,
+    # burst - сколько можно потратить подряд (несколько быстрых сообщений не теряются).
+    # Дорогие обработчики задают большую стоимость флагом throttling_cost
+    # Состояние хранится в памяти процесса или в Redis (THROTTLE_STORAGE=redis),
+    # если бот запущен в нескольких процессах или репликах
+    storage = create_throttle_storage()
+    dp.message.middleware(TimedMiddleware(ThrottlingMiddleware(notify=config.throttling.notify, storage=storage)))
+    dp.shutdown.register(storage.close)
     
     # Логирование сообщений и callback-запросов
+    # Запись лога в файл настраивается один раз для всех middleware логирования
+    setup_file_logging()
     # Добавляем middleware для всех входящих текстовых сообщений
-    dp.message.middleware(MessageLoggerMiddleware())
+    dp.message.middleware(TimedMiddleware(MessageLoggerMiddleware()))
     # Добавляем middleware для всех входящих callback запросов (нажатий на инлайн-кнопки)
-    dp.callback_query.middleware(CallbackLoggerMiddleware())
-    
\ No newline at end of file
+    dp.callback_query.middleware(TimedMiddleware(CallbackLoggerMiddleware()))
+    
+    # Время и ошибки обработчиков - последним middleware, непосредственно вокруг обработчика
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
@@ -1,129 +1,64 @@
-import os
 import json
+import time
 import logging
-import datetime
-from config import config
+from services.log_writer import log_writer
+from utils.log_pipeline import event_log, log_pipeline
+from services.active_users import active_users
 from aiogram import BaseMiddleware
 from aiogram.types import Message, CallbackQuery
 from typing import Any, Awaitable, Callable, Dict
 
 
+def setup_file_logging():
+    """
+    Настройка логирования в файл
+
+    Вызывается один раз при настройке middleware (setup_middlewares), а не в каждом
+    экземпляре middleware логирования
+    """
+    # Настраиваем логгер
+    logger = logging.getLogger('bot_logger')
+    # Устанавливаем уровень логирования INFO и выше (INFO, WARNING, ERROR, CRITICAL)
+    logger.setLevel(logging.INFO)
+    
+    # Записи только ставятся в очередь, а в файл (с ротацией по дням и размеру)
+    # их пишет отдельный поток - диск не задерживает обработку обновлений.
+    # Повторный вызов ничего не делает, поэтому логи не дублируются
+    log_pipeline.start(logger)
+    
+    # Журнал событий пишется только в свой файл, без вывода в консоль
+    event_logger = logging.getLogger('bot_events')
+    event_logger.setLevel(logging.INFO)
+    event_logger.propagate = False
+    event_log.start(event_logger)
+
+
 class LoggerMiddleware(BaseMiddleware):
     """Middleware для логирования всех сообщений в БД и файл"""
     
     def __init__(self):
         """Инициализация middleware логирования"""
-        # Настраиваем логирование в файл
-        self.setup_file_logging()
         # Получаем экземпляр логгера
         self.logger = logging.getLogger('bot_logger')
-        
-        # Проверяем возможность подключения к БД
-        self.db_available = False
-        try:
-            # Пытаемся импортировать драйвер PostgreSQL
-            import psycopg2
-            # Пробуем импортировать, но не подключаемся сразу
-            self.db_available = True
-            # Сохраняем ссылку на модуль для дальнейшего использования
-            self.psycopg2 = psycopg2
-        except ImportError:
-            # Если импорт не удался, выводим предупреждение
-            self.logger.warning("psycopg2 не установлен. Логирование в БД отключено.")
-    
-    def setup_file_logging(self):
-        """Настройка логирования в файл"""
-        # Создаем директорию для логов, если не существует
-        # Путь относительно текущего файла middleware
-        logs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'logs')
-        os.makedirs(logs_dir, exist_ok=True)
-        
-        # Формируем имя файла с датой для разделения логов по дням
-        current_date = datetime.datetime.now().strftime('%Y-%m-%d')
-        log_file = os.path.join(logs_dir, f'bot_log_{current_date}.log')
-        
-        # Настраиваем обработчик файла
-        file_handler = logging.FileHandler(log_file)
-        # Задаем формат записей лога с временной меткой, уровнем и сообщением
-        file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(file_formatter)
-        
-        # Настраиваем логгер
-        logger = logging.getLogger('bot_logger')
-        # Устанавливаем уровень логирования INFO и выше (INFO, WARNING, ERROR, CRITICAL)
-        logger.setLevel(logging.INFO)
-        
-        # Избегаем дублирования логов (важно при перезапуске бота)
-        if not logger.handlers:
-            logger.addHandler(file_handler)
+        # Логгер журнала событий (строки JSON для utils/log_analyzer.py)
+        self.event_logger = logging.getLogger('bot_events')
     
-    def get_db_connection(self):
-        """Получение соединения с базой данных"""
-        # Проверяем, доступен ли драйвер БД
-        if not self.db_available:
-            return None
-            
-        try:
-            # Пытаемся установить соединение с базой данных
-            # Все параметры подключения берутся из конфигурации
-            conn = self.psycopg2.connect(
-                host=config.bot.db_host,
-                port=config.bot.db_port,
-                database=config.bot.db_name,
-                user=config.bot.db_user,
-                password=config.bot.db_password
-            )
-            return conn
-        except Exception as e:
-            # Логируем ошибку подключения
-            self.logger.error(f"Ошибка подключения к БД: {e}")
-            return None
+    def log_to_event_file(self, event_type: str, user_id: int, username: str, chat_id: int):
+        """Запись события в журнал событий (без текста - только то, что нужно для статистики)"""
+        self.event_logger.info(json.dumps({
+            "t": int(time.time()),   # Время события (Unix time)
+            "e": event_type,         # Тип события
+            "u": user_id,            # ID пользователя
+            "n": username,           # Имя пользователя
+            "c": chat_id,            # ID чата
+        }, ensure_ascii=False, separators=(",", ":")))
     
-    def log_to_database(self, event_type: str, user_id: int, username: str, 
-                        chat_id: int, text: str, data: Dict[str, Any]):
+    async def log_to_database(self, event_type: str, user_id: int, username: str, 
+                              chat_id: int, text: str, data: Dict[str, Any]):
         """Логирование в базу данных"""
-        # Проверяем, доступен ли драйвер БД
-        if not self.db_available:
-            return
-            
-        # Получаем соединение с БД
-        conn = self.get_db_connection()
-        if not conn:
-            return
-        
-        try:
-            # Создаем курсор для выполнения SQL-запросов
-            with conn.cursor() as cursor:
-                # Создаем таблицу, если не существует
-                # Используем имя таблицы из конфигурации
-                cursor.execute(f"""
-                    CREATE TABLE IF NOT EXISTS {config.bot.basic_logs_db_table_name} (
-                        id SERIAL PRIMARY KEY,                    -- Уникальный идентификатор записи
-                        timestamp TIMESTAMP NOT NULL DEFAULT NOW(), -- Время события
-                        event_type VARCHAR(50) NOT NULL,          -- Тип события (message/callback)
-                        user_id BIGINT NOT NULL,                  -- ID пользователя
-                        username VARCHAR(255),                    -- Имя пользователя (может быть NULL)
-                        chat_id BIGINT NOT NULL,                  -- ID чата
-                        text TEXT,                                -- Текст сообщения/callback
-                        data JSONB                                -- Дополнительные данные в JSON
-                    )
-                """)
-                
-                # Вставляем запись о событии в таблицу
-                cursor.execute(f"""
-                    INSERT INTO {config.bot.basic_logs_db_table_name} 
-                    (event_type, user_id, username, chat_id, text, data)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                """, (event_type, user_id, username, chat_id, text, json.dumps(data)))
-                
-                # Фиксируем транзакцию
-                conn.commit()
-        except Exception as e:
-            # Логируем ошибку записи в БД
-            self.logger.error(f"Ошибка записи в БД: {e}")
-        finally:
-            # Закрываем соединение в любом случае
-            conn.close()
+        # Событие только ставится в очередь фонового writer'а,
+        # сама запись в БД происходит пачками вне обработки обновления
+        await log_writer.put(event_type, user_id, username, chat_id, text, data)
 
 
 class MessageLoggerMiddleware(LoggerMiddleware):
@@ -145,11 +80,15 @@ class MessageLoggerMiddleware(LoggerMiddleware):
             text = event.text or "[НЕТ ТЕКСТА]"  # Текст сообщения или заглушка
             event_data = {"message_id": event.message_id}  # Дополнительные данные
             
+            # Учитываем пользователя в оценке активных пользователей (без обращения к БД)
+            active_users.add(user_id)
+            
             # Логируем в файл
             self.logger.info(f"Сообщение от {username or user_id} (ID: {user_id}): {text}")
+            self.log_to_event_file("message", user_id, username, chat_id)
             
             # Логируем в базу данных (если доступно)
-            self.log_to_database(
+            await self.log_to_database(
                 event_type="message",  # Тип события
                 user_id=user_id,
                 username=username,
@@ -184,13 +123,20 @@ class CallbackLoggerMiddleware(LoggerMiddleware):
             # Chat ID может быть недоступен, если запрос пришел из inline режима
             chat_id = event.message.chat.id if event.message else 0
             text = event.data  # Данные callback (обычно строка)
-            event_data = {"query_id": event.id}  # Дополнительные данные
+            # Маршрут уже найден фильтром CallbackRoute (None - неизвестная кнопка)
+            route = data.get("route")
+            route_name = route.name if route is not None else None
+            event_data = {"query_id": event.id, "route": route_name}  # Дополнительные данные
+            
+            # Учитываем пользователя в оценке активных пользователей (без обращения к БД)
+            active_users.add(user_id)
             
             # Логируем в файл
-            self.logger.info(f"Callback от {username or user_id} (ID: {user_id}): {text}")
+            self.logger.info(f"Callback от {username or user_id} (ID: {user_id}): {text} -> {route_name or 'нет маршрута'}")
+            self.log_to_event_file("callback_query", user_id, username, chat_id)
             
             # Логируем в базу данных (если доступно)
-            self.log_to_database(
+            await self.log_to_database(
                 event_type="callback_query",  # Тип события
                 user_id=user_id,
                 username=username,
@@ -0,0 +1,98 @@
+import time
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from aiogram.dispatcher.event.bases import UNHANDLED
+from typing import Any, Awaitable, Callable, Dict, Optional
+from services.metrics import handler_duration, handler_errors, middleware_duration, update_duration, updates_total
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Внешний middleware обновлений: количество обновлений и полное время их обработки
+
+    Регистрируется на dp.update, поэтому учитывает и обновления, для которых
+    не нашлось обработчика (status="unhandled").
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        event_type = event.event_type
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await handler(event, data)
+            status = "unhandled" if result is UNHANDLED else "handled"
+            return result
+        finally:
+            update_duration.observe(time.perf_counter() - started, event_type)
+            updates_total.inc(event_type, status)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Время работы и ошибки обработчиков
+
+    Регистрируется последним внутренним middleware: aiogram уже выбрал обработчик
+    (фильтры пройдены), обработчик определяется по имени функции, а время остальных
+    middleware в замер не входит (оно учитывается отдельно, см. TimedMiddleware).
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(name)
+            raise
+        finally:
+            handler_duration.observe(time.perf_counter() - started, name)
+
+
+class TimedMiddleware(BaseMiddleware):
+    """
+    Обертка middleware, измеряющая его собственное время
+
+    Время следующих шагов цепочки (других middleware и обработчика) вычитается,
+    поэтому гистограмма показывает, сколько добавляет к обработке именно этот middleware.
+    """
+
+    def __init__(self, middleware: BaseMiddleware, name: Optional[str] = None):
+        """
+        :param middleware: оборачиваемый middleware
+        :param name: название для метки (по умолчанию - имя класса)
+        """
+        self.middleware = middleware
+        self.name = name or type(middleware).__name__
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        # Время следующих шагов цепочки (список - чтобы изменять из вложенной функции)
+        downstream = [0.0]
+
+        async def timed_handler(inner_event: TelegramObject, inner_data: Dict[str, Any]) -> Any:
+            inner_started = time.perf_counter()
+            try:
+                return await handler(inner_event, inner_data)
+            finally:
+                downstream[0] += time.perf_counter() - inner_started
+
+        started = time.perf_counter()
+        try:
+            return await self.middleware(timed_handler, event, data)
+        finally:
+            middleware_duration.observe(time.perf_counter() - started - downstream[0], self.name)
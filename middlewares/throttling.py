@@ -1,26 +1,38 @@
-import time
+import math
 from cachetools import TTLCache
 from aiogram.types import Message
 from aiogram import BaseMiddleware
-from typing import Any, Awaitable, Callable, Dict
+from aiogram.dispatcher.flags import get_flag
+from typing import Any, Awaitable, Callable, Dict, Optional
+from services.throttle_storage import MemoryThrottleStorage, ThrottleStorage
 
 
 class ThrottlingMiddleware(BaseMiddleware):
     """Middleware для ограничения частоты запросов (анти-спам)"""
     
-    def __init__(self, limit: float = 0.5):
+    def __init__(self, rate: float = 1.0, burst: float = 3.0, notify: bool = True,
+                 storage: Optional[ThrottleStorage] = None):
         """
-        Инициализирует middleware с указанным лимитом времени между сообщениями
+        Инициализирует middleware с ограничением по алгоритму GCRA (аналог token bucket)
         
-        :param limit: минимальный интервал между сообщениями от одного пользователя (в секундах)
+        Каждый обработчик может задать стоимость флагом throttling_cost
+        (например, flags={"throttling_cost": 3} для запросов к OpenAI), по умолчанию - 1.
+        
+        :param rate: устойчивая скорость - единиц стоимости в секунду на пользователя
+        :param burst: сколько единиц можно потратить подряд после паузы
+        :param notify: сообщать пользователю об ограничении
+        :param storage: хранилище состояния (по умолчанию - в памяти процесса с rate и burst)
         """
-        # Сохраняем лимит времени между сообщениями
-        self.limit = limit
-        # Кэш для хранения времени последнего сообщения от пользователя
-        # TTLCache из библиотеки cachetools автоматически удаляет старые записи
-        # maxsize - максимальное количество пользователей в кэше
-        # ttl - время жизни записи в секундах (автоматическое удаление)
-        self.cache = TTLCache(maxsize=10000, ttl=60)
+        # Состояние пользователя - одно число (время, когда запас восстановится полностью).
+        # Пользователи с полным запасом не хранятся, поэтому размер не ограничен
+        # искусственно и вытеснение записей не отключает ограничение.
+        # Для нескольких процессов бота состояние хранится в общем хранилище (Redis)
+        self.storage = storage or MemoryThrottleStorage(rate=rate, burst=burst)
+        self.notify = notify
+        # Уведомление отправляется один раз за период ограничения, чтобы ответы
+        # на спам сами не превращались в спам. Вытеснение записи здесь безопасно -
+        # в худшем случае пользователь получит уведомление повторно
+        self.notified = TTLCache(maxsize=100000, ttl=60)
     
     async def __call__(
         self,
@@ -35,18 +47,22 @@ class ThrottlingMiddleware(BaseMiddleware):
         # Получаем ID пользователя из сообщения
         user_id = event.from_user.id
         
-        # Получаем текущее время (Unix timestamp)
-        current_time = time.time()
+        # Стоимость задается флагом обработчика, который aiogram уже выбрал для сообщения
+        cost = get_flag(data, "throttling_cost", default=1)
+        allowed, retry_after = await self.storage.hit(user_id, cost)
         
         # Если пользователь отправляет сообщения слишком часто
-        if user_id in self.cache and current_time - self.cache[user_id] < self.limit:
+        if not allowed:
+            if self.notify and user_id not in self.notified:
+                self.notified[user_id] = True
+                await event.answer(
+                    f"⏳ Слишком много сообщений. Попробуйте через {math.ceil(retry_after)} сек."
+                )
             # Пропускаем обработку сообщения (возвращаем None)
-            # Пользователь не получит уведомления о блокировке,
-            # сообщение просто не будет обработано
             return None
         
-        # Обновляем время последнего сообщения от пользователя
-        self.cache[user_id] = current_time
+        # После разрешенного сообщения следующее ограничение снова сопровождается уведомлением
+        self.notified.pop(user_id, None)
         
         # Продолжаем обработку сообщения
         # Передаем управление следующему middleware или обработчику
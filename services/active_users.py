@@ -0,0 +1,250 @@
+import os
+import json
+import base64
+import asyncio
+import logging
+import datetime
+from config import config
+from services.db import db
+from typing import Any, Dict, List, Optional
+from services.rollups import rollup_table
+from utils.hyperloglog import HyperLogLog
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Окна оценки активных пользователей: название -> количество дней назад от сегодняшнего.
+# Окно "week" совпадает с /stats (день >= сегодня - 7)
+WINDOWS = {
+    "today": 0,
+    "week": 7,
+    "month": 30,
+}
+
+
+class ActiveUsersTracker:
+    """
+    Оценка количества активных пользователей без обращения к БД
+
+    Middleware логирования добавляют ID пользователя в оценку HyperLogLog текущего дня.
+    Оценки за неделю и месяц получаются объединением дневных. Оценки периодически
+    сохраняются в файл и загружаются при запуске, поэтому переживают перезапуск бота.
+
+    В многопроцессном режиме у каждого воркера свой файл, а дневные оценки остальных воркеров
+    периодически читаются из их файлов (peer_paths) и объединяются с собственными:
+    объединение HyperLogLog - оценка по всем пользователям сразу, без двойного счета.
+    """
+
+    def __init__(self, path: str, precision: int = 12, persist_interval: float = 60.0,
+                 retention_days: int = 35):
+        """
+        :param path: путь к файлу для сохранения оценок
+        :param precision: точность HyperLogLog (2^precision байт на день)
+        :param persist_interval: интервал сохранения в файл (в секундах)
+        :param retention_days: сколько дней хранить дневные оценки
+        """
+        self.path = path
+        self.precision = precision
+        self.persist_interval = persist_interval
+        self.retention_days = retention_days
+
+        self.days: Dict[datetime.date, HyperLogLog] = {}
+        self.dirty = False           # Есть изменения, не сохраненные в файл
+        self.task: Optional[asyncio.Task] = None
+
+        # Дневные оценки других процессов бота (воркеров супервизора), прочитанные из их файлов
+        self.peer_paths: List[str] = []
+        self.peer_days: Dict[datetime.date, HyperLogLog] = {}
+
+        # Кэш последних оценок: пересчет нужен только после новых добавлений
+        self.estimates: Dict[str, int] = {}
+
+    def add(self, user_id: int):
+        """Учет активности пользователя в текущем дне"""
+        today = datetime.datetime.now().date()
+        sketch = self.days.get(today)
+        if sketch is None:
+            sketch = self.days[today] = HyperLogLog(self.precision)
+            self._drop_expired(today)
+        sketch.add(user_id)
+        self.dirty = True
+        self.estimates.clear()
+
+    def _drop_expired(self, today: datetime.date):
+        """Удаление дневных оценок старше retention_days"""
+        border = today - datetime.timedelta(days=self.retention_days)
+        for day in [day for day in self.days if day < border]:
+            del self.days[day]
+
+    def estimate(self, window: str) -> int:
+        """
+        Оценка количества уникальных пользователей за окно
+
+        :param window: Название окна из WINDOWS (today, week, month)
+        :return: Оценка количества пользователей
+        """
+        if window in self.estimates:
+            return self.estimates[window]
+
+        since = datetime.datetime.now().date() - datetime.timedelta(days=WINDOWS[window])
+        merged = HyperLogLog(self.precision)
+        for days in (self.days, self.peer_days):
+            for day, sketch in days.items():
+                if day >= since:
+                    merged.merge(sketch)
+        self.estimates[window] = value = merged.count()
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Оценки DAU/WAU/MAU
+
+        :return: Словарь с оценками по окнам и стандартной относительной ошибкой
+        """
+        return {
+            **{window: self.estimate(window) for window in WINDOWS},
+            "error": HyperLogLog(self.precision).error,
+        }
+
+    async def compare_with_exact(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Сравнение оценок с точными значениями из БД (для проверки точности)
+
+        :return: Словарь "окно -> {estimate, exact, deviation}"
+        """
+        today = datetime.datetime.now().date()
+        result = {}
+        async with db.acquire() as conn:
+            for window, days in WINDOWS.items():
+                exact = await conn.fetchval(f"""
+                    SELECT COUNT(DISTINCT user_id)
+                    FROM {rollup_table("daily_users")}
+                    WHERE day >= $1
+                """, today - datetime.timedelta(days=days))
+                estimate = self.estimate(window)
+                result[window] = {
+                    "estimate": estimate,
+                    "exact": exact,
+                    "deviation": (estimate - exact) / exact if exact else 0.0,
+                }
+        return result
+
+    def _serialize(self) -> str:
+        """Дневные оценки в JSON (регистры в base64)"""
+        return json.dumps({
+            "precision": self.precision,
+            "days": {
+                day.isoformat(): base64.b64encode(sketch.to_bytes()).decode("ascii")
+                for day, sketch in self.days.items()
+            },
+        })
+
+    def _write_file(self, payload: str):
+        """Атомарная запись файла: сначала во временный, затем переименование"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def _read_file(self, path: str) -> Dict[datetime.date, HyperLogLog]:
+        """
+        Дневные оценки из файла
+
+        :return: Словарь "день -> оценка" (пустой, если точность в файле другая)
+        """
+        with open(path, encoding="utf-8") as file:
+            saved = json.load(file)
+        if saved.get("precision") != self.precision:
+            logger.warning(f"Точность оценок активных пользователей в {path} отличается, файл пропущен")
+            return {}
+        return {
+            datetime.date.fromisoformat(day): HyperLogLog(self.precision, base64.b64decode(registers))
+            for day, registers in saved["days"].items()
+        }
+
+    def load(self):
+        """Загрузка сохраненных оценок из файла"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            self.days.update(self._read_file(self.path))
+            self._drop_expired(datetime.datetime.now().date())
+        except Exception as e:
+            logger.error(f"Ошибка загрузки оценок активных пользователей: {e}")
+
+    def _read_peers(self) -> Dict[datetime.date, HyperLogLog]:
+        """Объединенные по дням оценки других воркеров из их файлов"""
+        border = datetime.datetime.now().date() - datetime.timedelta(days=self.retention_days)
+        merged: Dict[datetime.date, HyperLogLog] = {}
+        for path in self.peer_paths:
+            try:
+                days = self._read_file(path)
+            except FileNotFoundError:
+                # Воркер еще ничего не сохранил
+                continue
+            except Exception as e:
+                logger.warning(f"Ошибка чтения оценок активных пользователей воркера из {path}: {e}")
+                continue
+            for day, sketch in days.items():
+                if day < border:
+                    continue
+                if day in merged:
+                    merged[day].merge(sketch)
+                else:
+                    merged[day] = sketch
+        return merged
+
+    async def refresh_peers(self):
+        """Перечитывание оценок других воркеров (файлы читаются в отдельном потоке)"""
+        if not self.peer_paths:
+            return
+        self.peer_days = await asyncio.to_thread(self._read_peers)
+        self.estimates.clear()
+
+    async def save(self):
+        """Сохранение оценок в файл, если они изменились"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        try:
+            # Сериализуем в цикле событий (быстро), а пишем на диск в отдельном потоке
+            await asyncio.to_thread(self._write_file, self._serialize())
+        except Exception as e:
+            self.dirty = True
+            logger.error(f"Ошибка сохранения оценок активных пользователей: {e}")
+
+    async def start(self):
+        """Загрузка оценок и запуск периодического сохранения (хук запуска бота)"""
+        await asyncio.to_thread(self.load)
+        await self.refresh_peers()
+        if self.task is None:
+            self.task = asyncio.create_task(self._persist_loop())
+
+    async def stop(self):
+        """Остановка периодического сохранения и финальное сохранение (хук остановки бота)"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.save()
+
+    async def _persist_loop(self):
+        """Периодическое сохранение своих оценок и чтение оценок других воркеров"""
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            await self.save()
+            await self.refresh_peers()
+
+
+# Общий счетчик активных пользователей
+active_users = ActiveUsersTracker(
+    path=config.active_users.path,
+    precision=config.active_users.precision,
+    persist_interval=config.active_users.persist_interval,
+)
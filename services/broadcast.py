@@ -0,0 +1,415 @@
+import time
+import asyncio
+import logging
+from config import config
+from aiogram import Bot
+from services.db import db
+from services.metrics import metrics
+from services.rollups import rollup_table
+from services.outbound import bulk_sending
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Первый ключ рекомендательной блокировки PostgreSQL для рассылок (второй - ID рассылки)
+LOCK_NAMESPACE = 0x6272   # "br"
+
+# Результаты доставки одному получателю
+OUTCOMES = ("sent", "blocked", "failed")
+
+
+async def create_broadcast_tables(conn):
+    """
+    Создание таблиц рассылок и заблокировавших бота пользователей
+
+    :param conn: Соединение asyncpg
+    """
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {config.broadcast.table} (
+            id BIGSERIAL PRIMARY KEY,                 -- ID рассылки
+            admin_chat_id BIGINT NOT NULL,            -- Чат администратора, запустившего рассылку
+            progress_message_id BIGINT,               -- Сообщение с ходом рассылки
+            text TEXT,                                -- Текст рассылки (если не копируется сообщение)
+            source_chat_id BIGINT,                    -- Чат копируемого сообщения
+            source_message_id BIGINT,                 -- ID копируемого сообщения
+            status VARCHAR(20) NOT NULL DEFAULT 'running', -- running, done или cancelled
+            last_user_id BIGINT NOT NULL DEFAULT 0,   -- Контрольная точка: всем до этого ID уже отправлено
+            sent BIGINT NOT NULL DEFAULT 0,           -- Доставлено
+            blocked BIGINT NOT NULL DEFAULT 0,        -- Пользователь заблокировал бота
+            failed BIGINT NOT NULL DEFAULT 0,         -- Прочие ошибки
+            created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            finished_at TIMESTAMP
+        );
+
+        CREATE TABLE IF NOT EXISTS {config.broadcast.blocked_table} (
+            user_id BIGINT PRIMARY KEY,               -- ID пользователя
+            blocked_at TIMESTAMP NOT NULL DEFAULT NOW(), -- Когда отправка не удалась
+            reason TEXT                               -- Ответ Telegram
+        );
+    """)
+
+
+def recipients_query() -> str:
+    """
+    Запрос получателей рассылки ($1 - контрольная точка)
+
+    Реестр пользователей - агрегат user_stats (одна строка на пользователя с первичным ключом
+    по user_id), поэтому получатели читаются по индексу в порядке ID без DISTINCT по таблице логов.
+    Пользователь, заблокировавший бота, пропускается, пока снова не напишет боту (last_seen позже блокировки).
+    """
+    return f"""
+        SELECT u.user_id
+        FROM {rollup_table("user_stats")} u
+        WHERE u.user_id > $1
+          AND NOT EXISTS (
+              SELECT 1 FROM {config.broadcast.blocked_table} b
+              WHERE b.user_id = u.user_id AND b.blocked_at >= u.last_seen
+          )
+        ORDER BY u.user_id
+    """
+
+
+class Broadcaster:
+    """
+    Рассылка сообщения всем пользователям бота
+
+    - получатели читаются из БД пачками по batch_size в порядке ID от контрольной точки
+      (запрос по индексу без долгой транзакции и курсора);
+    - каждая пачка отправляется не более чем concurrency одновременными запросами
+      как массовая отправка (ограничения Telegram соблюдает планировщик services/outbound.py);
+    - после пачки в БД сохраняется контрольная точка и счетчики, поэтому после падения
+      или перезапуска рассылка продолжается с места остановки (повторно может уйти не больше одной пачки);
+    - пользователи, заблокировавшие бота, записываются в отдельную таблицу и пропускаются;
+    - ход рассылки показывается администратору редактированием одного сообщения.
+
+    Рекомендательная блокировка PostgreSQL не дает двум процессам (воркерам, репликам)
+    выполнять одну рассылку одновременно. Рассылка занимает ровно одно соединение пула:
+    на нем держится блокировка, читаются получатели и пишутся контрольные точки.
+    """
+
+    def __init__(self, concurrency: int = 20, batch_size: int = 100, progress_interval: float = 5.0):
+        """
+        :param concurrency: максимум одновременных отправок
+        :param batch_size: получателей в пачке (и между контрольными точками)
+        :param progress_interval: минимальный интервал между обновлениями хода рассылки (в секундах)
+        """
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+
+        self.tasks: Dict[int, asyncio.Task] = {}   # ID рассылки -> задача
+        self.resume_task: Optional[asyncio.Task] = None
+        self.tables_ready = False
+
+    async def _ensure_tables(self, conn):
+        if not self.tables_ready:
+            await create_broadcast_tables(conn)
+            self.tables_ready = True
+
+    async def start(self, bot: Bot):
+        """
+        Продолжение незавершенных рассылок (хук запуска бота)
+
+        Проверка выполняется в фоне, чтобы обращение к БД не задерживало начало приема обновлений
+        """
+        if db.driver_available and self.resume_task is None:
+            self.resume_task = asyncio.create_task(self._resume(bot))
+
+    async def _resume(self, bot: Bot):
+        """Поиск и запуск рассылок, прерванных остановкой или падением процесса"""
+        try:
+            async with db.acquire() as conn:
+                await self._ensure_tables(conn)
+                rows = await conn.fetch(
+                    f"SELECT id FROM {config.broadcast.table} WHERE status = 'running' ORDER BY id"
+                )
+        except Exception as e:
+            logger.error(f"Не удалось проверить незавершенные рассылки: {e}")
+            return
+        for row in rows:
+            logger.info(f"Продолжение рассылки #{row['id']}")
+            self.launch(bot, row["id"])
+
+    async def stop(self):
+        """
+        Остановка рассылок (хук остановки бота)
+
+        Статус рассылок остается running - они продолжатся от контрольной точки при следующем запуске
+        """
+        tasks = list(self.tasks.values())
+        if self.resume_task is not None:
+            tasks.append(self.resume_task)
+            self.resume_task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tasks.clear()
+
+    async def create(self, admin_chat_id: int, progress_message_id: int, text: Optional[str] = None,
+                     source_chat_id: Optional[int] = None, source_message_id: Optional[int] = None) -> int:
+        """
+        Создание рассылки
+
+        :param admin_chat_id: чат администратора для отчета о ходе рассылки
+        :param progress_message_id: сообщение, которое редактируется по ходу рассылки
+        :param text: текст рассылки
+        :param source_chat_id: чат сообщения, которое нужно скопировать вместо текста
+        :param source_message_id: ID копируемого сообщения
+        :return: ID рассылки
+        """
+        async with db.acquire() as conn:
+            await self._ensure_tables(conn)
+            return await conn.fetchval(
+                f"""
+                INSERT INTO {config.broadcast.table}
+                    (admin_chat_id, progress_message_id, text, source_chat_id, source_message_id)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING id
+                """,
+                admin_chat_id, progress_message_id, text, source_chat_id, source_message_id,
+            )
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """
+        Отмена рассылки (выполняющая ее задача остановится после текущей пачки, в любом процессе)
+
+        :return: True, если рассылка выполнялась
+        """
+        async with db.acquire() as conn:
+            await self._ensure_tables(conn)
+            result = await conn.fetchval(
+                f"""
+                UPDATE {config.broadcast.table} SET status = 'cancelled', finished_at = NOW()
+                WHERE id = $1 AND status = 'running'
+                RETURNING id
+                """,
+                broadcast_id,
+            )
+        return result is not None
+
+    async def latest_running(self) -> Optional[int]:
+        """ID последней выполняющейся рассылки"""
+        async with db.acquire() as conn:
+            await self._ensure_tables(conn)
+            return await conn.fetchval(
+                f"SELECT MAX(id) FROM {config.broadcast.table} WHERE status = 'running'"
+            )
+
+    def launch(self, bot: Bot, broadcast_id: int):
+        """Запуск рассылки в фоновой задаче (обработчик команды не ждет ее окончания)"""
+        if broadcast_id in self.tasks:
+            return
+        task = asyncio.create_task(self._run(bot, broadcast_id))
+        self.tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(broadcast_id, None))
+
+    async def _run(self, bot: Bot, broadcast_id: int):
+        """Выполнение рассылки под рекомендательной блокировкой"""
+        try:
+            async with db.acquire() as conn:
+                locked = await conn.fetchval("SELECT pg_try_advisory_lock($1, $2)", LOCK_NAMESPACE, broadcast_id)
+                if not locked:
+                    # Рассылку уже выполняет другой процесс
+                    return
+                try:
+                    await self._deliver_all(bot, conn, broadcast_id)
+                finally:
+                    await conn.fetchval("SELECT pg_advisory_unlock($1, $2)", LOCK_NAMESPACE, broadcast_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Рассылка остается в статусе running и продолжится при следующем запуске
+            logger.error(f"Рассылка #{broadcast_id} прервана: {e}")
+
+    async def _deliver_all(self, bot: Bot, conn, broadcast_id: int):
+        """
+        Чтение получателей пачками по индексу и отправка
+
+        :param conn: соединение, на котором держится блокировка рассылки (на нем же читаются пачки и пишутся контрольные точки)
+        """
+        row = await conn.fetchrow(f"SELECT * FROM {config.broadcast.table} WHERE id = $1", broadcast_id)
+        if row is None or row["status"] != "running":
+            return
+        broadcast = dict(row)
+        total = await conn.fetchval(f"SELECT users FROM {rollup_table('totals')} WHERE id = 1") or 0
+
+        started = time.monotonic()
+        processed_here = 0                 # Получателей в этом запуске - для расчета скорости
+        last_report = 0.0
+        checkpoint = broadcast["last_user_id"]
+
+        while True:
+            # Следующая пачка после контрольной точки - отдельным запросом на соединении рассылки.
+            # Транзакция не держится между пачками, поэтому контрольная точка пишется
+            # на том же соединении: рассылке не нужно второе соединение из пула
+            records = await conn.fetch(f"{recipients_query()} LIMIT $2", checkpoint, self.batch_size)
+            batch = [record["user_id"] for record in records]
+            if not batch:
+                break
+
+            counts = await self._deliver_batch(bot, broadcast, batch)
+            checkpoint = batch[-1]
+            processed_here += len(batch)
+            broadcast["sent"] += counts["sent"]
+            broadcast["blocked"] += len(counts["blocked"])
+            broadcast["failed"] += counts["failed"]
+
+            status = await self._save_checkpoint(conn, broadcast_id, checkpoint, counts)
+            if status != "running":
+                # Рассылку отменили (возможно, из другого процесса)
+                broadcast["status"] = status or "cancelled"
+                await self._report(bot, broadcast, total, processed_here, started)
+                return
+
+            if time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                await self._report(bot, broadcast, total, processed_here, started)
+
+        await conn.execute(
+            f"""
+            UPDATE {config.broadcast.table} SET status = 'done', finished_at = NOW(), updated_at = NOW()
+            WHERE id = $1 AND status = 'running'
+            """,
+            broadcast_id,
+        )
+        broadcast["status"] = "done"
+        await self._report(bot, broadcast, total, processed_here, started)
+        logger.info(
+            f"Рассылка #{broadcast_id} завершена: доставлено {broadcast['sent']}, "
+            f"заблокировали {broadcast['blocked']}, ошибок {broadcast['failed']}"
+        )
+
+    async def _deliver_batch(self, bot: Bot, broadcast: Dict[str, Any], batch: List[int]) -> Dict[str, Any]:
+        """
+        Отправка пачки не более чем concurrency одновременными запросами
+
+        :return: {"sent": количество, "failed": количество, "blocked": [(ID, причина), ...]}
+        """
+        counts: Dict[str, Any] = {"sent": 0, "failed": 0, "blocked": []}
+        recipients = iter(batch)
+
+        async def worker():
+            # Рабочие забирают получателей из общего итератора, пока они не закончатся
+            for user_id in recipients:
+                outcome, reason = await self._deliver_one(bot, broadcast, user_id)
+                broadcast_messages.inc(outcome)
+                if outcome == "blocked":
+                    counts["blocked"].append((user_id, reason))
+                else:
+                    counts[outcome] += 1
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(batch)))))
+        return counts
+
+    @staticmethod
+    async def _deliver_one(bot: Bot, broadcast: Dict[str, Any], user_id: int) -> Tuple[str, Optional[str]]:
+        """
+        Отправка одному получателю
+
+        :return: (результат из OUTCOMES, причина ошибки)
+        """
+        try:
+            # Рассылка уступает очередь ответам пользователям
+            with bulk_sending():
+                if broadcast["source_message_id"]:
+                    await bot.copy_message(
+                        chat_id=user_id,
+                        from_chat_id=broadcast["source_chat_id"],
+                        message_id=broadcast["source_message_id"],
+                    )
+                else:
+                    await bot.send_message(user_id, broadcast["text"])
+            return "sent", None
+        except TelegramForbiddenError as e:
+            # Бот заблокирован, пользователь удален или не начинал диалог с ботом
+            return "blocked", e.message
+        except TelegramBadRequest as e:
+            if "chat not found" in e.message.lower():
+                return "blocked", e.message
+            logger.warning(f"Рассылка #{broadcast['id']}: ошибка отправки пользователю {user_id}: {e.message}")
+            return "failed", e.message
+        except TelegramAPIError as e:
+            logger.warning(f"Рассылка #{broadcast['id']}: ошибка отправки пользователю {user_id}: {e}")
+            return "failed", str(e)
+
+    @staticmethod
+    async def _save_checkpoint(conn, broadcast_id: int, checkpoint: int, counts: Dict[str, Any]) -> Optional[str]:
+        """
+        Сохранение контрольной точки, счетчиков и заблокировавших бота пользователей одной транзакцией
+
+        :param conn: соединение рассылки (на нем же держится ее блокировка)
+        :return: статус рассылки после сохранения (не running - рассылку отменили)
+        """
+        async with conn.transaction():
+            if counts["blocked"]:
+                await conn.executemany(
+                    f"""
+                    INSERT INTO {config.broadcast.blocked_table} (user_id, blocked_at, reason)
+                    VALUES ($1, NOW(), $2)
+                    ON CONFLICT (user_id) DO UPDATE SET blocked_at = EXCLUDED.blocked_at, reason = EXCLUDED.reason
+                    """,
+                    counts["blocked"],
+                )
+            return await conn.fetchval(
+                f"""
+                UPDATE {config.broadcast.table}
+                SET last_user_id = $2, sent = sent + $3, blocked = blocked + $4, failed = failed + $5,
+                    updated_at = NOW()
+                WHERE id = $1
+                RETURNING status
+                """,
+                broadcast_id, checkpoint, counts["sent"], len(counts["blocked"]), counts["failed"],
+            )
+
+    async def _report(self, bot: Bot, broadcast: Dict[str, Any], total: int, processed_here: int, started: float):
+        """Обновление сообщения с ходом рассылки у администратора"""
+        if not broadcast["progress_message_id"]:
+            return
+        try:
+            await bot.edit_message_text(
+                format_progress(broadcast, total, processed_here / max(time.monotonic() - started, 1e-9)),
+                chat_id=broadcast["admin_chat_id"],
+                message_id=broadcast["progress_message_id"],
+            )
+        except TelegramAPIError as e:
+            # Отчет не должен останавливать рассылку (в том числе "message is not modified")
+            logger.debug(f"Не удалось обновить ход рассылки #{broadcast['id']}: {e}")
+
+
+def format_progress(broadcast: Dict[str, Any], total: int, rate: float) -> str:
+    """
+    Текст хода рассылки
+
+    :param broadcast: строка рассылки с текущими счетчиками
+    :param total: оценка общего количества пользователей
+    :param rate: скорость в этом запуске (получателей в секунду)
+    """
+    titles = {"running": "выполняется", "done": "завершена", "cancelled": "отменена"}
+    processed = broadcast["sent"] + broadcast["blocked"] + broadcast["failed"]
+    percent = f" ({min(processed / total, 1.0):.0%})" if total else ""
+    return (
+        f"📣 <b>Рассылка #{broadcast['id']}</b>: {titles.get(broadcast['status'], broadcast['status'])}\n\n"
+        f"• Обработано: {processed} из ~{total}{percent}\n"
+        f"• Доставлено: {broadcast['sent']}\n"
+        f"• Заблокировали бота: {broadcast['blocked']}\n"
+        f"• Ошибки: {broadcast['failed']}\n"
+        f"• Скорость: {rate:.1f} сообщ./сек\n"
+    )
+
+
+# Показатели для Prometheus
+broadcast_messages = metrics.counter(
+    "bot_broadcast_messages_total", "Отправки рассылок по результату (sent, blocked, failed)", ("outcome",)
+)
+
+# Глобальный экземпляр рассылок
+broadcaster = Broadcaster(
+    concurrency=config.broadcast.concurrency,
+    batch_size=config.broadcast.batch_size,
+    progress_interval=config.broadcast.progress_interval,
+)
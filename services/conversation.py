@@ -0,0 +1,297 @@
+import json
+import time
+import asyncio
+import logging
+from config import config
+from services.db import db
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Реплика диалога: (роль, текст), роль - "user" или "assistant"
+Turn = Tuple[str, str]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка количества токенов без токенизатора модели
+
+    Около 4 байт UTF-8 на токен: для английского текста это ~4 символа,
+    для русского (2 байта на букву) - ~2 символа, что близко к реальной токенизации.
+    Небольшая надбавка учитывает служебные токены каждого сообщения.
+    """
+    return len(text.encode("utf-8")) // 4 + 4
+
+
+async def create_conversation_table(conn):
+    """
+    Создание таблицы, в которую выгружаются диалоги, вытесненные из памяти
+
+    :param conn: Соединение asyncpg
+    """
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {config.conversation.table} (
+            user_id BIGINT PRIMARY KEY,               -- ID пользователя
+            turns JSONB NOT NULL,                     -- Последние реплики [[роль, текст], ...]
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW() -- Время последней выгрузки
+        );
+
+        -- Индекс для удаления давно неактивных диалогов
+        CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON {config.conversation.table} (updated_at);
+    """)
+
+
+class ConversationMemory:
+    """
+    Память диалогов с ограниченным размером
+
+    Каждый диалог - кольцевой буфер из последних max_turns реплик, текст реплики
+    обрезается до max_turn_chars символов. В памяти хранится не больше max_conversations
+    диалогов: давно не использовавшиеся (LRU) и простаивающие дольше idle_timeout
+    выгружаются в БД и загружаются обратно при следующем сообщении пользователя.
+    Поэтому объем памяти ограничен max_conversations * max_turns * max_turn_chars
+    независимо от количества пользователей.
+    """
+
+    def __init__(self, max_conversations: int = 10000, max_turns: int = 10, max_turn_chars: int = 2000,
+                 max_prompt_tokens: int = 1500, idle_timeout: float = 1800.0,
+                 retention_days: int = 7, flush_interval: float = 5.0):
+        """
+        :param max_conversations: максимальное количество диалогов в памяти
+        :param max_turns: сколько последних реплик хранить в диалоге
+        :param max_turn_chars: максимальная длина сохраняемой реплики (в символах)
+        :param max_prompt_tokens: бюджет токенов истории в одном запросе к API
+        :param idle_timeout: через сколько секунд простоя диалог выгружается из памяти
+        :param retention_days: сколько дней хранить выгруженные диалоги в БД (0 - всегда)
+        :param flush_interval: интервал выгрузки вытесненных диалогов в БД (в секундах)
+        """
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.max_turn_chars = max_turn_chars
+        self.max_prompt_tokens = max_prompt_tokens
+        self.idle_timeout = idle_timeout
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+
+        # user_id -> [реплики, время последнего использования, есть несохраненные изменения]
+        # Порядок OrderedDict - порядок последнего использования (в конце самые свежие)
+        self.conversations: "OrderedDict[int, List[Any]]" = OrderedDict()
+        # Вытесненные диалоги, ожидающие выгрузки в БД, и выгружаемые прямо сейчас
+        self.spilled: "OrderedDict[int, List[Turn]]" = OrderedDict()
+        self.flushing: Dict[int, List[Turn]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+        # Счетчики для мониторинга
+        self.hits = 0                # Диалог найден в памяти
+        self.loads = 0               # Диалог загружен из БД
+        self.evictions = 0           # Диалогов вытеснено из памяти
+        self.spill_dropped = 0       # Вытесненных диалогов потеряно (БД недоступна)
+
+    def _new_buffer(self, turns: Optional[List[Turn]] = None) -> Deque[Turn]:
+        """Кольцевой буфер реплик: при переполнении самая старая удаляется автоматически"""
+        return deque(turns or (), maxlen=self.max_turns)
+
+    async def _get(self, user_id: int) -> List[Any]:
+        """
+        Запись диалога в памяти (с загрузкой из БД при необходимости)
+
+        :return: [буфер реплик, время последнего использования, есть несохраненные изменения]
+        """
+        entry = self.conversations.get(user_id)
+        if entry is not None:
+            self.hits += 1
+            self.conversations.move_to_end(user_id)
+            entry[1] = time.monotonic()
+            return entry
+
+        # Диалог мог быть вытеснен, но еще не выгружен в БД
+        turns = self.spilled.pop(user_id, None)
+        if turns is None:
+            turns = self.flushing.get(user_id)
+        dirty = turns is not None
+        if turns is None:
+            turns = await self._load(user_id)
+
+        # Между ожиданием загрузки и этой точкой диалог мог создать другой запрос пользователя
+        entry = self.conversations.get(user_id)
+        if entry is None:
+            entry = [self._new_buffer(turns), time.monotonic(), dirty]
+            self.conversations[user_id] = entry
+            self._evict_overflow()
+        return entry
+
+    async def get_history(self, user_id: int, prompt: str = "", system_message: str = "") -> List[Turn]:
+        """
+        Последние реплики диалога, укладывающиеся в бюджет токенов
+
+        Реплики добавляются от самой свежей к старой, пока не закончится бюджет,
+        поэтому запрос к API никогда не превышает max_prompt_tokens из-за истории.
+
+        :param user_id: ID пользователя
+        :param prompt: текущий запрос (учитывается в бюджете)
+        :param system_message: системная инструкция (учитывается в бюджете)
+        :return: Реплики в хронологическом порядке
+        """
+        turns = (await self._get(user_id))[0]
+        budget = self.max_prompt_tokens - estimate_tokens(prompt) - estimate_tokens(system_message)
+        history: List[Turn] = []
+        for role, content in reversed(turns):
+            budget -= estimate_tokens(content)
+            if budget < 0:
+                break
+            history.append((role, content))
+        history.reverse()
+        return history
+
+    async def add_exchange(self, user_id: int, prompt: str, answer: str):
+        """
+        Сохранение вопроса пользователя и ответа бота
+
+        :param user_id: ID пользователя
+        :param prompt: текст вопроса
+        :param answer: текст ответа
+        """
+        entry = await self._get(user_id)
+        entry[0].append(("user", prompt[:self.max_turn_chars]))
+        entry[0].append(("assistant", answer[:self.max_turn_chars]))
+        entry[2] = True
+
+    def _evict(self, user_id: int):
+        """Вытеснение диалога из памяти: измененный диалог ждет выгрузки в БД"""
+        turns, _, dirty = self.conversations.pop(user_id)
+        self.evictions += 1
+        if dirty:
+            self.spilled[user_id] = list(turns)
+            # Пока БД недоступна, очередь выгрузки тоже ограничена - старые диалоги теряются
+            while len(self.spilled) > self.max_conversations:
+                self.spilled.popitem(last=False)
+                self.spill_dropped += 1
+
+    def _evict_overflow(self):
+        """Вытеснение давно не использовавшихся диалогов сверх max_conversations"""
+        while len(self.conversations) > self.max_conversations:
+            self._evict(next(iter(self.conversations)))
+
+    def _evict_idle(self):
+        """Вытеснение диалогов, простаивающих дольше idle_timeout"""
+        border = time.monotonic() - self.idle_timeout
+        # Диалоги упорядочены по последнему использованию - простаивающие в начале
+        while self.conversations:
+            user_id, entry = next(iter(self.conversations.items()))
+            if entry[1] > border:
+                break
+            self._evict(user_id)
+
+    async def _load(self, user_id: int) -> Optional[List[Turn]]:
+        """Загрузка выгруженного диалога из БД (при недоступной БД диалог начинается заново)"""
+        try:
+            async with db.acquire() as conn:
+                row = await conn.fetchval(
+                    f"SELECT turns FROM {config.conversation.table} WHERE user_id = $1", user_id
+                )
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить диалог пользователя {user_id}: {e}")
+            return None
+        if row is None:
+            return None
+        self.loads += 1
+        return [tuple(turn) for turn in json.loads(row)]
+
+    async def flush(self):
+        """Выгрузка вытесненных диалогов в БД одним запросом"""
+        if not self.spilled:
+            return
+        self.flushing = dict(self.spilled)
+        self.spilled.clear()
+        batch = list(self.flushing.items())
+        try:
+            async with db.acquire() as conn:
+                await conn.executemany(f"""
+                    INSERT INTO {config.conversation.table} (user_id, turns, updated_at)
+                    VALUES ($1, $2::jsonb, NOW())
+                    ON CONFLICT (user_id) DO UPDATE SET turns = EXCLUDED.turns, updated_at = NOW()
+                """, [(user_id, json.dumps(turns, ensure_ascii=False)) for user_id, turns in batch])
+        except Exception as e:
+            logger.warning(f"Не удалось выгрузить диалоги в БД: {e}")
+            # Возвращаем в очередь то, что не было заменено более новой версией
+            for user_id, turns in batch:
+                self.spilled.setdefault(user_id, turns)
+            while len(self.spilled) > self.max_conversations:
+                self.spilled.popitem(last=False)
+                self.spill_dropped += 1
+        finally:
+            self.flushing = {}
+
+    async def drop_expired(self):
+        """Удаление из БД диалогов, не обновлявшихся дольше retention_days"""
+        if not self.retention_days:
+            return
+        try:
+            async with db.acquire() as conn:
+                await conn.execute(
+                    f"DELETE FROM {config.conversation.table} WHERE updated_at < NOW() - make_interval(days => $1)",
+                    self.retention_days,
+                )
+        except Exception as e:
+            logger.warning(f"Не удалось удалить устаревшие диалоги: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Показатели памяти диалогов
+
+        :return: Словарь с количеством диалогов в памяти и в очереди выгрузки и счетчиками
+        """
+        return {
+            "conversations": len(self.conversations),
+            "max_conversations": self.max_conversations,
+            "pending_spill": len(self.spilled),
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "spill_dropped": self.spill_dropped,
+        }
+
+    async def start(self):
+        """Запуск фоновой выгрузки диалогов (хук запуска бота)"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановка выгрузки и сохранение всех измененных диалогов (хук остановки бота)"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for user_id in [user_id for user_id, entry in self.conversations.items() if entry[2]]:
+            self._evict(user_id)
+        await self.flush()
+
+    async def _flush_loop(self):
+        """Периодическое вытеснение простаивающих диалогов и выгрузка в БД"""
+        last_cleanup = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._evict_idle()
+            await self.flush()
+            # Устаревшие диалоги удаляются из БД раз в час
+            if time.monotonic() - last_cleanup >= 3600:
+                last_cleanup = time.monotonic()
+                await self.drop_expired()
+
+
+# Общая память диалогов
+conversations = ConversationMemory(
+    max_conversations=config.conversation.max_conversations,
+    max_turns=config.conversation.max_turns,
+    max_turn_chars=config.conversation.max_turn_chars,
+    max_prompt_tokens=config.conversation.max_prompt_tokens,
+    idle_timeout=config.conversation.idle_timeout,
+    retention_days=config.conversation.retention_days,
+)
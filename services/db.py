@@ -0,0 +1,233 @@
+import time
+import asyncio
+import logging
+from config import config
+from services.metrics import metrics
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Драйвер БД еще не импортирован
+NOT_LOADED = object()
+
+
+class DatabaseUnavailable(Exception):
+    """БД недоступна: драйвер не установлен, пул не создан или нет свободного соединения"""
+
+
+class Database:
+    """
+    Общий асинхронный пул соединений с PostgreSQL
+
+    Все сервисы (запись логов, статистика, инициализация БД) берут соединения
+    из одного пула вместо того, чтобы открывать новое соединение на каждый запрос.
+    """
+
+    def __init__(self, min_size: int = 1, max_size: int = 10, acquire_timeout: float = 5.0,
+                 command_timeout: float = 30.0, statement_cache_size: int = 100,
+                 health_check_interval: float = 30.0, reconnect_interval: float = 10.0):
+        """
+        :param min_size: минимальное количество соединений в пуле
+        :param max_size: максимальное количество соединений в пуле
+        :param acquire_timeout: время ожидания свободного соединения (в секундах)
+        :param command_timeout: максимальное время выполнения запроса (в секундах)
+        :param statement_cache_size: размер кэша подготовленных запросов на соединение
+        :param health_check_interval: интервал фоновой проверки доступности БД (в секундах)
+        :param reconnect_interval: минимальный интервал между попытками создать пул
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.command_timeout = command_timeout
+        self.statement_cache_size = statement_cache_size
+        self.health_check_interval = health_check_interval
+        self.reconnect_interval = reconnect_interval
+
+        self.pool = None
+        self.healthy = False
+        self.health_task: Optional[asyncio.Task] = None
+        self.warm_up_task: Optional[asyncio.Task] = None
+        # Блокировка защищает от одновременного создания нескольких пулов
+        self.lock: Optional[asyncio.Lock] = None
+        self.last_connect_attempt = 0.0
+
+        # Драйвер импортируется один раз при первом подключении (импорт asyncpg заметно
+        # удлиняет запуск процесса); None - драйвер не установлен, БД считается недоступной
+        self.asyncpg: Any = NOT_LOADED
+
+    @property
+    def driver_available(self) -> bool:
+        """Установлен ли драйвер PostgreSQL (пока драйвер не загружен, считается, что установлен)"""
+        return self.asyncpg is not None
+
+    def load_driver(self) -> Any:
+        """
+        Импорт драйвера PostgreSQL при первом обращении
+
+        :return: Модуль asyncpg или None, если драйвер не установлен
+        """
+        if self.asyncpg is NOT_LOADED:
+            try:
+                import asyncpg
+                self.asyncpg = asyncpg
+            except ImportError:
+                self.asyncpg = None
+                logger.warning("asyncpg не установлен. Работа с БД отключена.")
+        return self.asyncpg
+
+    async def start(self):
+        """
+        Запуск фоновой проверки доступности (хук запуска бота)
+
+        Пул создается в фоне (или при первом запросе), поэтому подключение к БД
+        не задерживает начало приема обновлений
+        """
+        if self.warm_up_task is None:
+            self.warm_up_task = asyncio.create_task(self._ensure_pool())
+        if self.health_task is None:
+            self.health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        """Остановка проверки доступности и закрытие пула (хук остановки бота)"""
+        if self.warm_up_task is not None:
+            # Прерываем подключение, если пул еще создается
+            self.warm_up_task.cancel()
+            await asyncio.gather(self.warm_up_task, return_exceptions=True)
+            self.warm_up_task = None
+
+        if self.health_task is not None:
+            self.health_task.cancel()
+            try:
+                await self.health_task
+            except asyncio.CancelledError:
+                pass
+            self.health_task = None
+
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        self.healthy = False
+
+    async def _ensure_pool(self):
+        """Создает пул, если его еще нет (не чаще reconnect_interval)"""
+        if self.pool is not None or not self.driver_available:
+            return
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            if self.pool is not None:
+                return
+            # Импорт драйвера - в отдельном потоке, чтобы не останавливать цикл событий
+            if self.asyncpg is NOT_LOADED:
+                await asyncio.to_thread(self.load_driver)
+            if self.asyncpg is None:
+                return
+            # Не штурмуем недоступную БД попытками подключения на каждый запрос
+            now = time.monotonic()
+            if now - self.last_connect_attempt < self.reconnect_interval:
+                return
+            self.last_connect_attempt = now
+
+            try:
+                self.pool = await self.asyncpg.create_pool(
+                    host=config.bot.db_host,
+                    port=config.bot.db_port,
+                    database=config.bot.db_name,
+                    user=config.bot.db_user,
+                    password=config.bot.db_password,
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    command_timeout=self.command_timeout,
+                    # Подготовленные запросы кэшируются на каждом соединении пула
+                    statement_cache_size=self.statement_cache_size,
+                    # Простаивающие соединения закрываются, чтобы не держать их вечно
+                    max_inactive_connection_lifetime=300.0,
+                )
+                self.healthy = True
+                logger.info(f"Пул соединений с БД создан ({self.min_size}-{self.max_size})")
+            except Exception as e:
+                self.healthy = False
+                logger.error(f"Ошибка подключения к БД: {e}")
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Any]:
+        """
+        Получение соединения из пула
+
+        :raises DatabaseUnavailable: если пул недоступен или свободное соединение
+                                     не появилось за acquire_timeout
+        """
+        await self._ensure_pool()
+        if self.pool is None:
+            raise DatabaseUnavailable("Пул соединений с БД недоступен")
+
+        try:
+            conn = await self.pool.acquire(timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise DatabaseUnavailable(
+                f"Нет свободного соединения с БД за {self.acquire_timeout} сек"
+            )
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    async def health_check(self) -> bool:
+        """
+        Проверка доступности БД простым запросом
+
+        :return: True, если БД отвечает
+        """
+        try:
+            async with self.acquire() as conn:
+                await conn.fetchval("SELECT 1")
+            self.healthy = True
+        except Exception as e:
+            if self.healthy:
+                logger.error(f"БД недоступна: {e}")
+            self.healthy = False
+        return self.healthy
+
+    async def _health_loop(self):
+        """Периодическая проверка доступности БД"""
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.health_check()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Текущее состояние пула
+
+        :return: Словарь с размером пула и количеством свободных соединений
+        """
+        return {
+            "healthy": self.healthy,
+            "size": self.pool.get_size() if self.pool else 0,
+            "idle": self.pool.get_idle_size() if self.pool else 0,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+        }
+
+
+# Общий пул соединений для всего приложения
+db = Database(
+    min_size=config.bot.db_pool_min_size,
+    max_size=config.bot.db_pool_max_size,
+    acquire_timeout=config.bot.db_acquire_timeout,
+    command_timeout=config.bot.db_command_timeout,
+    statement_cache_size=config.bot.db_statement_cache_size,
+    health_check_interval=config.bot.db_health_check_interval,
+)
+
+
+# Размер пула для /metrics: занятые соединения = size - idle
+metrics.callback(
+    "bot_db_pool_connections", "Соединения пула БД по состоянию",
+    lambda: {("open",): db.get_stats()["size"], ("idle",): db.get_stats()["idle"]},
+    ("state",),
+)
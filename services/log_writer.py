@@ -0,0 +1,241 @@
+import json
+import time
+import asyncio
+import logging
+import datetime
+from config import config
+from services.db import db
+from services.metrics import db_duration, db_errors, metrics
+from services.schema import create_tables
+from services.rollups import apply_events
+from typing import Any, Dict, List, Optional
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Допустимые политики поведения при переполнении очереди
+# drop_new    - новое событие отбрасывается
+# drop_oldest - из очереди вытесняется самое старое событие
+# block       - ждем освобождения места не дольше block_timeout, затем отбрасываем
+OVERFLOW_POLICIES = ("drop_new", "drop_oldest", "block")
+
+
+class LogWriter:
+    """
+    Фоновая запись событий в базу данных
+
+    Middleware только кладут события в ограниченную очередь в памяти,
+    а отдельная задача забирает их пачками и записывает одной командой COPY.
+    Сброс происходит при наборе batch_size событий или по истечении flush_interval.
+    """
+
+    def __init__(self, queue_size: int = 10000, batch_size: int = 500,
+                 flush_interval: float = 1.0, overflow_policy: str = "drop_oldest",
+                 block_timeout: float = 0.05):
+        """
+        :param queue_size: максимальное количество событий в очереди
+        :param batch_size: размер пачки для одной записи в БД
+        :param flush_interval: максимальный интервал между сбросами (в секундах)
+        :param overflow_policy: политика при переполнении (drop_new, drop_oldest, block)
+        :param block_timeout: время ожидания места в очереди для политики block
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {overflow_policy}")
+
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+
+        # Очередь и задача создаются в start(), когда уже запущен цикл событий
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        # Флаг остановки: цикл записи завершается после сброса текущей пачки
+        self.closing = False
+
+        # Таблица логов создается при первой записи
+        self.table_ready = False
+
+        # Счетчики для мониторинга
+        self.enqueued = 0            # Принято событий в очередь
+        self.written = 0             # Записано событий в БД
+        self.dropped = 0             # Отброшено из-за переполнения очереди
+        self.failed = 0              # Потеряно из-за ошибок записи в БД
+        self.flushes = 0             # Количество выполненных сбросов
+        self.last_flush_latency = 0.0  # Длительность последнего сброса (в секундах)
+        self.max_flush_latency = 0.0   # Максимальная длительность сброса
+        self.total_flush_latency = 0.0 # Суммарная длительность сбросов
+
+    async def start(self):
+        """Запуск фоновой задачи записи"""
+        if self.task is not None:
+            return
+        self.closing = False
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка фоновой задачи с записью оставшихся событий"""
+        if self.task is None:
+            return
+        # Не отменяем задачу, чтобы не потерять пачку, которая уже пишется в БД
+        self.closing = True
+        await self.task
+        self.task = None
+
+        # Дописываем то, что осталось в очереди к моменту остановки
+        while not self.queue.empty():
+            await self._flush(self._drain(self.batch_size))
+
+    async def put(self, event_type: str, user_id: int, username: str,
+                  chat_id: int, text: str, data: Dict[str, Any]) -> bool:
+        """
+        Постановка события в очередь записи
+
+        Никогда не обращается к БД. Для политики block ожидание ограничено block_timeout.
+
+        :return: True, если событие принято в очередь
+        """
+        # До запуска writer'а (или без драйвера БД) события просто не пишутся
+        if self.queue is None or not db.driver_available:
+            return False
+
+        # Время события фиксируем сразу, а не в момент записи пачки
+        event = (datetime.datetime.now(), event_type, user_id, username,
+                 chat_id, text, json.dumps(data))
+
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            if self.overflow_policy == "drop_new":
+                self.dropped += 1
+                return False
+            elif self.overflow_policy == "drop_oldest":
+                # Вытесняем самое старое событие, освобождая место для нового
+                self.queue.get_nowait()
+                self.dropped += 1
+                self.queue.put_nowait(event)
+            else:
+                try:
+                    await asyncio.wait_for(self.queue.put(event), self.block_timeout)
+                except asyncio.TimeoutError:
+                    self.dropped += 1
+                    return False
+
+        self.enqueued += 1
+        return True
+
+    def _drain(self, limit: int) -> List[tuple]:
+        """Забирает из очереди не больше limit событий без ожидания"""
+        batch = []
+        while len(batch) < limit and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        """Основной цикл: собираем пачку по размеру или по времени и записываем"""
+        loop = asyncio.get_running_loop()
+        while not self.closing:
+            # Ждем первое событие пачки, периодически проверяя флаг остановки
+            try:
+                batch = [await asyncio.wait_for(self.queue.get(), self.flush_interval)]
+            except asyncio.TimeoutError:
+                continue
+            deadline = loop.time() + self.flush_interval
+
+            # Добираем пачку до batch_size, но не дольше flush_interval
+            while len(batch) < self.batch_size:
+                batch.extend(self._drain(self.batch_size - len(batch)))
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[tuple]):
+        """Запись пачки событий с замером задержки"""
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            await self._write_batch(batch)
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            db_errors.inc("log_write_batch")
+            logger.error(f"Ошибка записи пачки событий в БД ({len(batch)} шт.): {e}")
+        finally:
+            latency = time.perf_counter() - started
+            self.flushes += 1
+            self.last_flush_latency = latency
+            self.total_flush_latency += latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            db_duration.observe(latency, "log_write_batch")
+
+    async def _write_batch(self, batch: List[tuple]):
+        """Запись пачки событий через COPY на соединении из общего пула"""
+        async with db.acquire() as conn:
+            # Таблицы создаются один раз за время работы, а не на каждое событие
+            if not self.table_ready:
+                await create_tables(conn)
+                self.table_ready = True
+
+            # События и агрегаты для /stats записываются в одной транзакции,
+            # поэтому агрегаты всегда соответствуют содержимому таблицы логов
+            async with conn.transaction():
+                # COPY передает всю пачку одним потоком данных - быстрее многострочного INSERT
+                await conn.copy_records_to_table(
+                    config.bot.basic_logs_db_table_name,
+                    records=batch,
+                    columns=["timestamp", "event_type", "user_id", "username", "chat_id", "text", "data"],
+                )
+                await apply_events(conn, batch)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Текущие показатели работы writer'а
+
+        :return: Словарь со счетчиками и задержками сброса (в миллисекундах)
+        """
+        return {
+            "queue_size": self.queue.qsize() if self.queue else 0,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_ms": self.last_flush_latency * 1000,
+            "avg_flush_ms": self.total_flush_latency / self.flushes * 1000 if self.flushes else 0.0,
+            "max_flush_ms": self.max_flush_latency * 1000,
+        }
+
+
+# Общий экземпляр writer'а для всех middleware
+log_writer = LogWriter(
+    queue_size=config.log_writer.queue_size,
+    batch_size=config.log_writer.batch_size,
+    flush_interval=config.log_writer.flush_interval,
+    overflow_policy=config.log_writer.overflow_policy,
+    block_timeout=config.log_writer.block_timeout,
+)
+
+
+# Очередь и счетчики записи событий для /metrics - значения читаются в момент выгрузки
+metrics.callback(
+    "bot_log_writer_queue_size", "События в очереди записи в БД",
+    lambda: log_writer.queue.qsize() if log_writer.queue else 0,
+)
+metrics.callback(
+    "bot_log_writer_events_total", "События по результату записи в БД",
+    lambda: {("written",): log_writer.written, ("dropped",): log_writer.dropped, ("failed",): log_writer.failed},
+    ("result",), kind="counter",
+)
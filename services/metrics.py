@@ -0,0 +1,331 @@
+import time
+import bisect
+import logging
+from aiohttp import web
+from config import config
+from utils.startup import startup_profiler
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Тип ответа по формату текстовой выгрузки Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм по умолчанию (в секундах): от 1 мс для middleware и фильтров
+# до 30 с для запросов к OpenAI (OPENAI_DEADLINE)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    """Экранирование значения метки для текстового формата"""
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], labels: Tuple[str, ...], extra: str = "") -> str:
+    """Метки в виде {name="value",...} (пустая строка, если меток нет)"""
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    """Число в текстовом формате (целые без дробной части)"""
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """
+    Счетчик, который только растет (количество обновлений, ошибок, запросов)
+
+    Значения меток передаются позиционно в порядке labelnames: один поиск в словаре
+    на вызов, без создания объектов для каждой комбинации меток.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        """
+        Увеличение счетчика
+
+        :param labels: значения меток в порядке labelnames
+        :param amount: на сколько увеличить
+        """
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        """Строки значений для выгрузки"""
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Histogram:
+    """
+    Гистограмма длительностей с фиксированными корзинами
+
+    Для каждой комбинации меток хранится количество наблюдений в каждой корзине
+    (не накопительное - накопительные суммы считаются только при выгрузке), сумма и количество.
+    Наблюдение - двоичный поиск корзины и два сложения.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> [количество в каждой корзине (последняя - +Inf), сумма значений]
+        self.series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: str):
+        """
+        Учет одного наблюдения
+
+        :param value: значение (длительность в секундах)
+        :param labels: значения меток в порядке labelnames
+        """
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        # Корзина le включает значения, равные границе
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def collect(self) -> List[str]:
+        """Строки корзин, суммы и количества для выгрузки"""
+        lines = []
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(total)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Показатель, значение которого читается из сервиса в момент выгрузки
+
+    Так публикуются уже существующие счетчики и размеры очередей сервисов
+    (очередь OpenAI, очередь записи событий, пул БД) без затрат на каждое обновление.
+    Функция возвращает число или словарь {кортеж значений меток: число}.
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], Any],
+                 labelnames: Sequence[str] = (), kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+
+    def collect(self) -> List[str]:
+        value = self.callback()
+        values = value if isinstance(value, dict) else {(): value}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(item)}"
+            for labels, item in values.items()
+        ]
+
+
+class MetricsRegistry:
+    """Набор показателей процесса и их выгрузка в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Any] = {}
+
+    def _register(self, metric: Any) -> Any:
+        if metric.name in self.metrics:
+            raise ValueError(f"Показатель {metric.name} уже зарегистрирован")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Регистрация счетчика"""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Регистрация гистограммы"""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, callback: Callable[[], Any],
+                 labelnames: Sequence[str] = (), kind: str = "gauge") -> CallbackMetric:
+        """
+        Регистрация показателя, значение которого читается при выгрузке
+
+        :param kind: gauge для текущих значений, counter для растущих счетчиков сервиса
+        """
+        return self._register(CallbackMetric(name, documentation, callback, labelnames, kind))
+
+    def render(self) -> str:
+        """
+        Все показатели в текстовом формате Prometheus
+
+        :return: Текст для ответа на запрос /metrics
+        """
+        lines = []
+        for metric in self.metrics.values():
+            try:
+                values = metric.collect()
+            except Exception as e:
+                # Ошибка одного сервиса не должна ломать выгрузку остальных показателей
+                logger.warning(f"Не удалось получить показатель {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(values)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    Локальный HTTP-сервер, отдающий показатели по адресу /metrics
+
+    Сервер отдельный от webhook: по умолчанию он слушает только 127.0.0.1,
+    и показатели не публикуются на внешнем адресе бота.
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 0):
+        """
+        :param registry: набор показателей
+        :param host: адрес, на котором слушает сервер
+        :param port: порт (0 - сервер не запускается)
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Ответ на запрос сборщика показателей"""
+        return web.Response(body=self.registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self):
+        """Запуск сервера (хук запуска бота)"""
+        if not self.port or self.runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        try:
+            await web.TCPSite(self.runner, self.host, self.port).start()
+        except OSError as e:
+            # Занятый порт не должен мешать работе бота
+            logger.error(f"Не удалось запустить сервер показателей на {self.host}:{self.port}: {e}")
+            await self.runner.cleanup()
+            self.runner = None
+            return
+        logger.info(f"Показатели доступны по адресу http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        """Остановка сервера (хук остановки бота)"""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+# Общий набор показателей процесса
+metrics = MetricsRegistry()
+
+# Обновления: тип события и результат (handled, unhandled - ни один обработчик не подошел, error)
+updates_total = metrics.counter(
+    "bot_updates_total", "Обработанные обновления по типу и результату", ("event_type", "status")
+)
+update_duration = metrics.histogram(
+    "bot_update_duration_seconds",
+    "Полное время обработки обновления: маршрутизация, фильтры, middleware и обработчик",
+    ("event_type",),
+)
+
+# Обработчики и middleware
+handler_duration = metrics.histogram(
+    "bot_handler_duration_seconds", "Время работы обработчика", ("handler",)
+)
+handler_errors = metrics.counter(
+    "bot_handler_errors_total", "Исключения в обработчиках", ("handler",)
+)
+middleware_duration = metrics.histogram(
+    "bot_middleware_duration_seconds", "Собственное время middleware без следующих шагов цепочки", ("middleware",)
+)
+filter_duration = metrics.histogram(
+    "bot_filter_duration_seconds", "Время проверки фильтра", ("filter",)
+)
+
+# Запросы к OpenAI: mode - completion или stream,
+# outcome - ok (в том числе из кэша), timeout, error, fallback (нет ключа или исчерпана квота)
+openai_requests = metrics.counter(
+    "bot_openai_requests_total", "Запросы на генерацию ответа по результату", ("mode", "outcome")
+)
+openai_duration = metrics.histogram(
+    "bot_openai_request_duration_seconds", "Время запроса к OpenAI API без ожидания в очереди", ("mode",)
+)
+openai_queue_wait = metrics.histogram(
+    "bot_openai_queue_wait_seconds", "Ожидание свободного места для запроса к OpenAI API"
+)
+openai_first_token = metrics.histogram(
+    "bot_openai_first_token_seconds", "Время до первой части ответа в потоковом режиме"
+)
+
+# Запросы к БД: query - название запроса (stats_users, stats_messages, log_write_batch)
+db_duration = metrics.histogram(
+    "bot_db_query_duration_seconds", "Время запросов к БД", ("query",)
+)
+db_errors = metrics.counter(
+    "bot_db_errors_total", "Ошибки запросов к БД", ("query",)
+)
+
+
+@contextmanager
+def time_db_query(query: str) -> Iterator[None]:
+    """
+    Замер времени запроса к БД и учет ошибок
+
+    :param query: название запроса для метки
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        db_errors.inc(query)
+        raise
+    finally:
+        db_duration.observe(time.perf_counter() - started, query)
+
+
+# Запуск процесса: готовность и длительность фаз запуска (см. utils/startup.py)
+metrics.callback("bot_ready", "Принимает ли бот обновления (1 - да)", lambda: int(startup_profiler.ready))
+metrics.callback(
+    "bot_startup_phase_seconds", "Длительность фаз запуска процесса",
+    lambda: {(name,): seconds for name, seconds in startup_profiler.phases},
+    ("phase",),
+)
+metrics.callback(
+    "bot_startup_ready_seconds", "Время от запуска процесса до готовности принимать обновления",
+    lambda: startup_profiler.ready_at or 0.0,
+)
+
+# Сервер показателей (METRICS_PORT=0 - не запускается)
+metrics_server = MetricsServer(metrics, host=config.metrics.host, port=config.metrics.port)
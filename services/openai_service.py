@@ -1,57 +1,484 @@
-import openai
+import time
+import heapq
+import asyncio
 import logging
+import itertools
 from config import config
+from services.token_budget import token_budget
+from services.metrics import metrics, openai_duration, openai_first_token, openai_queue_wait, openai_requests
+from services.conversation import Turn, conversations
+from services.response_cache import ResponseCache, make_cache_key
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 
-# Настройка клиента OpenAI
-# Инициализируем клиент для работы с OpenAI API, передавая API ключ из конфигурации
-client = openai.OpenAI(api_key=config.openai.api_key)
+# Классы приоритета запросов к API: меньший номер обслуживается раньше
+PRIORITY_ADMIN = 0
+PRIORITY_USER = 1
 
 
-async def generate_response(prompt: str) -> str:
+# Клиент OpenAI создается при первом запросе или фоновым прогревом после запуска (warm_up):
+# импорт пакета openai занимает заметную часть времени запуска процесса,
+# а до первого вопроса пользователя клиент не нужен
+client = None
+warm_up_task: Optional[asyncio.Task] = None
+
+
+def get_client():
+    """
+    Клиент OpenAI (создается при первом вызове)
+
+    Асинхронный клиент не блокирует цикл событий на время генерации ответа,
+    поэтому пока один пользователь ждет ответ, остальные обновления продолжают обрабатываться.
+    max_retries=0 - повторы не должны съедать общий лимит времени на ответ
+    """
+    global client
+    if client is None:
+        import openai
+        client = openai.AsyncOpenAI(
+            api_key=config.openai.api_key,
+            timeout=config.openai.request_timeout,
+            max_retries=0,
+        )
+    return client
+
+
+async def warm_up():
+    """
+    Фоновый прогрев клиента OpenAI (хук запуска бота)
+
+    Импорт выполняется в отдельном потоке и не задерживает запуск: бот начинает
+    принимать обновления сразу, а первый вопрос пользователя не ждет импорта.
+    """
+    global warm_up_task
+    if not config.openai.api_key or client is not None or warm_up_task is not None:
+        return
+
+    async def load():
+        try:
+            await asyncio.to_thread(get_client)
+        except Exception as e:
+            # Клиент будет создан при первом запросе
+            logging.warning(f"Не удалось заранее создать клиент OpenAI: {e}")
+
+    warm_up_task = asyncio.create_task(load())
+
+
+def _timeout_errors() -> tuple:
+    """Исключения таймаута запроса (исключение пакета openai возможно, только если клиент уже создан)"""
+    if client is None:
+        return (asyncio.TimeoutError,)
+    import openai
+    return (asyncio.TimeoutError, openai.APITimeoutError)
+
+
+class RequestLimiter:
+    """
+    Ограничение количества одновременных запросов к API с приоритетами
+
+    Лишние запросы ждут в очереди, а освободившееся место получает запрос с наименьшим
+    номером класса приоритета (внутри класса - по порядку поступления). Счетчики
+    waiting/in_flight показывают текущую глубину очереди и количество выполняющихся запросов.
+    """
+
+    def __init__(self, max_concurrency: int):
+        """
+        :param max_concurrency: максимальное количество одновременных запросов
+        """
+        self.max_concurrency = max_concurrency
+        # Очередь ожидающих: [класс приоритета, порядковый номер, future]
+        self.queue: List[list] = []
+        self.sequence = itertools.count()
+        self.waiting = 0             # Запросов в очереди
+        self.in_flight = 0           # Запросов, выполняющихся прямо сейчас
+        self.completed = 0           # Успешно выполненных запросов
+        self.timeouts = 0            # Запросов, не уложившихся в лимит времени
+        self.errors = 0              # Запросов, завершившихся ошибкой API
+        # Запросов, дождавшихся места в очереди, по классам приоритета
+        self.served_by_priority: Dict[int, int] = {}
+
+    async def _acquire(self, priority: int, timeout: Optional[float]):
+        """Ожидание свободного места в порядке приоритета"""
+        if self.in_flight < self.max_concurrency and not self.queue:
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, [priority, next(self.sequence), future])
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            # Место могло быть передано одновременно с отменой - отдаем его следующему
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        finally:
+            self.waiting -= 1
+        self.served_by_priority[priority] = self.served_by_priority.get(priority, 0) + 1
+
+    def _release(self):
+        """Передача места первому ожидающему запросу или освобождение"""
+        while self.queue:
+            _, _, future = heapq.heappop(self.queue)
+            # Ожидание отмененных (по таймауту) запросов пропускаем
+            if not future.done():
+                # in_flight не меняется: место переходит к ожидающему запросу
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None, priority: int = 1):
+        """
+        Занимает место среди одновременных запросов на время выполнения блока
+
+        :param timeout: сколько ждать свободного места (None - без ограничения)
+        :param priority: класс приоритета (PRIORITY_ADMIN, PRIORITY_USER)
+        :raises asyncio.TimeoutError: если место не освободилось за timeout
+        """
+        started = time.perf_counter()
+        await self._acquire(priority, timeout)
+        openai_queue_wait.observe(time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Текущие показатели очереди запросов
+
+        :return: Словарь с глубиной очереди, количеством выполняющихся запросов и счетчиками
+        """
+        return {
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "served_by_priority": dict(self.served_by_priority),
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+        }
+
+
+# Общий ограничитель для всех запросов к OpenAI
+limiter = RequestLimiter(config.openai.max_concurrency)
+
+
+# Общий кэш ответов
+# Одинаковые по смыслу вопросы разных пользователей обслуживаются одним запросом к API
+response_cache = ResponseCache(
+    max_entries=config.openai.cache_max_entries,
+    ttl=config.openai.cache_ttl,
+    max_bytes=config.openai.cache_max_bytes,
+)
+
+
+# Очередь и кэш ответов для /metrics - значения читаются в момент выгрузки
+metrics.callback("bot_openai_waiting", "Запросы к OpenAI API в очереди", lambda: limiter.waiting)
+metrics.callback("bot_openai_in_flight", "Выполняющиеся запросы к OpenAI API", lambda: limiter.in_flight)
+metrics.callback(
+    "bot_openai_cache_lookups_total", "Обращения к кэшу ответов по результату",
+    lambda: {
+        ("hit",): response_cache.hits,
+        ("miss",): response_cache.misses,
+        ("coalesced",): response_cache.coalesced,
+    },
+    ("result",), kind="counter",
+)
+
+
+# Системная инструкция
+# Это определяет поведение модели, её тон и стиль
+SYSTEM_MESSAGE = """
+Ты - помощник бота Startup House. Твоя задача - помогать пользователям
+с вопросами о стартапах, бизнесе и искусственном интеллекте.
+Отвечай кратко, дружелюбно и информативно. Используй эмодзи.
+"""
+
+
+def get_priority(user_id: Optional[int]) -> int:
+    """Класс приоритета запроса пользователя: администраторы обслуживаются первыми"""
+    return PRIORITY_ADMIN if user_id in config.bot.admin_ids else PRIORITY_USER
+
+
+def _record_usage(user_id: Optional[int], usage: Any):
+    """Учет токенов из поля usage ответа API"""
+    if user_id is not None and usage is not None:
+        token_budget.record(user_id, usage.prompt_tokens or 0, usage.completion_tokens or 0)
+
+
+def _build_messages(prompt: str, history: Optional[List[Turn]] = None) -> List[Dict[str, str]]:
+    """
+    Сообщения для API: системная инструкция, история диалога и текущий запрос
+
+    :param prompt: Текст запроса пользователя
+    :param history: Предыдущие реплики диалога (уже обрезанные по бюджету токенов)
+    :return: Список сообщений в формате chat.completions
+    """
+    messages = [{"role": "system", "content": SYSTEM_MESSAGE}]  # Системное сообщение
+    messages.extend({"role": role, "content": content} for role, content in history or ())
+    messages.append({"role": "user", "content": prompt})  # Сообщение пользователя
+    return messages
+
+
+async def _get_history(prompt: str, user_id: Optional[int]) -> List[Turn]:
+    """История диалога пользователя для запроса (пустая, если память диалогов отключена)"""
+    if user_id is None or not config.conversation.enabled:
+        return []
+    return await conversations.get_history(user_id, prompt, SYSTEM_MESSAGE)
+
+
+async def _remember(prompt: str, answer: str, user_id: Optional[int]):
+    """Сохранение вопроса и ответа в истории диалога (ответы-заглушки не сохраняются)"""
+    if user_id is not None and config.conversation.enabled and answer:
+        await conversations.add_exchange(user_id, prompt, answer)
+
+
+async def _request_completion(prompt: str, user_id: Optional[int] = None,
+                              history: Optional[List[Turn]] = None) -> str:
+    """
+    Запрос к API с ожиданием свободного места в очереди
+
+    :param prompt: Текст запроса пользователя
+    :param user_id: ID пользователя (для приоритета и учета токенов)
+    :param history: Предыдущие реплики диалога
+    :return: Ответ от API
+    """
+    async with limiter.slot(priority=get_priority(user_id)):
+        # Отправляем запрос к API
+        # Создаем запрос на генерацию ответа используя chat.completions.create
+        started = time.perf_counter()
+        try:
+            response = await get_client().chat.completions.create(
+                model=config.openai.model,  # Используем модель из конфигурации
+                messages=_build_messages(prompt, history),
+                max_tokens=500,  # Ограничиваем длину ответа
+                temperature=0.7  # Настраиваем креативность (0.7 - умеренная)
+            )
+        finally:
+            openai_duration.observe(time.perf_counter() - started, "completion")
+
+    # Токены запроса и ответа учитываются в квоте пользователя
+    _record_usage(user_id, response.usage)
+
+    # Получаем ответ
+    # Извлекаем содержимое первого сообщения из ответа
+    return response.choices[0].message.content
+
+
+async def _request_with_deadline(prompt: str, user_id: Optional[int] = None,
+                                 history: Optional[List[Turn]] = None) -> str:
+    """
+    Запрос к API с общим лимитом времени
+
+    :param prompt: Текст запроса пользователя
+    :param user_id: ID пользователя (для приоритета и учета токенов)
+    :param history: Предыдущие реплики диалога
+    :return: Ответ от API
+    """
+    # Общий лимит времени покрывает и ожидание в очереди, и сам запрос
+    answer = await asyncio.wait_for(_request_completion(prompt, user_id, history), config.openai.deadline)
+    limiter.completed += 1
+    return answer
+
+
+async def generate_response(prompt: str, user_id: Optional[int] = None) -> str:
     """
     Генерирует ответ с использованием OpenAI API
-    
+
+    Если ответ не получен за config.openai.deadline секунд (с учетом ожидания в очереди)
+    или суточная квота токенов пользователя исчерпана, возвращается ответ-заглушка.
+    Вместе с запросом в API передается история диалога пользователя.
+
     :param prompt: Текст запроса пользователя
+    :param user_id: ID пользователя (для приоритета, учета токенов и истории диалога)
     :return: Ответ от API
     """
     try:
         # Если API ключ не настроен, используем заглушку
         # Это позволяет боту работать даже без ключа API
         if not config.openai.api_key:
+            openai_requests.inc("completion", "fallback")
             return generate_fallback_response(prompt)
-            
-        # Формируем системную инструкцию
-        # Это определяет поведение модели, её тон и стиль
-        system_message = """
-        Ты - помощник бота Startup House. Твоя задача - помогать пользователям 
-        с вопросами о стартапах, бизнесе и искусственном интеллекте.
-        Отвечай кратко, дружелюбно и информативно. Используй эмодзи.
-        """
         
-        # Отправляем запрос к API
-        # Создаем запрос на генерацию ответа используя chat.completions.create
-        response = client.chat.completions.create(
-            model=config.openai.model,  # Используем модель из конфигурации
-            messages=[
-                {"role": "system", "content": system_message},  # Системное сообщение
-                {"role": "user", "content": prompt}  # Сообщение пользователя
-            ],
-            max_tokens=500,  # Ограничиваем длину ответа
-            temperature=0.7  # Настраиваем креативность (0.7 - умеренная)
-        )
-        
-        # Получаем ответ
-        # Извлекаем содержимое первого сообщения из ответа
-        return response.choices[0].message.content
+        # Пользователь израсходовал суточную квоту токенов - отвечаем без API
+        if user_id is not None and not token_budget.allow(user_id):
+            openai_requests.inc("completion", "fallback")
+            return generate_fallback_response(prompt)
+
+        # Ответ с учетом истории зависит от диалога, поэтому кэш используется
+        # только для первого вопроса (или при отключенной памяти диалогов)
+        history = await _get_history(prompt, user_id)
+        if history:
+            answer = await _request_with_deadline(prompt, user_id, history)
+        else:
+            # Ответ берется из кэша, а одновременные одинаковые вопросы ждут один общий запрос.
+            # Ответы-заглушки в кэш не попадают: ошибки пробрасываются всем ожидающим
+            key = make_cache_key(prompt, config.openai.model, SYSTEM_MESSAGE)
+            # Токены запроса учитываются у пользователя, чей вопрос отправлен в API
+            answer = await response_cache.get_or_compute(key, lambda: _request_with_deadline(prompt, user_id))
         
+        openai_requests.inc("completion", "ok")
+        await _remember(prompt, answer, user_id)
+        return answer
+
+    except _timeout_errors():
+        limiter.timeouts += 1
+        openai_requests.inc("completion", "timeout")
+        logging.warning(f"Запрос к OpenAI API не уложился в {config.openai.deadline} сек")
+        return generate_fallback_response(prompt)
+
     except Exception as e:
         # Обрабатываем любые возможные ошибки
+        limiter.errors += 1
+        openai_requests.inc("completion", "error")
         logging.error(f"Ошибка при запросе к OpenAI API: {e}")
         # В случае ошибки возвращаем ответ из заглушки
         return generate_fallback_response(prompt)
 
 
+async def stream_response(prompt: str, user_id: Optional[int] = None) -> AsyncIterator[str]:
+    """
+    Генерирует ответ по частям по мере поступления токенов от API
+
+    Готовый ответ из кэша отдается одной частью, а к такому же выполняющемуся потоковому
+    запросу вопрос присоединяется и получает те же части ответа (к API уходит один запрос).
+    Если API недоступен или не уложился в config.openai.deadline до первой части ответа,
+    отдается ответ-заглушка; если часть ответа уже отдана, генерация просто завершается.
+    При исчерпанной суточной квоте токенов пользователя тоже отдается ответ-заглушка.
+    Вместе с запросом в API передается история диалога пользователя.
+
+    :param prompt: Текст запроса пользователя
+    :param user_id: ID пользователя (для приоритета, учета токенов и истории диалога)
+    :return: Асинхронный итератор фрагментов ответа
+    """
+    # Если API ключ не настроен или квота исчерпана, используем заглушку
+    if not config.openai.api_key or (user_id is not None and not token_budget.allow(user_id)):
+        openai_requests.inc("stream", "fallback")
+        yield generate_fallback_response(prompt)
+        return
+
+    # Кэш используется только для первого вопроса диалога - ответ с историей от нее зависит
+    history = await _get_history(prompt, user_id)
+    key = make_cache_key(prompt, config.openai.model, SYSTEM_MESSAGE)
+    flight = None
+    if not history:
+        # Готовый ответ или части такого же выполняющегося запроса (single-flight)
+        joined = response_cache.follow(key)
+        if joined is not None:
+            received = []
+            try:
+                async for part in joined:
+                    received.append(part)
+                    yield part
+            except Exception:
+                # Такой же запрос завершился ошибкой (ее записал в лог ведущий запрос) - как и при
+                # обычной генерации, ошибка достается всем ожидающим, повторного запроса к API нет
+                openai_requests.inc("stream", "error")
+                if not received:
+                    yield generate_fallback_response(prompt)
+                return
+            openai_requests.inc("stream", "ok")
+            await _remember(prompt, "".join(received), user_id)
+            return
+        # Запрос регистрируется до обращения к API, чтобы такие же вопросы присоединились к нему
+        flight = response_cache.start_stream(key)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config.openai.deadline
+    parts = []
+    started = None
+    try:
+        async with limiter.slot(timeout=config.openai.deadline, priority=get_priority(user_id)):
+            # Время запроса считается после получения места - ожидание в очереди учитывается отдельно
+            started = time.perf_counter()
+            # stream=True - API отдает ответ частями, не дожидаясь окончания генерации
+            stream = await asyncio.wait_for(get_client().chat.completions.create(
+                model=config.openai.model,
+                messages=_build_messages(prompt, history),
+                max_tokens=500,
+                temperature=0.7,
+                stream=True,
+                # Последняя часть потока содержит usage - расход токенов запроса
+                stream_options={"include_usage": True},
+            ), deadline - loop.time())
+
+            async with stream:
+                chunks = stream.__aiter__()
+                while True:
+                    # Каждая часть ответа должна прийти до общего дедлайна
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    _record_usage(user_id, chunk.usage)
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        if not parts:
+                            openai_first_token.observe(time.perf_counter() - started)
+                        parts.append(delta)
+                        if flight is not None:
+                            flight.push(delta)
+                        yield delta
+
+        limiter.completed += 1
+        openai_requests.inc("stream", "ok")
+        answer = "".join(parts)
+        # Полный ответ на первый вопрос сохраняем в кэш (пустой не сохраняется),
+        # присоединившиеся запросы получают завершение потока
+        if flight is not None:
+            response_cache.finish_stream(key, flight, answer)
+            flight = None
+        await _remember(prompt, answer, user_id)
+
+    except _timeout_errors() as e:
+        limiter.timeouts += 1
+        openai_requests.inc("stream", "timeout")
+        logging.warning(f"Потоковый запрос к OpenAI API не уложился в {config.openai.deadline} сек")
+        # Присоединившиеся запросы узнают об ошибке сразу, не дожидаясь отправки заглушки
+        if flight is not None:
+            response_cache.fail_stream(key, flight, e)
+            flight = None
+        if not parts:
+            yield generate_fallback_response(prompt)
+
+    except Exception as e:
+        limiter.errors += 1
+        openai_requests.inc("stream", "error")
+        logging.error(f"Ошибка при потоковом запросе к OpenAI API: {e}")
+        if flight is not None:
+            response_cache.fail_stream(key, flight, e)
+            flight = None
+        if not parts:
+            yield generate_fallback_response(prompt)
+
+    finally:
+        # Длительность учитывается и для прерванных запросов (таймаут, ошибка API)
+        if started is not None:
+            openai_duration.observe(time.perf_counter() - started, "stream")
+        # Запрос прерван (таймаут, ошибка API, отмена обработчика): снимаем регистрацию,
+        # чтобы такие же вопросы не ждали его и не получили неполный ответ из кэша
+        if flight is not None:
+            response_cache.fail_stream(key, flight, RuntimeError("Потоковый запрос к OpenAI API прерван"))
+
+
+def get_llm_stats() -> Dict[str, Any]:
+    """
+    Показатели нагрузки на OpenAI API
+
+    :return: Словарь с глубиной очереди, количеством запросов в работе, счетчиками,
+             показателями кэша ответов, расходом токенов и памятью диалогов
+    """
+    return {
+        **limiter.get_stats(),
+        "cache": response_cache.get_stats(),
+        "tokens": token_budget.get_stats(),
+        "conversations": conversations.get_stats(),
+    }
+
+
 def generate_fallback_response(prompt: str) -> str:
     """
     Генерирует ответ без использования API (заглушка)
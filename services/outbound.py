@@ -0,0 +1,265 @@
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import contextvars
+from config import config
+from utils.gcra import GCRALimiter
+from contextlib import contextmanager
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from services.metrics import metrics
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Приоритеты отправки: меньшее значение отправляется раньше
+PRIORITY_INTERACTIVE = 0     # Ответы пользователю на его сообщение
+PRIORITY_BULK = 1            # Рассылки и прочие массовые отправки
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# Методы, на которые распространяются ограничения Telegram на отправку сообщений
+LIMITED_PREFIXES = ("Send", "Forward", "Copy", "EditMessage")
+
+# Приоритет отправок текущей задачи (по умолчанию - ответ пользователю)
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("outbound_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def bulk_sending() -> Iterator[None]:
+    """
+    Отправки внутри блока считаются массовыми и уступают очередь ответам пользователям
+
+    Пример:
+        with bulk_sending():
+            await bot.send_message(chat_id, text)
+    """
+    token = _priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """
+    Планировщик исходящих сообщений с учетом ограничений Telegram
+
+    Подключается к сессии бота (bot.session.middleware), поэтому обработчики по-прежнему
+    вызывают message.answer(...) и bot.send_message(...), а все запросы на отправку
+    проходят через планировщик:
+    - ограничение на чат: GCRA с отдельными скоростями для личных чатов и групп;
+    - общее ограничение бота: очередь с приоритетами, из которой запросы выпускаются
+      с заданной скоростью, ответы пользователям - раньше массовых отправок;
+    - ответ 429 (retry_after) приостанавливает всю очередь один раз на указанное время,
+      запрос возвращается в очередь и повторяется.
+    Остальные методы (answerCallbackQuery, getMe и т.д.) проходят без ограничений.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, chat_burst: float = 3.0,
+                 group_rate: float = 20 / 60, group_burst: float = 3.0, max_retries: int = 3):
+        """
+        :param global_rate: сообщений в секунду для всего бота
+        :param chat_rate: сообщений в секунду в один личный чат
+        :param chat_burst: сколько сообщений можно отправить в личный чат подряд
+        :param group_rate: сообщений в секунду в одну группу
+        :param group_burst: сколько сообщений можно отправить в группу подряд
+        :param max_retries: сколько раз повторять запрос после ответа 429
+        """
+        self.chat_limiter = GCRALimiter(rate=chat_rate, burst=chat_burst)
+        self.group_limiter = GCRALimiter(rate=group_rate, burst=group_burst)
+        self.max_retries = max_retries
+        self.set_global_rate(global_rate)
+
+        self.queue: List[Tuple[int, int, asyncio.Future]] = []   # (приоритет, номер, ожидающий запрос)
+        self.sequence = itertools.count()   # Порядок поступления внутри одного приоритета
+        self.global_tat = 0.0               # Время, когда освободится следующий общий слот
+        self.paused_until = 0.0             # Общая пауза после ответа 429 (по монотонным часам)
+        self.pump_task: Optional[asyncio.Task] = None
+
+        # Показатели для /stats
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+        self.pauses = 0
+        self.wait_total = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self.wait_count = {priority: 0 for priority in PRIORITY_NAMES}
+        self.wait_max = {priority: 0.0 for priority in PRIORITY_NAMES}
+
+    def set_global_rate(self, rate: float):
+        """
+        Изменение общей скорости отправки (в многопроцессном режиме делится между воркерами)
+
+        :param rate: сообщений в секунду
+        """
+        if rate <= 0:
+            raise ValueError("Скорость отправки должна быть положительной")
+        self.global_rate = rate
+        self.global_interval = 1.0 / rate
+
+    @staticmethod
+    def is_limited(method: TelegramMethod) -> bool:
+        """Распространяются ли на метод ограничения отправки сообщений"""
+        return type(method).__name__.startswith(LIMITED_PREFIXES) and getattr(method, "chat_id", None) is not None
+
+    async def wait_chat(self, chat_id: Any):
+        """
+        Ожидание, пока ограничение чата разрешит отправку
+
+        :param chat_id: ID чата (отрицательный - группа или канал) или @username
+        """
+        is_group = not isinstance(chat_id, int) or chat_id < 0
+        limiter = self.group_limiter if is_group else self.chat_limiter
+        while True:
+            allowed, retry_after = limiter.hit(chat_id)
+            if allowed:
+                return
+            await asyncio.sleep(retry_after)
+
+    def _take_global(self, now: float) -> float:
+        """
+        Попытка занять общий слот
+
+        :return: 0, если слот занят, иначе - через сколько секунд повторить
+        """
+        delay = max(self.paused_until - now, self.global_tat - now)
+        if delay > 0:
+            return delay
+        self.global_tat = max(self.global_tat, now) + self.global_interval
+        return 0.0
+
+    async def wait_global(self, priority: int):
+        """
+        Ожидание общего слота отправки
+
+        Если очередь пуста и слот свободен, запрос проходит сразу. Иначе запрос встает
+        в очередь с приоритетом, которую выпускает одна задача - так пауза после 429
+        выдерживается один раз для всех ожидающих, а не в каждой корутине отдельно.
+        """
+        if not self.queue and self._take_global(time.monotonic()) == 0.0:
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self.sequence), future))
+        if self.pump_task is None or self.pump_task.done():
+            self.pump_task = asyncio.create_task(self._pump())
+        await future
+
+    async def _pump(self):
+        """Выпуск запросов из очереди по одному на общий слот"""
+        while self.queue:
+            delay = self._take_global(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            # Слот занят - отдаем его первому запросу, который еще ждет (отмененные пропускаем)
+            while self.queue:
+                _, _, future = heapq.heappop(self.queue)
+                if not future.done():
+                    future.set_result(None)
+                    break
+            else:
+                # Ожидающих не осталось - возвращаем слот
+                self.global_tat -= self.global_interval
+
+    def pause(self, retry_after: float):
+        """
+        Общая пауза отправки после ответа 429
+
+        Несколько одновременных ответов 429 не складываются: пауза продлевается
+        только если новый срок позже текущего.
+        """
+        until = time.monotonic() + retry_after
+        if until > self.paused_until:
+            self.paused_until = until
+            self.pauses += 1
+            logger.warning(f"Telegram ограничил отправку, пауза {retry_after} сек")
+
+    def _record_wait(self, priority: int, wait: float):
+        self.wait_total[priority] += wait
+        self.wait_count[priority] += 1
+        self.wait_max[priority] = max(self.wait_max[priority], wait)
+        outbound_wait.observe(wait, PRIORITY_NAMES[priority])
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Any,
+        method: TelegramMethod[TelegramType],
+    ) -> Any:
+        if not self.is_limited(method):
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            await self.wait_chat(method.chat_id)
+            await self.wait_global(priority)
+            if attempt == 0:
+                # Время ожидания в очереди до первой попытки отправки
+                self._record_wait(priority, time.monotonic() - started)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.retries += 1
+                outbound_retries.inc(PRIORITY_NAMES[priority])
+                self.pause(e.retry_after)
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    raise
+                continue
+            self.sent += 1
+            return result
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Показатели отправки для /stats
+
+        :return: Словарь с размером очереди, паузой и временем ожидания по приоритетам
+        """
+        wait = {}
+        for priority, name in PRIORITY_NAMES.items():
+            count = self.wait_count[priority]
+            wait[name] = {
+                "count": count,
+                "avg_ms": self.wait_total[priority] / count * 1000 if count else 0.0,
+                "max_ms": self.wait_max[priority] * 1000,
+            }
+        return {
+            "queued": len(self.queue),
+            "paused_for": max(0.0, self.paused_until - time.monotonic()),
+            "global_rate": self.global_rate,
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "pauses": self.pauses,
+            "wait": wait,
+        }
+
+
+# Показатели для Prometheus
+outbound_wait = metrics.histogram(
+    "bot_outbound_wait_seconds", "Ожидание отправки сообщения в очереди планировщика", ("priority",)
+)
+outbound_retries = metrics.counter(
+    "bot_outbound_retries_total", "Повторы отправки после ответа 429", ("priority",)
+)
+
+# Глобальный экземпляр планировщика (подключается к сессии бота в bot.py)
+outbound = OutboundScheduler(
+    global_rate=config.outbound.global_rate,
+    chat_rate=config.outbound.chat_rate,
+    chat_burst=config.outbound.chat_burst,
+    group_rate=config.outbound.group_per_minute / 60,
+    group_burst=config.outbound.group_burst,
+    max_retries=config.outbound.max_retries,
+)
+
+metrics.callback(
+    "bot_outbound_queue_size", "Сообщения, ожидающие общего слота отправки", lambda: len(outbound.queue)
+)
@@ -0,0 +1,296 @@
+import re
+import asyncio
+import logging
+import datetime
+from config import config
+from services.db import db
+from services.rollups import prune_daily_users
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Допустимые размеры секций
+PARTITION_INTERVALS = ("day", "month")
+
+
+def period_start(day: datetime.date, interval: str) -> datetime.date:
+    """Начало периода (дня или месяца), в который попадает день"""
+    return day if interval == "day" else day.replace(day=1)
+
+
+def next_period(start: datetime.date, interval: str) -> datetime.date:
+    """Начало следующего периода"""
+    if interval == "day":
+        return start + datetime.timedelta(days=1)
+    return (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def partition_name(table: str, start: datetime.date, interval: str) -> str:
+    """
+    Имя секции: bot_logs_p20240131 для дневных секций, bot_logs_p202401 для месячных
+
+    :param table: Имя секционированной таблицы
+    :param start: Начало периода секции
+    :param interval: Размер секции (day, month)
+    """
+    return f"{table}_p{start.strftime('%Y%m%d' if interval == 'day' else '%Y%m')}"
+
+
+def parse_partition_name(table: str, name: str) -> Optional[Tuple[datetime.date, datetime.date]]:
+    """
+    Границы секции по ее имени
+
+    :return: (начало, конец) или None, если секция создана не менеджером секций
+    """
+    match = re.fullmatch(rf"{re.escape(table)}_p(\d{{8}}|\d{{6}})", name)
+    if match is None:
+        return None
+    suffix = match.group(1)
+    if len(suffix) == 8:
+        start = datetime.datetime.strptime(suffix, "%Y%m%d").date()
+        return start, next_period(start, "day")
+    start = datetime.datetime.strptime(suffix, "%Y%m").date()
+    return start, next_period(start, "month")
+
+
+async def is_partitioned(conn, table: str) -> bool:
+    """Является ли таблица секционированной (а не обычной таблицей старой схемы)"""
+    return await conn.fetchval("""
+        SELECT relkind = 'p' FROM pg_class
+        WHERE oid = to_regclass($1)
+    """, table) or False
+
+
+async def list_partitions(conn, table: str) -> List[str]:
+    """Имена секций таблицы (без секции по умолчанию)"""
+    rows = await conn.fetch("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass($1)
+        ORDER BY c.relname
+    """, table)
+    return [row["relname"] for row in rows if row["relname"] != f"{table}_default"]
+
+
+async def create_partition(conn, table: str, start: datetime.date, interval: str) -> bool:
+    """
+    Создание секции за период, если ее еще нет
+
+    События, которые успели попасть в секцию по умолчанию, переносятся в новую секцию:
+    иначе PostgreSQL не даст подключить секцию с пересекающимся диапазоном.
+
+    :param conn: Соединение asyncpg
+    :param table: Имя секционированной таблицы
+    :param start: Начало периода
+    :param interval: Размер секции (day, month)
+    :return: True, если секция была создана
+    """
+    name = partition_name(table, start, interval)
+    end = next_period(start, interval)
+
+    async with conn.transaction():
+        # Несколько процессов бота могут обслуживать секции одновременно -
+        # блокировка на время транзакции делает создание секций последовательным
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", table)
+        if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", name):
+            return False
+
+        await conn.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        await conn.execute(f"""
+            WITH moved AS (
+                DELETE FROM {table}_default
+                WHERE timestamp >= $1 AND timestamp < $2
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """, start, end)
+        # Границы в DDL нельзя передать параметрами; даты формируются здесь же, не из ввода
+        await conn.execute(f"""
+            ALTER TABLE {table} ATTACH PARTITION {name}
+            FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')
+        """)
+    return True
+
+
+async def ensure_partitions(conn, table: str, first_day: datetime.date, last_day: datetime.date,
+                            interval: str) -> int:
+    """
+    Создание недостающих секций, покрывающих дни с first_day по last_day
+
+    :return: Количество созданных секций
+    """
+    created = 0
+    start = period_start(first_day, interval)
+    while start <= last_day:
+        if await create_partition(conn, table, start, interval):
+            created += 1
+        start = next_period(start, interval)
+    return created
+
+
+async def drop_expired_partitions(conn, table: str, retention_days: int,
+                                  today: datetime.date) -> List[str]:
+    """
+    Удаление секций, все события которых старше срока хранения
+
+    Удаление секции целиком - мгновенная операция без DELETE, VACUUM и раздувания таблицы.
+
+    :return: Имена удаленных секций
+    """
+    if retention_days <= 0:
+        return []
+
+    border = today - datetime.timedelta(days=retention_days)
+    dropped = []
+    for name in await list_partitions(conn, table):
+        bounds = parse_partition_name(table, name)
+        # Секция удаляется, только если ее конец не позже границы срока хранения
+        if bounds is None or bounds[1] > border:
+            continue
+        async with conn.transaction():
+            # Та же блокировка, что и при создании секций: секцию, которую уже удалил
+            # другой процесс бота, повторно не трогаем
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext($1))", table)
+            if not await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", name):
+                continue
+            await conn.execute(f"ALTER TABLE {table} DETACH PARTITION {name}")
+            await conn.execute(f"DROP TABLE {name}")
+        dropped.append(name)
+    return dropped
+
+
+class PartitionManager:
+    """
+    Обслуживание секций таблиц логов и ошибок
+
+    Периодически создает секции на premake периодов вперед, чтобы события не попадали
+    в секцию по умолчанию, и удаляет секции старше срока хранения. Заодно удаляет
+    устаревшие пары (день, пользователь) агрегата daily_users.
+    """
+
+    def __init__(self, interval: str = "month", premake: int = 2,
+                 retention_days: Optional[Dict[str, int]] = None,
+                 maintenance_interval: float = 3600.0):
+        """
+        :param interval: размер секции (day, month)
+        :param premake: сколько будущих периодов создавать заранее
+        :param retention_days: срок хранения по таблицам ("таблица -> дней", 0 - хранить всегда)
+        :param maintenance_interval: интервал обслуживания секций (в секундах)
+        """
+        if interval not in PARTITION_INTERVALS:
+            raise ValueError(f"Неизвестный размер секции: {interval}")
+
+        self.interval = interval
+        self.premake = premake
+        self.retention_days = retention_days or {}
+        self.maintenance_interval = maintenance_interval
+        self.task: Optional[asyncio.Task] = None
+
+        # Счетчики для мониторинга
+        self.created = 0             # Создано секций
+        self.dropped = 0             # Удалено секций по сроку хранения
+        self.pruned_daily_users = 0  # Удалено устаревших пар (день, пользователь) агрегатов
+        self.last_run: Optional[datetime.datetime] = None
+
+    @property
+    def tables(self) -> List[str]:
+        """Обслуживаемые таблицы"""
+        return list(self.retention_days)
+
+    def horizon(self, today: datetime.date) -> datetime.date:
+        """Последний день, для которого секция должна уже существовать"""
+        start = period_start(today, self.interval)
+        for _ in range(self.premake):
+            start = next_period(start, self.interval)
+        return start
+
+    async def prepare(self, conn, table: str, today: Optional[datetime.date] = None):
+        """
+        Создание секций с текущего периода до горизонта premake
+
+        Вызывается при создании таблиц, чтобы первые события сразу попали в свою секцию.
+        Таблицы старой (несекционированной) схемы пропускаются.
+        """
+        today = today or datetime.datetime.now().date()
+        if not await is_partitioned(conn, table):
+            return
+        self.created += await ensure_partitions(conn, table, today, self.horizon(today), self.interval)
+
+    async def maintain(self) -> Dict[str, Any]:
+        """
+        Одно обслуживание: создание будущих секций, удаление устаревших секций и пар daily_users
+
+        :return: Словарь "таблица -> {created, dropped}"
+        """
+        today = datetime.datetime.now().date()
+        result = {}
+        async with db.acquire() as conn:
+            for table in self.tables:
+                if not await is_partitioned(conn, table):
+                    continue
+                created = await ensure_partitions(conn, table, today, self.horizon(today), self.interval)
+                dropped = await drop_expired_partitions(conn, table, self.retention_days[table], today)
+                self.created += created
+                self.dropped += len(dropped)
+                if dropped:
+                    logger.info(f"Удалены устаревшие секции {table}: {', '.join(dropped)}")
+                result[table] = {"created": created, "dropped": dropped}
+            # Пары нужны только за окно сверки активных пользователей (и для несекционированной схемы)
+            self.pruned_daily_users += await prune_daily_users(conn, today)
+        self.last_run = datetime.datetime.now()
+        return result
+
+    async def start(self):
+        """Запуск периодического обслуживания секций (хук запуска бота)"""
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка обслуживания секций (хук остановки бота)"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        """Обслуживание при запуске и затем каждые maintenance_interval секунд"""
+        while True:
+            try:
+                await self.maintain()
+            except Exception as e:
+                # БД может быть временно недоступна - попробуем в следующий раз
+                logger.error(f"Ошибка обслуживания секций логов: {e}")
+            await asyncio.sleep(self.maintenance_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Показатели обслуживания секций
+
+        :return: Словарь с количеством созданных/удаленных секций и временем последнего запуска
+        """
+        return {
+            "interval": self.interval,
+            "created": self.created,
+            "dropped": self.dropped,
+            "pruned_daily_users": self.pruned_daily_users,
+            "last_run": self.last_run,
+        }
+
+
+# Общий менеджер секций таблиц логов и ошибок
+partition_manager = PartitionManager(
+    interval=config.partitions.interval,
+    premake=config.partitions.premake,
+    retention_days={
+        config.bot.basic_logs_db_table_name: config.partitions.logs_retention_days,
+        config.bot.errors_logs_db_table_name: config.partitions.errors_retention_days,
+    },
+    maintenance_interval=config.partitions.maintenance_interval,
+)
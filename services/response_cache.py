@@ -0,0 +1,294 @@
+import re
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+
+# Все, что не буква/цифра/пробел, при нормализации запроса отбрасывается
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Нормализация запроса для ключа кэша
+
+    Регистр, ё/е, знаки препинания и лишние пробелы не влияют на ключ:
+    "Как написать бизнес-план?" и "как написать бизнес план" дают одинаковый результат.
+
+    :param prompt: Текст запроса пользователя
+    :return: Нормализованный текст
+    """
+    text = prompt.casefold().replace("ё", "е")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return " ".join(text.split())
+
+
+def make_cache_key(prompt: str, model: str, system_message: str) -> Tuple[str, str, str]:
+    """
+    Ключ кэша: нормализованный запрос + модель + хэш системной инструкции
+
+    Смена модели или системной инструкции автоматически делает старые ответы недоступными.
+    """
+    system_hash = hashlib.sha1(system_message.encode("utf-8")).hexdigest()
+    return normalize_prompt(prompt), model, system_hash
+
+
+class StreamFlight:
+    """
+    Выполняющийся потоковый запрос, к которому присоединяются такие же запросы
+
+    Первый запрос (ведущий) передает части ответа через push(), а присоединившиеся
+    получают их через follow() по мере поступления - к API уходит один запрос.
+    """
+
+    def __init__(self):
+        self.parts: List[str] = []
+        # Полный ответ или исключение ведущего запроса
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Исключение считается полученным, даже если никто не присоединился
+        self.result.add_done_callback(lambda future: future.cancelled() or future.exception())
+        self._changed = asyncio.Event()
+
+    def push(self, part: str):
+        """Очередная часть ответа ведущего запроса"""
+        self.parts.append(part)
+        self._changed.set()
+
+    def finish(self, answer: str):
+        """Ведущий запрос получил ответ полностью"""
+        if not self.result.done():
+            self.result.set_result(answer)
+        self._changed.set()
+
+    def fail(self, error: BaseException):
+        """Ведущий запрос завершился ошибкой или был прерван"""
+        if not self.result.done():
+            self.result.set_exception(error)
+        self._changed.set()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """
+        Части ответа с начала и до конца потока
+
+        Ошибка ведущего запроса пробрасывается после уже полученных частей.
+        """
+        index = 0
+        while True:
+            while index < len(self.parts):
+                yield self.parts[index]
+                index += 1
+            if self.result.done():
+                # Исключение ведущего запроса пробрасывается присоединившимся
+                self.result.result()
+                return
+            self._changed.clear()
+            await self._changed.wait()
+
+
+class ResponseCache:
+    """
+    LRU-кэш ответов со сроком жизни записей и ограничением по памяти
+
+    Одинаковые запросы, пришедшие одновременно, объединяются (single-flight):
+    к API уходит один запрос, а остальные ждут его результат.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0, max_bytes: int = 5 * 1024 * 1024):
+        """
+        :param max_entries: максимальное количество ответов в кэше
+        :param ttl: время жизни ответа в кэше (в секундах)
+        :param max_bytes: ограничение суммарного размера ответов и ключей (в байтах)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        # key -> (ответ, время истечения, размер записи)
+        # Порядок OrderedDict - порядок последнего использования (в конце самые свежие)
+        self.entries: "OrderedDict[Hashable, Tuple[str, float, int]]" = OrderedDict()
+        self.current_bytes = 0
+
+        # Выполняющиеся запросы: key -> задача (обычная генерация) или потоковый запрос,
+        # результат которых ждут все желающие
+        self.inflight: Dict[Hashable, Union[asyncio.Task, StreamFlight]] = {}
+
+        # Счетчики для настройки кэша на реальном трафике
+        self.hits = 0                # Ответ найден в кэше
+        self.misses = 0              # Ответа в кэше нет, выполнен запрос к API
+        self.coalesced = 0           # Запрос присоединился к уже выполняющемуся
+        self.evictions_lru = 0       # Вытеснено по количеству записей
+        self.evictions_ttl = 0       # Удалено по истечении срока жизни
+        self.evictions_memory = 0    # Вытеснено по ограничению памяти
+
+    @staticmethod
+    def _entry_size(key: Hashable, value: str) -> int:
+        """Приблизительный размер записи в байтах"""
+        key_size = sum(len(part.encode("utf-8")) for part in key) if isinstance(key, tuple) else len(str(key))
+        return key_size + len(value.encode("utf-8"))
+
+    def _remove(self, key: Hashable):
+        """Удаление записи с учетом занимаемой памяти"""
+        _, _, size = self.entries.pop(key)
+        self.current_bytes -= size
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """
+        Получение ответа из кэша
+
+        :return: Ответ или None, если его нет или срок жизни истек
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.evictions_ttl += 1
+            return None
+        # Помечаем запись как недавно использованную
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: str):
+        """Сохранение ответа с вытеснением старых записей при превышении лимитов"""
+        # Пустой ответ модели не кэшируем - иначе он отдавался бы как попадание
+        if not value:
+            return
+        size = self._entry_size(key, value)
+        # Ответ, который сам по себе больше лимита памяти, не кэшируем
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+
+        self.entries[key] = (value, time.monotonic() + self.ttl, size)
+        self.current_bytes += size
+
+        # Вытесняем давно не использованные записи
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.evictions_lru += 1
+        while self.current_bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions_memory += 1
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[str]]) -> str:
+        """
+        Ответ из кэша или результат compute() с объединением одинаковых запросов
+
+        Исключения из compute() пробрасываются всем ожидающим и не кэшируются.
+
+        :param key: Ключ кэша (см. make_cache_key)
+        :param compute: Функция, выполняющая запрос к API
+        :return: Ответ
+        """
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            if isinstance(task, StreamFlight):
+                # Такой же вопрос сейчас генерируется потоком - ждем полный ответ
+                return await asyncio.shield(task.result)
+        else:
+            self.misses += 1
+            # Запрос выполняется отдельной задачей: если первый ожидающий
+            # будет отменен, остальные все равно получат результат
+            task = asyncio.create_task(self._compute_and_store(key, compute))
+            self.inflight[key] = task
+
+        return await asyncio.shield(task)
+
+    def follow(self, key: Hashable) -> Optional[AsyncIterator[str]]:
+        """
+        Части ответа из кэша или от уже выполняющегося такого же запроса
+
+        Используется потоковой генерацией: при промахе она сама выполняет запрос,
+        зарегистрировав его через start_stream().
+
+        :return: Итератор частей ответа или None, если ответа нет и такой запрос не выполняется
+        """
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return self._single(cached)
+
+        entry = self.inflight.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.coalesced += 1
+        if isinstance(entry, StreamFlight):
+            return entry.follow()
+        return self._awaited(entry)
+
+    @staticmethod
+    async def _single(answer: str) -> AsyncIterator[str]:
+        yield answer
+
+    @staticmethod
+    async def _awaited(task: asyncio.Task) -> AsyncIterator[str]:
+        yield await asyncio.shield(task)
+
+    def start_stream(self, key: Hashable) -> Optional[StreamFlight]:
+        """
+        Регистрация потокового запроса, к которому присоединятся такие же запросы
+
+        Регистрируется до запроса к API. Ведущий запрос обязан завершить его через
+        finish_stream() или fail_stream() - в том числе при таймауте и отмене.
+
+        :return: Потоковый запрос или None, если такой запрос уже выполняется
+        """
+        if key in self.inflight:
+            return None
+        flight = StreamFlight()
+        self.inflight[key] = flight
+        return flight
+
+    def finish_stream(self, key: Hashable, flight: StreamFlight, answer: str):
+        """Успешное завершение потокового запроса: ответ сохраняется в кэш"""
+        self.set(key, answer)
+        self._release(key, flight)
+        flight.finish(answer)
+
+    def fail_stream(self, key: Hashable, flight: StreamFlight, error: BaseException):
+        """Потоковый запрос завершился ошибкой: ответ не кэшируется, ожидающие получают ошибку"""
+        self._release(key, flight)
+        flight.fail(error)
+
+    def _release(self, key: Hashable, flight: StreamFlight):
+        if self.inflight.get(key) is flight:
+            del self.inflight[key]
+
+    async def _compute_and_store(self, key: Hashable, compute: Callable[[], Awaitable[str]]) -> str:
+        """Выполнение запроса и сохранение успешного ответа в кэш"""
+        try:
+            value = await compute()
+            self.set(key, value)
+            return value
+        finally:
+            self.inflight.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Показатели работы кэша
+
+        :return: Словарь с размером кэша, попаданиями, промахами и вытеснениями
+        """
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "evictions_lru": self.evictions_lru,
+            "evictions_ttl": self.evictions_ttl,
+            "evictions_memory": self.evictions_memory,
+        }
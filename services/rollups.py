@@ -0,0 +1,322 @@
+import datetime
+from config import config
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+
+# Сколько дней хранятся пары (день, пользователь) в daily_users: не меньше самого длинного окна
+# активных пользователей (month в services/active_users.py), по которому идет точная сверка с оценками
+DAILY_USERS_RETENTION_DAYS = 30
+
+
+def rollup_table(suffix: str) -> str:
+    """
+    Имя таблицы агрегатов, производное от имени таблицы логов
+
+    :param suffix: Суффикс таблицы (daily_stats, daily_users, user_stats, totals)
+    :return: Полное имя таблицы
+    """
+    return f"{config.bot.basic_logs_db_table_name}_{suffix}"
+
+
+async def create_rollup_tables(conn):
+    """
+    Создание таблиц агрегатов для /stats
+
+    - daily_stats - количество сообщений, событий и активных пользователей за день,
+                    а также пользователей, для которых этот день - последний активный
+                    (их сумма по дням окна - точное количество активных за окно);
+    - daily_users - пары (день, пользователь) за последние DAILY_USERS_RETENTION_DAYS дней,
+                    по ним считаются активные за период;
+    - user_stats  - количество сообщений и событий каждого пользователя;
+    - totals      - одна строка с общими счетчиками.
+
+    :param conn: Соединение asyncpg
+    """
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {rollup_table("daily_stats")} (
+            day DATE PRIMARY KEY,                     -- День
+            messages BIGINT NOT NULL DEFAULT 0,       -- Сообщений за день
+            events BIGINT NOT NULL DEFAULT 0,         -- Всех событий за день
+            active_users BIGINT NOT NULL DEFAULT 0,   -- Уникальных пользователей за день
+            last_active BIGINT NOT NULL DEFAULT 0     -- Пользователей, последний раз активных в этот день
+        );
+
+        CREATE TABLE IF NOT EXISTS {rollup_table("daily_users")} (
+            day DATE NOT NULL,                        -- День
+            user_id BIGINT NOT NULL,                  -- Пользователь, активный в этот день
+            PRIMARY KEY (day, user_id)
+        );
+
+        CREATE TABLE IF NOT EXISTS {rollup_table("user_stats")} (
+            user_id BIGINT PRIMARY KEY,               -- ID пользователя
+            username VARCHAR(255),                    -- Последнее известное имя пользователя
+            messages BIGINT NOT NULL DEFAULT 0,       -- Всего сообщений
+            events BIGINT NOT NULL DEFAULT 0,         -- Всего событий
+            first_seen TIMESTAMP NOT NULL,            -- Первое событие
+            last_seen TIMESTAMP NOT NULL              -- Последнее событие
+        );
+
+        CREATE TABLE IF NOT EXISTS {rollup_table("totals")} (
+            id SMALLINT PRIMARY KEY CHECK (id = 1),   -- Единственная строка
+            users BIGINT NOT NULL DEFAULT 0,          -- Всего уникальных пользователей
+            messages BIGINT NOT NULL DEFAULT 0,       -- Всего сообщений
+            events BIGINT NOT NULL DEFAULT 0          -- Всего событий
+        );
+
+        INSERT INTO {rollup_table("totals")} (id) VALUES (1) ON CONFLICT (id) DO NOTHING;
+
+        -- Индекс для выборки самых активных пользователей без сортировки всей таблицы
+        CREATE INDEX IF NOT EXISTS idx_user_stats_events ON {rollup_table("user_stats")} (events DESC);
+    """)
+    await _add_last_active(conn)
+
+
+async def _add_last_active(conn):
+    """Добавление столбца last_active в таблицу, созданную до его появления, с заполнением по user_stats"""
+    exists = await conn.fetchval("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = $1 AND column_name = 'last_active'
+    """, rollup_table("daily_stats"))
+    if exists:
+        return
+    async with conn.transaction():
+        await conn.execute(f"""
+            ALTER TABLE {rollup_table("daily_stats")} ADD COLUMN last_active BIGINT NOT NULL DEFAULT 0
+        """)
+        await _fill_last_active(conn)
+
+
+async def _fill_last_active(conn):
+    """Пересчет last_active по последнему событию каждого пользователя"""
+    await conn.execute(f"""
+        UPDATE {rollup_table("daily_stats")} d
+        SET last_active = c.users
+        FROM (
+            SELECT last_seen::date AS day, COUNT(*) AS users
+            FROM {rollup_table("user_stats")}
+            GROUP BY 1
+        ) c
+        WHERE d.day = c.day
+    """)
+
+
+def daily_users_border(today: Optional[datetime.date] = None) -> datetime.date:
+    """Первый день, пары которого хранятся в daily_users (более ранние удаляются)"""
+    today = today or datetime.datetime.now().date()
+    return today - datetime.timedelta(days=DAILY_USERS_RETENTION_DAYS)
+
+
+async def prune_daily_users(conn, today: Optional[datetime.date] = None) -> int:
+    """
+    Удаление пар (день, пользователь) старше срока хранения
+
+    Без этого daily_users растет на число активных пользователей каждый день, хотя нужны
+    только последние DAILY_USERS_RETENTION_DAYS дней. Выполняется при обслуживании секций.
+
+    :param conn: Соединение asyncpg
+    :param today: Текущий день (по умолчанию - сегодня)
+    :return: Количество удаленных строк
+    """
+    if not await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", rollup_table("daily_users")):
+        return 0
+    status = await conn.execute(f"""
+        DELETE FROM {rollup_table("daily_users")} WHERE day < $1
+    """, daily_users_border(today))
+    # Статус команды вида "DELETE 42"
+    return int(status.split()[-1])
+
+
+async def apply_events(conn, batch: List[tuple]):
+    """
+    Инкрементальное обновление агрегатов по пачке записанных событий
+
+    Пачка сначала сворачивается в памяти, а затем каждая таблица агрегатов обновляется
+    одним запросом. Вызывается в той же транзакции, что и запись самих событий.
+
+    Пары (день, пользователь) для дней старше срока хранения daily_users не записываются
+    (их бы удалило следующее обслуживание), поэтому запоздавшие события таких дней
+    не увеличивают active_users этих дней; точные значения восстанавливает backfill().
+
+    :param conn: Соединение asyncpg (внутри транзакции)
+    :param batch: События в формате (timestamp, event_type, user_id, username, chat_id, text, data)
+    """
+    if not batch:
+        return
+    border = daily_users_border()
+
+    # Сворачиваем пачку по дням и пользователям
+    days: Dict = defaultdict(lambda: [0, 0])        # day -> [сообщений, событий]
+    day_users = set()                               # (day, user_id)
+    users: Dict[int, list] = {}                     # user_id -> [username, сообщений, событий, first, last]
+    total_messages = 0
+
+    for timestamp, event_type, user_id, username, *_ in batch:
+        day = timestamp.date()
+        is_message = 1 if event_type == "message" else 0
+        total_messages += is_message
+
+        days[day][0] += is_message
+        days[day][1] += 1
+        if day >= border:
+            day_users.add((day, user_id))
+
+        user = users.get(user_id)
+        if user is None:
+            users[user_id] = [username, is_message, 1, timestamp, timestamp]
+        else:
+            user[0] = username or user[0]
+            user[1] += is_message
+            user[2] += 1
+            user[3] = min(user[3], timestamp)
+            user[4] = max(user[4], timestamp)
+
+    # Ключи сортируются, чтобы несколько процессов блокировали строки в одном порядке
+    new_pairs = sorted(day_users)
+    rows = await conn.fetch(f"""
+        INSERT INTO {rollup_table("daily_users")} (day, user_id)
+        SELECT * FROM unnest($1::date[], $2::bigint[])
+        ON CONFLICT DO NOTHING
+        RETURNING day
+    """, [day for day, _ in new_pairs], [user_id for _, user_id in new_pairs])
+
+    # Активные за день увеличиваются только на действительно новых пользователей дня
+    new_active: Dict = defaultdict(int)
+    for row in rows:
+        new_active[row["day"]] += 1
+
+    # Сдвиг последнего активного дня пользователей: -1 на прежнем дне, +1 на новом
+    last_active: Dict = defaultdict(int)
+
+    # Новые пользователи вставляются отдельно от существующих: у существующих нужна
+    # прежняя дата последнего события, а ON CONFLICT DO UPDATE не возвращает старые значения
+    user_keys = sorted(users)
+    columns = [[users[u][i] for u in user_keys] for i in range(5)]
+    rows = await conn.fetch(f"""
+        INSERT INTO {rollup_table("user_stats")} (user_id, username, messages, events, first_seen, last_seen)
+        SELECT * FROM unnest($1::bigint[], $2::varchar[], $3::bigint[], $4::bigint[],
+                             $5::timestamp[], $6::timestamp[])
+        ON CONFLICT (user_id) DO NOTHING
+        RETURNING user_id, last_seen
+    """, user_keys, *columns)
+    new_users = len(rows)
+    inserted = set()
+    for row in rows:
+        inserted.add(row["user_id"])
+        last_active[row["last_seen"].date()] += 1
+
+    if new_users < len(user_keys):
+        # Прежние значения читаются подзапросом с FOR UPDATE: если строку одновременно меняет
+        # другой процесс, подзапрос дождется его и вернет уже обновленную строку
+        existing = [i for i, user_id in enumerate(user_keys) if user_id not in inserted]
+        rows = await conn.fetch(f"""
+            UPDATE {rollup_table("user_stats")} AS u SET
+                username = COALESCE(n.username, u.username),
+                messages = u.messages + n.messages,
+                events = u.events + n.events,
+                first_seen = LEAST(u.first_seen, n.first_seen),
+                last_seen = GREATEST(u.last_seen, n.last_seen)
+            FROM unnest($1::bigint[], $2::varchar[], $3::bigint[], $4::bigint[],
+                        $5::timestamp[], $6::timestamp[])
+                     AS n(user_id, username, messages, events, first_seen, last_seen),
+                 (SELECT user_id, last_seen FROM {rollup_table("user_stats")}
+                  WHERE user_id = ANY($1::bigint[])
+                  ORDER BY user_id
+                  FOR UPDATE) AS old
+            WHERE u.user_id = n.user_id AND old.user_id = n.user_id
+            RETURNING old.last_seen AS previous, u.last_seen
+        """, [user_keys[i] for i in existing], *[[column[i] for i in existing] for column in columns])
+        for row in rows:
+            previous, current = row["previous"].date(), row["last_seen"].date()
+            if current > previous:
+                last_active[previous] -= 1
+                last_active[current] += 1
+
+    day_keys = sorted(days)
+    await conn.execute(f"""
+        INSERT INTO {rollup_table("daily_stats")} AS d (day, messages, events, active_users, last_active)
+        SELECT * FROM unnest($1::date[], $2::bigint[], $3::bigint[], $4::bigint[], $5::bigint[])
+        ON CONFLICT (day) DO UPDATE SET
+            messages = d.messages + EXCLUDED.messages,
+            events = d.events + EXCLUDED.events,
+            active_users = d.active_users + EXCLUDED.active_users,
+            last_active = d.last_active + EXCLUDED.last_active
+    """, day_keys, [days[d][0] for d in day_keys], [days[d][1] for d in day_keys],
+        [new_active[d] for d in day_keys], [last_active.pop(d, 0) for d in day_keys])
+
+    # Прежние последние дни, которых нет в пачке (строки этих дней уже есть)
+    previous_days = sorted(day for day, delta in last_active.items() if delta)
+    if previous_days:
+        await conn.execute(f"""
+            UPDATE {rollup_table("daily_stats")} AS d
+            SET last_active = d.last_active + c.delta
+            FROM unnest($1::date[], $2::bigint[]) AS c(day, delta)
+            WHERE d.day = c.day
+        """, previous_days, [last_active[d] for d in previous_days])
+
+    await conn.execute(f"""
+        UPDATE {rollup_table("totals")}
+        SET users = users + $1, messages = messages + $2, events = events + $3
+        WHERE id = 1
+    """, new_users, total_messages, len(batch))
+
+
+async def backfill(conn) -> Tuple[int, int]:
+    """
+    Полный пересчет агрегатов по существующей таблице логов
+
+    Таблица логов блокируется от записи на время пересчета, чтобы новые события
+    не были ни потеряны, ни посчитаны дважды: фоновая запись просто подождет.
+    Активные за день считаются по логам за все дни, а пары (день, пользователь)
+    восстанавливаются только за срок хранения daily_users.
+
+    :param conn: Соединение asyncpg
+    :return: (количество пользователей, количество событий)
+    """
+    logs = config.bot.basic_logs_db_table_name
+    async with conn.transaction():
+        await conn.execute(f"LOCK TABLE {logs} IN SHARE MODE")
+        await conn.execute(f"""
+            TRUNCATE {rollup_table("daily_stats")}, {rollup_table("daily_users")},
+                     {rollup_table("user_stats")}
+        """)
+
+        await conn.execute(f"""
+            INSERT INTO {rollup_table("daily_users")} (day, user_id)
+            SELECT DISTINCT timestamp::date, user_id FROM {logs}
+            WHERE timestamp >= $1
+        """, daily_users_border())
+
+        await conn.execute(f"""
+            INSERT INTO {rollup_table("daily_stats")} (day, messages, events, active_users)
+            SELECT timestamp::date,
+                   COUNT(*) FILTER (WHERE event_type = 'message'),
+                   COUNT(*),
+                   COUNT(DISTINCT user_id)
+            FROM {logs}
+            GROUP BY 1
+        """)
+
+        # Для имени берем значение из последнего события пользователя
+        await conn.execute(f"""
+            INSERT INTO {rollup_table("user_stats")} (user_id, username, messages, events, first_seen, last_seen)
+            SELECT user_id,
+                   (ARRAY_AGG(username ORDER BY timestamp DESC) FILTER (WHERE username IS NOT NULL))[1],
+                   COUNT(*) FILTER (WHERE event_type = 'message'),
+                   COUNT(*),
+                   MIN(timestamp),
+                   MAX(timestamp)
+            FROM {logs}
+            GROUP BY user_id
+        """)
+        await _fill_last_active(conn)
+
+        users, events = await conn.fetchrow(f"""
+            UPDATE {rollup_table("totals")} SET
+                users = (SELECT COUNT(*) FROM {rollup_table("user_stats")}),
+                messages = (SELECT COALESCE(SUM(messages), 0) FROM {rollup_table("daily_stats")}),
+                events = (SELECT COALESCE(SUM(events), 0) FROM {rollup_table("daily_stats")})
+            WHERE id = 1
+            RETURNING users, events
+        """)
+    return users, events
@@ -0,0 +1,81 @@
+from config import config
+from services.rollups import create_rollup_tables
+from services.conversation import create_conversation_table
+from services.broadcast import create_broadcast_tables
+from services.partitions import is_partitioned, partition_manager
+
+
+async def create_tables(conn):
+    """
+    Создание таблиц логов и индексов, если они еще не существуют
+
+    Используется и скриптом инициализации БД, и фоновой записью логов,
+    чтобы схема описывалась в одном месте.
+
+    Таблицы логов и ошибок секционируются по времени события: устаревшие данные удаляются
+    целыми секциями, а запросы с условием на timestamp читают только нужные секции.
+    Существующие таблицы старой схемы не изменяются - для их переноса
+    служит utils/migrate_partitions.py.
+
+    :param conn: Соединение asyncpg
+    """
+    # Таблица для основных логов
+    # Эта таблица хранит информацию о сообщениях и взаимодействиях пользователей с ботом
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {config.bot.basic_logs_db_table_name} (
+            id BIGSERIAL,                             -- Уникальный ID записи
+            timestamp TIMESTAMP NOT NULL DEFAULT NOW(), -- Время события
+            event_type VARCHAR(50) NOT NULL,          -- Тип события (message, callback и т.д.)
+            user_id BIGINT NOT NULL,                  -- ID пользователя Telegram
+            username VARCHAR(255),                    -- Имя пользователя Telegram (необязательное)
+            chat_id BIGINT NOT NULL,                  -- ID чата
+            text TEXT,                                -- Текст сообщения/запроса
+            data JSONB,                               -- Дополнительные данные в формате JSON
+            PRIMARY KEY (id, timestamp)               -- Ключ секционированной таблицы включает timestamp
+        ) PARTITION BY RANGE (timestamp)
+    """)
+
+    # Таблица для логирования ошибок
+    # Эта таблица хранит информацию об ошибках и исключениях, возникающих при работе бота
+    await conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {config.bot.errors_logs_db_table_name} (
+            id BIGSERIAL,                             -- Уникальный ID записи
+            timestamp TIMESTAMP NOT NULL DEFAULT NOW(), -- Время ошибки
+            level VARCHAR(50) NOT NULL,               -- Уровень ошибки (ERROR, CRITICAL и т.д.)
+            module VARCHAR(255),                      -- Модуль, в котором произошла ошибка
+            function VARCHAR(255),                    -- Функция, в которой произошла ошибка
+            error_message TEXT,                       -- Текст сообщения об ошибке
+            traceback TEXT,                           -- Трассировка стека вызовов
+            user_id BIGINT,                           -- ID пользователя (если ошибка связана с пользователем)
+            extra_data JSONB,                         -- Дополнительные данные в формате JSON
+            PRIMARY KEY (id, timestamp)               -- Ключ секционированной таблицы включает timestamp
+        ) PARTITION BY RANGE (timestamp)
+    """)
+
+    # Секция по умолчанию принимает события, для которых еще нет секции по времени,
+    # а секции текущего и следующих периодов создаются сразу
+    for table in (config.bot.basic_logs_db_table_name, config.bot.errors_logs_db_table_name):
+        if await is_partitioned(conn, table):
+            await conn.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+            await partition_manager.prepare(conn, table)
+
+    # Индексы ускоряют выборку данных по часто используемым полям.
+    # Индекс секционированной таблицы автоматически создается на каждой ее секции
+    await conn.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_logs_user_id ON {config.bot.basic_logs_db_table_name} (user_id);
+        CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON {config.bot.basic_logs_db_table_name} (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_logs_event_type ON {config.bot.basic_logs_db_table_name} (event_type);
+
+        CREATE INDEX IF NOT EXISTS idx_errors_timestamp ON {config.bot.errors_logs_db_table_name} (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_errors_level ON {config.bot.errors_logs_db_table_name} (level);
+        CREATE INDEX IF NOT EXISTS idx_errors_user_id ON {config.bot.errors_logs_db_table_name} (user_id);
+    """)
+
+    # Таблицы агрегатов для /stats, которые обновляются вместе с записью логов
+    await create_rollup_tables(conn)
+
+    # Таблица диалогов, вытесненных из памяти
+    await create_conversation_table(conn)
+
+    # Таблицы рассылок и пользователей, заблокировавших бота
+    await create_broadcast_tables(conn)
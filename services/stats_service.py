@@ -1,208 +1,240 @@
+import time
+import asyncio
 import logging
-import psycopg2
 import datetime
 from config import config
+from services.db import db
+from services.metrics import time_db_query
+from typing import Any, Dict, Optional
+from services.rollups import rollup_table
 
 
 # Получаем экземпляр логгера
 logger = logging.getLogger('bot_logger')
 
 
+# Пустая статистика - возвращается, если таблиц еще нет или БД недоступна
+EMPTY_USER_STATS = {
+    "total_users": 0,
+    "active_today": 0,
+    "active_week": 0,
+    "top_users": []
+}
+EMPTY_MESSAGE_STATS = {
+    "total_messages": 0,
+    "today_messages": 0,
+    "week_messages": 0,
+    "days_stats": []
+}
+
+
+def user_stats_query() -> str:
+    """
+    Запрос статистики по пользователям ($1 - сегодня, $2 - неделю назад)
+
+    Все показатели собираются подзапросами в одну строку - один обмен с БД.
+    Активные за неделю - сумма last_active по 8 дневным строкам: каждый пользователь
+    учтен ровно в одном дне (последнем активном), поэтому сумма точная и не зависит
+    от количества пользователей.
+    Топ пользователей возвращается массивом записей (username, user_id, count)
+    """
+    return f"""
+        SELECT
+            (SELECT users FROM {rollup_table("totals")} WHERE id = 1) AS total_users,
+            (SELECT active_users FROM {rollup_table("daily_stats")} WHERE day = $1) AS active_today,
+            (SELECT SUM(last_active) FROM {rollup_table("daily_stats")}
+             WHERE day >= $2)::bigint AS active_week,
+            ARRAY(
+                SELECT ROW(username, user_id, events)
+                FROM {rollup_table("user_stats")}
+                ORDER BY events DESC
+                LIMIT 5
+            ) AS top_users
+    """
+
+
+def message_stats_query() -> str:
+    """
+    Запрос статистики по сообщениям ($1 - сегодня, $2 - неделю назад)
+
+    Дневные строки за неделю читаются один раз (CTE), из них же считаются
+    сегодняшние сообщения, сумма за неделю и распределение по дням недели
+    """
+    return f"""
+        WITH week AS (
+            SELECT day, messages
+            FROM {rollup_table("daily_stats")}
+            WHERE day >= $2
+        )
+        SELECT
+            (SELECT messages FROM {rollup_table("totals")} WHERE id = 1) AS total_messages,
+            (SELECT SUM(messages) FILTER (WHERE day = $1) FROM week)::bigint AS today_messages,
+            (SELECT SUM(messages) FROM week)::bigint AS week_messages,
+            ARRAY(
+                SELECT ROW(day_of_week, count)
+                FROM (
+                    SELECT EXTRACT(DOW FROM day)::int AS day_of_week, SUM(messages)::bigint AS count
+                    FROM week
+                    WHERE messages > 0
+                    GROUP BY day_of_week
+                ) dow
+                ORDER BY day_of_week
+            ) AS days_stats
+    """
+
+
+async def _fetch_user_stats(today: datetime.date) -> Dict[str, Any]:
+    """
+    Статистика по пользователям одним запросом к таблицам агрегатов
+
+    :raises Exception: при ошибке БД (обрабатывается вызывающей стороной)
+    """
+    week_ago = today - datetime.timedelta(days=7)
+    with time_db_query("stats_users"):
+        async with db.acquire() as conn:
+            row = await conn.fetchrow(user_stats_query(), today, week_ago)
+
+    return {
+        "total_users": row["total_users"] or 0,
+        "active_today": row["active_today"] or 0,
+        "active_week": row["active_week"] or 0,
+        "top_users": row["top_users"]
+    }
+
+
+async def _fetch_message_stats(today: datetime.date) -> Dict[str, Any]:
+    """
+    Статистика по сообщениям одним запросом к таблицам агрегатов
+
+    :raises Exception: при ошибке БД (обрабатывается вызывающей стороной)
+    """
+    week_ago = today - datetime.timedelta(days=7)
+    with time_db_query("stats_messages"):
+        async with db.acquire() as conn:
+            row = await conn.fetchrow(message_stats_query(), today, week_ago)
+
+    return {
+        "total_messages": row["total_messages"] or 0,
+        "today_messages": row["today_messages"] or 0,
+        "week_messages": row["week_messages"] or 0,
+        "days_stats": row["days_stats"]
+    }
+
+
 async def get_user_stats():
     """
     Получение статистики по пользователям из базы данных
-    
+
     :return: Словарь со статистикой
     """
-    conn = None
     try:
-        # Устанавливаем соединение с базой данных PostgreSQL
-        conn = psycopg2.connect(
-            host=config.bot.db_host,
-            port=config.bot.db_port,
-            database=config.bot.db_name,
-            user=config.bot.db_user,
-            password=config.bot.db_password
-        )
-        
-        with conn.cursor() as cursor:
-            # Проверяем существование таблицы в базе данных
-            # Это предотвращает ошибки, если таблица ещё не создана
-            cursor.execute(f"""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = '{config.bot.basic_logs_db_table_name}'
-                )
-            """)
-            table_exists = cursor.fetchone()[0]
-            
-            # Если таблица не существует, возвращаем пустую статистику
-            if not table_exists:
-                return {
-                    "total_users": 0,
-                    "active_today": 0,
-                    "active_week": 0,
-                    "top_users": []
-                }
-                
-            # Общее количество уникальных пользователей
-            # COUNT(DISTINCT user_id) считает только уникальные user_id
-            cursor.execute(f"""
-                SELECT COUNT(DISTINCT user_id) 
-                FROM {config.bot.basic_logs_db_table_name}
-            """)
-            total_users = cursor.fetchone()[0]
-            
-            # Количество активных пользователей за сегодня
-            # Фильтруем по дате текущего дня
-            today = datetime.datetime.now().date()
-            cursor.execute(f"""
-                SELECT COUNT(DISTINCT user_id) 
-                FROM {config.bot.basic_logs_db_table_name}
-                WHERE DATE(timestamp) = %s
-            """, (today,))
-            active_today = cursor.fetchone()[0]
-            
-            # Количество активных пользователей за неделю
-            # Фильтруем по дате начиная с 7 дней назад
-            week_ago = today - datetime.timedelta(days=7)
-            cursor.execute(f"""
-                SELECT COUNT(DISTINCT user_id) 
-                FROM {config.bot.basic_logs_db_table_name}
-                WHERE DATE(timestamp) >= %s
-            """, (week_ago,))
-            active_week = cursor.fetchone()[0]
-            
-            # Топ-5 активных пользователей
-            # Группируем по пользователям и сортируем по количеству сообщений
-            cursor.execute(f"""
-                SELECT username, user_id, COUNT(*) as msg_count
-                FROM {config.bot.basic_logs_db_table_name}
-                GROUP BY username, user_id
-                ORDER BY msg_count DESC
-                LIMIT 5
-            """)
-            top_users = cursor.fetchall()
-            
-            # Возвращаем словарь со всей собранной статистикой
-            return {
-                "total_users": total_users,
-                "active_today": active_today,
-                "active_week": active_week,
-                "top_users": top_users
-            }
-    
+        return await _fetch_user_stats(datetime.datetime.now().date())
     except Exception as e:
-        # Обрабатываем любые возможные ошибки и логируем их
+        # Обрабатываем любые возможные ошибки (в том числе отсутствие таблиц) и логируем их
         logger.error(f"Ошибка получения статистики пользователей: {e}")
         # В случае ошибки возвращаем пустую статистику
-        return {
-            "total_users": 0,
-            "active_today": 0,
-            "active_week": 0,
-            "top_users": []
-        }
-    
-    finally:
-        # Закрываем соединение с БД в любом случае, если оно было установлено
-        if conn:
-            conn.close()
+        return dict(EMPTY_USER_STATS)
 
 
 async def get_message_stats():
     """
     Получение статистики по сообщениям из базы данных
-    
+
     :return: Словарь со статистикой
     """
-    conn = None
     try:
-        # Устанавливаем соединение с базой данных
-        conn = psycopg2.connect(
-            host=config.bot.db_host,
-            port=config.bot.db_port,
-            database=config.bot.db_name,
-            user=config.bot.db_user,
-            password=config.bot.db_password
-        )
-        
-        with conn.cursor() as cursor:
-            # Проверяем существование таблицы
-            cursor.execute(f"""
-                SELECT EXISTS (
-                    SELECT FROM information_schema.tables 
-                    WHERE table_name = '{config.bot.basic_logs_db_table_name}'
-                )
-            """)
-            table_exists = cursor.fetchone()[0]
-            
-            # Если таблица не существует, возвращаем пустую статистику
-            if not table_exists:
-                return {
-                    "total_messages": 0,
-                    "today_messages": 0,
-                    "week_messages": 0,
-                    "days_stats": []
-                }
-                
-            # Общее количество сообщений
-            # Фильтруем только по типу события 'message'
-            cursor.execute(f"""
-                SELECT COUNT(*) 
-                FROM {config.bot.basic_logs_db_table_name}
-                WHERE event_type = 'message'
-            """)
-            total_messages = cursor.fetchone()[0]
-            
-            # Количество сообщений за сегодня
-            today = datetime.datetime.now().date()
-            cursor.execute(f"""
-                SELECT COUNT(*) 
-                FROM {config.bot.basic_logs_db_table_name}
-                WHERE event_type = 'message' AND DATE(timestamp) = %s
-            """, (today,))
-            today_messages = cursor.fetchone()[0]
-            
-            # Количество сообщений за неделю
-            week_ago = today - datetime.timedelta(days=7)
-            cursor.execute(f"""
-                SELECT COUNT(*) 
-                FROM {config.bot.basic_logs_db_table_name}
-                WHERE event_type = 'message' AND DATE(timestamp) >= %s
-            """, (week_ago,))
-            week_messages = cursor.fetchone()[0]
-            
-            # Статистика по дням недели
-            # EXTRACT(DOW FROM timestamp) извлекает день недели (0-6, где 0 = воскресенье)
-            cursor.execute(f"""
-                SELECT EXTRACT(DOW FROM timestamp) as day_of_week, COUNT(*) as count
-                FROM {config.bot.basic_logs_db_table_name}
-                WHERE event_type = 'message' AND timestamp >= %s
-                GROUP BY day_of_week
-                ORDER BY day_of_week
-            """, (week_ago,))
-            days_stats = cursor.fetchall()
-            
-            # Возвращаем словарь со всей собранной статистикой
-            return {
-                "total_messages": total_messages,
-                "today_messages": today_messages,
-                "week_messages": week_messages,
-                "days_stats": days_stats
-            }
-    
+        return await _fetch_message_stats(datetime.datetime.now().date())
     except Exception as e:
-        # Обрабатываем любые возможные ошибки и логируем их
+        # Обрабатываем любые возможные ошибки (в том числе отсутствие таблиц) и логируем их
         logger.error(f"Ошибка получения статистики сообщений: {e}")
         # В случае ошибки возвращаем пустую статистику
+        return dict(EMPTY_MESSAGE_STATS)
+
+
+class StatsCache:
+    """
+    Кэш собранной статистики с коротким сроком жизни
+
+    Повторные /stats от нескольких администраторов в пределах ttl отдаются из памяти,
+    а одновременные запросы при устаревшем кэше ждут одно общее обновление.
+    """
+
+    def __init__(self, ttl: float = 30.0):
+        """
+        :param ttl: время жизни собранной статистики (в секундах)
+        """
+        self.ttl = ttl
+        self.value: Optional[Dict[str, Any]] = None
+        self.updated_at = 0.0        # Время обновления по монотонным часам
+        self.lock: Optional[asyncio.Lock] = None
+
+    async def get(self) -> Dict[str, Any]:
+        """
+        Статистика из кэша или из БД, если кэш устарел
+
+        :return: Словарь с ключами users, messages, generated_at, age и cached
+        """
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        cached = True
+        if not self._fresh():
+            async with self.lock:
+                # Пока ждали блокировку, кэш мог обновить другой запрос
+                if not self._fresh():
+                    value = await self._collect()
+                    cached = False
+                    if value is None:
+                        # Ошибку БД не кэшируем: следующий /stats попробует снова
+                        return {
+                            "users": dict(EMPTY_USER_STATS),
+                            "messages": dict(EMPTY_MESSAGE_STATS),
+                            "generated_at": datetime.datetime.now(),
+                            "age": 0.0,
+                            "cached": False,
+                        }
+                    self.value = value
+                    self.updated_at = time.monotonic()
+
+        return {
+            **self.value,
+            "age": time.monotonic() - self.updated_at,
+            "cached": cached,
+        }
+
+    def _fresh(self) -> bool:
+        """Можно ли отдать статистику из кэша"""
+        return self.value is not None and time.monotonic() - self.updated_at < self.ttl
+
+    @staticmethod
+    async def _collect() -> Optional[Dict[str, Any]]:
+        """Сбор статистики: части по пользователям и сообщениям выполняются параллельно"""
+        today = datetime.datetime.now().date()
+        try:
+            # Каждая часть берет свое соединение из пула, поэтому запросы идут одновременно
+            users, messages = await asyncio.gather(
+                _fetch_user_stats(today),
+                _fetch_message_stats(today),
+            )
+        except Exception as e:
+            logger.error(f"Ошибка получения статистики: {e}")
+            return None
         return {
-            "total_messages": 0,
-            "today_messages": 0,
-            "week_messages": 0,
-            "days_stats": []
+            "users": users,
+            "messages": messages,
+            "generated_at": datetime.datetime.now(),
         }
-    
-    finally:
-        # Закрываем соединение с БД в любом случае, если оно было установлено
-        if conn:
-            conn.close()
+
+
+# Общий кэш статистики для команды /stats
+stats_cache = StatsCache(ttl=config.bot.stats_cache_ttl)
+
+
+async def get_stats() -> Dict[str, Any]:
+    """
+    Полная статистика для /stats с кэшированием
+
+    :return: Словарь с ключами users (см. get_user_stats), messages (см. get_message_stats),
+             generated_at (время сбора), age (возраст в секундах) и cached (взято из кэша)
+    """
+    return await stats_cache.get()
@@ -0,0 +1,273 @@
+import abc
+import time
+import asyncio
+import logging
+from config import config
+from utils.gcra import GCRALimiter
+from typing import Any, Dict, Hashable, List, Set, Tuple
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Скрипт GCRA выполняется на сервере Redis атомарно: чтение, проверка и запись состояния
+# происходят без гонок между процессами. Время берется с сервера (TIME), поэтому расхождение
+# часов между машинами с ботом не влияет на ограничение.
+# KEYS[1] - ключ пользователя
+# ARGV[1] - время восстановления одной единицы, ARGV[2] - запас (burst / rate),
+# ARGV[3] - стоимость запроса, ARGV[4] - стоимость уже разрешенных локально запросов
+GCRA_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local interval = tonumber(ARGV[1])
+local burst_offset = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local pending = tonumber(ARGV[4])
+
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+-- Запросы, разрешенные локально, учитываются безусловно - они уже обработаны
+tat = tat + pending * interval
+
+local new_tat = tat + cost * interval
+local allow_at = new_tat - burst_offset
+local allowed = 0
+local retry_after = 0
+if now >= allow_at then
+    allowed = 1
+    tat = new_tat
+else
+    retry_after = allow_at - now
+end
+
+-- Ключ живет, пока запас не восстановится полностью: затем он совпадает с отсутствующим
+local ttl = math.ceil((tat - now) * 1000)
+if ttl > 0 then
+    redis.call('SET', KEYS[1], tostring(tat), 'PX', ttl)
+end
+
+-- Дробные числа возвращаются строками: Redis отбрасывает дробную часть чисел из Lua
+local remaining = (burst_offset - (tat - now)) / interval
+return {allowed, tostring(retry_after), tostring(remaining)}
+"""
+
+
+class ThrottleStorage(abc.ABC):
+    """
+    Хранилище состояния ограничения частоты запросов
+
+    Реализации решают, разрешить ли запрос стоимостью cost для ключа,
+    и сами хранят состояние алгоритма GCRA.
+    """
+
+    @abc.abstractmethod
+    async def hit(self, key: Hashable, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        Попытка потратить cost единиц лимита
+
+        :param key: ключ ограничения (обычно ID пользователя)
+        :param cost: стоимость запроса
+        :return: (разрешено ли, через сколько секунд запрос будет разрешен)
+        """
+
+    async def close(self):
+        """Освобождение ресурсов (хук остановки бота)"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Показатели работы хранилища"""
+        return {}
+
+
+class MemoryThrottleStorage(ThrottleStorage):
+    """
+    Состояние в памяти процесса (по умолчанию)
+
+    Самый быстрый вариант, но каждый процесс бота ведет свой учет,
+    а перезапуск сбрасывает все ограничения.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: float = 3.0):
+        """
+        :param rate: устойчивая скорость (единиц стоимости в секунду)
+        :param burst: сколько единиц можно потратить подряд после паузы
+        """
+        self.limiter = GCRALimiter(rate=rate, burst=burst)
+
+    async def hit(self, key: Hashable, cost: float = 1.0) -> Tuple[bool, float]:
+        return self.limiter.hit(key, cost)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "keys": len(self.limiter)}
+
+
+class RedisThrottleStorage(ThrottleStorage):
+    """
+    Общее состояние в Redis для нескольких процессов и реплик бота
+
+    Каждое решение принимается Lua-скриптом на сервере. Чтобы не обращаться к Redis
+    на каждое сообщение, пользователю с большим запасом выдается локальная "аренда":
+    lease_fraction оставшегося запаса можно тратить без обращения к серверу
+    в течение lease_ttl секунд. Потраченное по аренде передается на сервер со следующим
+    запросом. При N процессах пользователь в худшем случае получает сверх лимита
+    N * lease_fraction от своего запаса - поэтому аренда короткая и частичная.
+    Потраченное по истекшей аренде передается на сервер при очистке аренд (не реже
+    раза в lease_ttl при активности бота) и при остановке.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", rate: float = 1.0, burst: float = 3.0,
+                 prefix: str = "throttle:", lease_fraction: float = 0.5, lease_ttl: float = 1.0,
+                 client: Any = None):
+        """
+        :param url: адрес сервера Redis
+        :param rate: устойчивая скорость (единиц стоимости в секунду)
+        :param burst: сколько единиц можно потратить подряд после паузы
+        :param prefix: префикс ключей в Redis
+        :param lease_fraction: доля оставшегося запаса, доступная локально (0 - всегда спрашивать Redis)
+        :param lease_ttl: время жизни локальной аренды (в секундах)
+        :param client: готовый клиент Redis (вместо создания по url)
+        """
+        if client is None:
+            # Драйвер Redis нужен только для общего хранилища, поэтому он необязателен
+            # и импортируется только при его создании (не удлиняет запуск с хранилищем в памяти)
+            try:
+                import redis.asyncio as aioredis
+            except ImportError:
+                raise RuntimeError("Для THROTTLE_STORAGE=redis необходимо установить пакет redis")
+            client = aioredis.from_url(url)
+        self.client = client
+        self.script = client.register_script(GCRA_SCRIPT)
+
+        self.prefix = prefix
+        self.emission_interval = 1.0 / rate
+        self.burst_offset = burst / rate
+        self.lease_fraction = lease_fraction
+        self.lease_ttl = lease_ttl
+
+        # Ключ -> [окончание аренды, остаток аренды, потрачено по аренде]
+        self.leases: Dict[Hashable, List[float]] = {}
+        self.last_sweep = time.monotonic()
+        # Фоновые передачи потраченного по истекшим арендам
+        self.report_tasks: Set[asyncio.Task] = set()
+
+        # Счетчики для мониторинга
+        self.local_hits = 0          # Решения по локальной аренде
+        self.remote_hits = 0         # Решения сервера Redis
+        self.errors = 0              # Ошибки Redis (запрос в этом случае разрешается)
+        self.lost_spend = 0.0        # Потраченное по аренде, которое не удалось передать на сервер
+
+    async def hit(self, key: Hashable, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.monotonic()
+        if now - self.last_sweep >= self.lease_ttl:
+            self._sweep(now)
+
+        lease = self.leases.get(key)
+        if lease is not None and lease[0] > now and lease[1] >= cost:
+            # Запас заведомо есть - решаем локально, сервер узнает об этом позже
+            lease[1] -= cost
+            lease[2] += cost
+            self.local_hits += 1
+            return True, 0.0
+
+        pending = lease[2] if lease is not None else 0.0
+        try:
+            allowed, retry_after, remaining = await self.script(
+                keys=[f"{self.prefix}{key}"],
+                args=[self.emission_interval, self.burst_offset, cost, pending],
+            )
+        except Exception as e:
+            # Недоступность Redis не должна останавливать бота - пропускаем запрос
+            self.errors += 1
+            logger.error(f"Ошибка хранилища ограничений Redis: {e}")
+            return True, 0.0
+
+        self.remote_hits += 1
+        allowed = bool(int(allowed))
+        remaining = float(remaining)
+        if allowed and self.lease_fraction > 0 and remaining > 0:
+            self.leases[key] = [now + self.lease_ttl, remaining * self.lease_fraction, 0.0]
+        else:
+            self.leases.pop(key, None)
+        return allowed, float(retry_after)
+
+    def _sweep(self, now: float):
+        """Удаление истекших аренд: потраченное по ним передается на сервер в фоне"""
+        spent = {}
+        for key in [key for key, lease in self.leases.items() if lease[0] <= now]:
+            lease = self.leases.pop(key)
+            if lease[2] > 0:
+                spent[key] = lease[2]
+        self.last_sweep = now
+        if spent:
+            task = asyncio.create_task(self._report(spent))
+            self.report_tasks.add(task)
+            task.add_done_callback(self.report_tasks.discard)
+
+    async def _report(self, spent: Dict[Hashable, float]):
+        """
+        Передача на сервер потраченного по аренде
+
+        Запрос нулевой стоимости только добавляет pending к состоянию ключа.
+        Ошибка по одному ключу не прерывает передачу по остальным, а потерянное
+        потраченное учитывается в счетчике lost_spend.
+        """
+        failed = 0
+        lost = 0.0
+        error = None
+        for key, pending in spent.items():
+            try:
+                await self.script(
+                    keys=[f"{self.prefix}{key}"],
+                    args=[self.emission_interval, self.burst_offset, 0, pending],
+                )
+            except Exception as e:
+                failed += 1
+                lost += pending
+                error = e
+        if failed:
+            self.errors += failed
+            self.lost_spend += lost
+            # Одна запись на передачу, а не на каждый ключ - при недоступном Redis ключей много
+            logger.error(f"Ошибка передачи потраченного по аренде в Redis: {error} "
+                         f"(не передано ключей: {failed} из {len(spent)}, единиц: {lost:g})")
+
+    async def close(self):
+        # Потраченное по действующим арендам тоже передается на сервер
+        spent = {key: lease[2] for key, lease in self.leases.items() if lease[2] > 0}
+        self.leases.clear()
+        if self.report_tasks:
+            await asyncio.gather(*self.report_tasks, return_exceptions=True)
+        await self._report(spent)
+        await self.client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "redis",
+            "local_hits": self.local_hits,
+            "remote_hits": self.remote_hits,
+            "errors": self.errors,
+            "lost_spend": self.lost_spend,
+            "leases": len(self.leases),
+        }
+
+
+def create_throttle_storage() -> ThrottleStorage:
+    """
+    Хранилище ограничений по конфигурации (THROTTLE_STORAGE: memory или redis)
+
+    :return: Экземпляр хранилища
+    """
+    settings = config.throttling
+    if settings.storage == "redis":
+        return RedisThrottleStorage(
+            url=settings.redis_url,
+            rate=settings.rate,
+            burst=settings.burst,
+            lease_fraction=settings.lease_fraction,
+            lease_ttl=settings.lease_ttl,
+        )
+    if settings.storage != "memory":
+        raise ValueError(f"Неизвестное хранилище ограничений: {settings.storage}")
+    return MemoryThrottleStorage(rate=settings.rate, burst=settings.burst)
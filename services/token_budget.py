@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from config import config
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Окна отчета о расходе токенов: название -> длительность в секундах.
+# Окно "day" используется и для суточной квоты
+WINDOWS = {
+    "hour": 3600,
+    "day": 86400,
+}
+
+
+class TokenBudget:
+    """
+    Учет токенов OpenAI (запрос + ответ) по пользователям и суточные квоты
+
+    Расход хранится по корзинам фиксированной длины (bucket_seconds), поэтому сумма за
+    скользящее окно считается по нескольким числам, а старые корзины просто удаляются.
+    Граница окна определяется с точностью до одной корзины. Расход периодически
+    сохраняется в файл и загружается при запуске, поэтому квоты переживают перезапуск бота.
+
+    В многопроцессном режиме у каждого воркера свой файл, а расход остальных воркеров
+    периодически читается из их файлов (peer_paths) и учитывается в квоте и отчетах.
+    Расход других воркеров виден с задержкой до двух интервалов сохранения.
+    """
+
+    def __init__(self, path: str, daily_quota: int = 20000, bucket_seconds: int = 600,
+                 persist_interval: float = 60.0, exempt_ids: Optional[List[int]] = None):
+        """
+        :param path: путь к файлу для сохранения расхода
+        :param daily_quota: токенов на пользователя за скользящие сутки (0 - без ограничения)
+        :param bucket_seconds: длительность одной корзины учета (в секундах)
+        :param persist_interval: интервал сохранения в файл (в секундах)
+        :param exempt_ids: ID пользователей без квоты (администраторы)
+        """
+        self.path = path
+        self.daily_quota = daily_quota
+        self.bucket_seconds = bucket_seconds
+        self.persist_interval = persist_interval
+        self.exempt_ids = set(exempt_ids or [])
+
+        # ID пользователя -> {номер корзины -> токенов}
+        self.usage: Dict[int, Dict[int, int]] = {}
+        self.totals: Dict[int, int] = {}     # Расход пользователя за все время
+        self.denied = 0                      # Запросов, отклоненных из-за квоты (в этом процессе)
+        self.dirty = False                   # Есть изменения, не сохраненные в файл
+        self.task: Optional[asyncio.Task] = None
+
+        # Расход других процессов бота (воркеров супервизора), прочитанный из их файлов:
+        # учитывается в квоте и отчетах, но не сохраняется в свой файл
+        self.peer_paths: List[str] = []
+        self.peer_usage: Dict[int, Dict[int, int]] = {}
+        self.peer_totals: Dict[int, int] = {}
+
+    def _bucket(self, now: Optional[float] = None) -> int:
+        """Номер корзины для момента времени"""
+        return int((time.time() if now is None else now) // self.bucket_seconds)
+
+    def _oldest_bucket(self, seconds: int, now: Optional[float] = None) -> int:
+        """Номер самой старой корзины, входящей в окно длиной seconds"""
+        return self._bucket(now) - seconds // self.bucket_seconds + 1
+
+    def used(self, user_id: int, window: str = "day", now: Optional[float] = None) -> int:
+        """
+        Расход пользователя за скользящее окно
+
+        :param user_id: ID пользователя
+        :param window: Название окна из WINDOWS
+        :param now: текущее время (для тестов)
+        :return: Количество токенов
+        """
+        oldest = self._oldest_bucket(WINDOWS[window], now)
+        return sum(
+            tokens
+            for usage in (self.usage, self.peer_usage)
+            for bucket, tokens in usage.get(user_id, {}).items()
+            if bucket >= oldest
+        )
+
+    def total(self, user_id: int) -> int:
+        """Расход пользователя за все время"""
+        return self.totals.get(user_id, 0) + self.peer_totals.get(user_id, 0)
+
+    def _user_ids(self) -> set:
+        """Пользователи с расходом в этом процессе или у других воркеров"""
+        return self.usage.keys() | self.peer_usage.keys()
+
+    def remaining(self, user_id: int) -> Optional[int]:
+        """
+        Остаток суточной квоты пользователя
+
+        :return: Количество токенов или None, если квота не ограничена
+        """
+        if not self.daily_quota or user_id in self.exempt_ids:
+            return None
+        return max(self.daily_quota - self.used(user_id), 0)
+
+    def allow(self, user_id: int) -> bool:
+        """
+        Проверка перед запросом к API: осталась ли у пользователя квота
+
+        Размер ответа заранее неизвестен, поэтому последний разрешенный запрос может
+        превысить квоту не более чем на max_tokens одного ответа.
+        """
+        remaining = self.remaining(user_id)
+        if remaining is None or remaining > 0:
+            return True
+        self.denied += 1
+        return False
+
+    def record(self, user_id: int, prompt_tokens: int, completion_tokens: int):
+        """
+        Учет израсходованных токенов по данным usage из ответа API
+
+        :param user_id: ID пользователя
+        :param prompt_tokens: токенов в запросе (с системной инструкцией)
+        :param completion_tokens: токенов в ответе
+        """
+        tokens = prompt_tokens + completion_tokens
+        if tokens <= 0:
+            return
+        bucket = self._bucket()
+        buckets = self.usage.setdefault(user_id, {})
+        if bucket not in buckets:
+            # Новая корзина - заодно удаляем корзины, вышедшие за самое длинное окно
+            oldest = self._oldest_bucket(max(WINDOWS.values()))
+            for old in [old for old in buckets if old < oldest]:
+                del buckets[old]
+        buckets[bucket] = buckets.get(bucket, 0) + tokens
+        self.totals[user_id] = self.totals.get(user_id, 0) + tokens
+        self.dirty = True
+
+    def top_users(self, limit: int = 10, window: str = "day") -> List[Tuple[int, int]]:
+        """
+        Пользователи с наибольшим расходом за окно
+
+        :return: Список пар (ID пользователя, токенов) по убыванию расхода
+        """
+        rows = [(user_id, self.used(user_id, window)) for user_id in self._user_ids()]
+        rows = [row for row in rows if row[1] > 0]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows[:limit]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Общий расход токенов
+
+        :return: Словарь с суммами по окнам, количеством пользователей и отказами по квоте
+        """
+        user_ids = self._user_ids()
+        return {
+            **{window: sum(self.used(user_id, window) for user_id in user_ids) for window in WINDOWS},
+            "users": sum(1 for user_id in user_ids if self.used(user_id) > 0),
+            "daily_quota": self.daily_quota,
+            "denied": self.denied,
+        }
+
+    def _prune(self):
+        """Удаление пользователей без расхода за самое длинное окно"""
+        oldest = self._oldest_bucket(max(WINDOWS.values()))
+        for user_id in list(self.usage):
+            buckets = {bucket: tokens for bucket, tokens in self.usage[user_id].items() if bucket >= oldest}
+            if buckets:
+                self.usage[user_id] = buckets
+            else:
+                del self.usage[user_id]
+
+    def _serialize(self) -> str:
+        """Расход в JSON (ключи JSON - строки)"""
+        return json.dumps({
+            "bucket_seconds": self.bucket_seconds,
+            "usage": {
+                str(user_id): {str(bucket): tokens for bucket, tokens in buckets.items()}
+                for user_id, buckets in self.usage.items()
+            },
+            "totals": {str(user_id): tokens for user_id, tokens in self.totals.items()},
+        })
+
+    def _write_file(self, payload: str):
+        """Атомарная запись файла: сначала во временный, затем переименование"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        """Загрузка сохраненного расхода из файла"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                saved = json.load(file)
+            self.totals = {int(user_id): tokens for user_id, tokens in saved.get("totals", {}).items()}
+            if saved.get("bucket_seconds") != self.bucket_seconds:
+                logger.warning("Размер корзин учета токенов изменился, расход за окна не загружен")
+                return
+            self.usage = {
+                int(user_id): {int(bucket): tokens for bucket, tokens in buckets.items()}
+                for user_id, buckets in saved["usage"].items()
+            }
+            self._prune()
+        except Exception as e:
+            logger.error(f"Ошибка загрузки расхода токенов: {e}")
+
+    def _read_peers(self) -> Tuple[Dict[int, Dict[int, int]], Dict[int, int]]:
+        """
+        Суммарный расход других воркеров из их файлов
+
+        :return: (ID пользователя -> {номер корзины -> токенов}, ID пользователя -> расход за все время)
+        """
+        usage: Dict[int, Dict[int, int]] = {}
+        totals: Dict[int, int] = {}
+        for path in self.peer_paths:
+            try:
+                with open(path, encoding="utf-8") as file:
+                    saved = json.load(file)
+            except FileNotFoundError:
+                # Воркер еще ничего не сохранил
+                continue
+            except Exception as e:
+                logger.warning(f"Ошибка чтения расхода токенов воркера из {path}: {e}")
+                continue
+            for user_id, tokens in saved.get("totals", {}).items():
+                totals[int(user_id)] = totals.get(int(user_id), 0) + tokens
+            if saved.get("bucket_seconds") != self.bucket_seconds:
+                continue
+            for user_id, buckets in saved.get("usage", {}).items():
+                merged = usage.setdefault(int(user_id), {})
+                for bucket, tokens in buckets.items():
+                    merged[int(bucket)] = merged.get(int(bucket), 0) + tokens
+        return usage, totals
+
+    async def refresh_peers(self):
+        """Перечитывание расхода других воркеров (файлы читаются в отдельном потоке)"""
+        if not self.peer_paths:
+            return
+        self.peer_usage, self.peer_totals = await asyncio.to_thread(self._read_peers)
+
+    async def save(self):
+        """Сохранение расхода в файл, если он изменился"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        self._prune()
+        try:
+            # Сериализуем в цикле событий (быстро), а пишем на диск в отдельном потоке
+            await asyncio.to_thread(self._write_file, self._serialize())
+        except Exception as e:
+            self.dirty = True
+            logger.error(f"Ошибка сохранения расхода токенов: {e}")
+
+    async def start(self):
+        """Загрузка расхода и запуск периодического сохранения (хук запуска бота)"""
+        await asyncio.to_thread(self.load)
+        await self.refresh_peers()
+        if self.task is None:
+            self.task = asyncio.create_task(self._persist_loop())
+
+    async def stop(self):
+        """Остановка периодического сохранения и финальное сохранение (хук остановки бота)"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.save()
+
+    async def _persist_loop(self):
+        """Периодическое сохранение своего расхода и чтение расхода других воркеров"""
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            await self.save()
+            await self.refresh_peers()
+
+
+# Общий учет токенов
+# Администраторы не ограничены квотой - их запросы и так обслуживаются первыми
+token_budget = TokenBudget(
+    path=config.token_budget.path,
+    daily_quota=config.token_budget.daily_quota,
+    bucket_seconds=config.token_budget.bucket_seconds,
+    persist_interval=config.token_budget.persist_interval,
+    exempt_ids=config.bot.admin_ids,
+)
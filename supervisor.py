@@ -0,0 +1,530 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import multiprocessing
+from config import config
+from aiogram import Bot, Dispatcher
+from utils.hash_ring import HashRing
+from utils.startup import startup_profiler
+from concurrent.futures import ThreadPoolExecutor
+from aiogram.methods import TelegramMethod
+from typing import Any, Dict, List, Optional
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Типы обновлений, в которых ищется чат (в порядке проверки)
+CHAT_UPDATE_TYPES = ("message", "edited_message", "channel_post", "edited_channel_post",
+                     "business_message", "edited_business_message")
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """
+    Чат, к которому относится обновление (ключ распределения по воркерам)
+
+    Для callback-запросов берется чат сообщения с кнопкой, для прочих обновлений без
+    чата - ID пользователя, чтобы его обновления тоже обрабатывались по порядку.
+    """
+    for update_type in CHAT_UPDATE_TYPES:
+        if update_type in update:
+            return update[update_type]["chat"]["id"]
+    callback = update.get("callback_query")
+    if callback is not None:
+        message = callback.get("message")
+        return message["chat"]["id"] if message else callback["from"]["id"]
+    for value in update.values():
+        if isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return value["from"]["id"]
+    return 0
+
+
+# ---------------------------------------------------------------------------
+# Процесс-воркер
+# ---------------------------------------------------------------------------
+
+def worker_main(index: int, updates_conn, metrics_conn):
+    """
+    Точка входа процесса-воркера (запускается через spawn)
+
+    :param index: Номер воркера
+    :param updates_conn: Конец канала, из которого приходят обновления
+    :param metrics_conn: Конец канала для отправки показателей в супервизор
+    """
+    try:
+        asyncio.run(_worker(index, updates_conn, metrics_conn))
+    except KeyboardInterrupt:
+        # Ctrl+C получает вся группа процессов, воркер останавливает супервизор
+        pass
+
+
+async def _worker(index: int, updates_conn, metrics_conn):
+    """Обработка обновлений полным стеком middleware и обработчиков бота"""
+    # Импорт внутри воркера: бот, диспетчер и сервисы создаются в процессе воркера
+    from bot import bot, dp
+    from main import setup_dispatcher
+    from services.active_users import active_users
+    from services.token_budget import token_budget
+    from services.openai_service import limiter
+    from services.metrics import metrics_server
+    from services.db import db
+    from services.conversation import conversations
+    from utils.log_pipeline import event_log, log_pipeline
+
+    # У каждого воркера свои файлы оценок активных пользователей, расхода токенов и лога,
+    # чтобы воркеры не перезаписывали (и не ротировали) файлы друг друга. Файлы оценок и расхода
+    # остальных воркеров читаются периодически: /active_users и /usage показывают весь бот,
+    # а квота пользователя, пишущего в чаты разных воркеров, общая (с задержкой до двух интервалов сохранения)
+    others = [other for other in range(config.supervisor.workers) if other != index]
+    active_users.peer_paths = [f"{active_users.path}.worker{other}" for other in others]
+    active_users.path = f"{active_users.path}.worker{index}"
+    token_budget.peer_paths = [f"{token_budget.path}.worker{other}" for other in others]
+    token_budget.path = f"{token_budget.path}.worker{index}"
+    log_pipeline.name = f"{log_pipeline.name}_worker{index}"
+    event_log.name = f"{event_log.name}_worker{index}"
+    # Показатели каждого воркера отдаются на своем порту: METRICS_PORT + 1 + номер воркера
+    if metrics_server.port:
+        metrics_server.port += 1 + index
+    # Общее ограничение Telegram на отправку действует на бота целиком - делим его между воркерами
+    if config.outbound.enabled:
+        from services.outbound import outbound
+        outbound.set_global_rate(config.outbound.global_rate / config.supervisor.workers)
+
+    # DB_POOL_MAX_SIZE - соединений на всего бота, а не на процесс: делим его между воркерами
+    # (не меньше двух соединений на воркер: рассылка держит одно соединение все время работы,
+    # обработчикам нужно еще хотя бы одно), иначе N воркеров открывают N полных пулов
+    db.max_size = max(2, config.bot.db_pool_max_size // config.supervisor.workers)
+    db.min_size = min(db.min_size, db.max_size)
+    # OPENAI_MAX_CONCURRENCY - тоже на всего бота: делим между воркерами (не меньше одного запроса)
+    limiter.max_concurrency = max(1, config.openai.max_concurrency // config.supervisor.workers)
+
+    # Обслуживание БД (секции логов, удаление старых диалогов) выполняет только воркер 0:
+    # одинаковые DDL и DELETE из каждого воркера лишь конкурируют за блокировки
+    maintenance = index == 0
+    if not maintenance:
+        conversations.retention_days = 0
+
+    setup_dispatcher(dp, maintenance=maintenance)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(config.supervisor.max_in_flight)
+    chat_tails: Dict[int, asyncio.Task] = {}   # Последняя задача каждого чата
+    stats = {"processed": 0, "errors": 0, "in_flight": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+    async def process(chat_id: int, update: Dict[str, Any], previous: Optional[asyncio.Task]):
+        """Обработка обновления после завершения предыдущего обновления того же чата"""
+        try:
+            if previous is not None:
+                await asyncio.gather(previous, return_exceptions=True)
+            started = time.perf_counter()
+            stats["in_flight"] += 1
+            try:
+                response = await dp.feed_raw_update(bot, update)
+                # Обработчик мог вернуть метод Bot API вместо вызова (см. режим webhook)
+                if isinstance(response, TelegramMethod):
+                    await dp.silent_call_request(bot=bot, result=response)
+            except Exception as e:
+                stats["errors"] += 1
+                logger.error(f"Воркер {index}: ошибка обработки обновления {update.get('update_id')}: {e}")
+            latency = (time.perf_counter() - started) * 1000
+            stats["in_flight"] -= 1
+            stats["processed"] += 1
+            stats["total_ms"] += latency
+            stats["max_ms"] = max(stats["max_ms"], latency)
+        finally:
+            slots.release()
+            if chat_tails.get(chat_id) is asyncio.current_task():
+                del chat_tails[chat_id]
+
+    async def report():
+        """Периодическая отправка показателей в супервизор"""
+        while True:
+            await asyncio.sleep(config.supervisor.metrics_interval)
+            metrics_conn.send({**stats, "chats": len(chat_tails)})
+            stats["max_ms"] = 0.0
+
+    reporter = asyncio.create_task(report())
+    try:
+        while True:
+            # Новое обновление забирается только при свободном слоте - иначе обновления
+            # копятся в очереди супервизора, где видна загрузка воркера
+            await slots.acquire()
+            item = await loop.run_in_executor(None, updates_conn.recv)
+            if item is None:
+                slots.release()
+                break
+            chat_id, update = item
+            # Обновления одного чата выполняются строго по очереди, разных чатов - параллельно
+            task = asyncio.create_task(process(chat_id, update, chat_tails.get(chat_id)))
+            chat_tails[chat_id] = task
+    finally:
+        reporter.cancel()
+        if chat_tails:
+            await asyncio.gather(*chat_tails.values(), return_exceptions=True)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
+
+
+# ---------------------------------------------------------------------------
+# Супервизор
+# ---------------------------------------------------------------------------
+
+class WorkerHandle:
+    """Процесс-воркер со стороны супервизора: каналы, очередь и показатели"""
+
+    def __init__(self, index: int, queue_size: int):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.process: Optional[multiprocessing.Process] = None
+        self.updates_conn = None     # Канал отправки обновлений воркеру
+        self.metrics_conn = None     # Канал получения показателей от воркера
+        self.restarts = 0
+        self.crashes = 0             # Падений подряд (сбрасывается, когда воркер снова работает стабильно)
+        self.down = False            # Воркер упал max_restarts раз подряд (для /stats и журнала)
+        self.restart_at = 0.0        # Когда перезапустить завершившийся воркер
+        self.started_at = 0.0
+        self.routed = 0              # Направлено обновлений за все время
+        self.dropped = 0             # Отброшено обновлений неработающего воркера при полной очереди
+        self.metrics: Dict[str, Any] = {}
+
+
+class Supervisor:
+    """
+    Многопроцессная обработка обновлений
+
+    Супервизор получает обновления long polling'ом и распределяет их по N процессам-воркерам
+    консистентным хэшированием chat_id: все обновления одного чата попадают в один воркер
+    и обрабатываются по порядку. Каждый воркер запускает полный стек middleware и
+    обработчиков (setup_dispatcher). Упавший воркер перезапускается с тем же номером,
+    поэтому распределение чатов не меняется.
+
+    Перезапуски не прекращаются: пауза перед ними удваивается с каждым падением подряд
+    (до restart_max_delay). Пока воркер не работает, обновления его чатов, не поместившиеся
+    в очередь, отбрасываются со счетчиком, чтобы один воркер не останавливал получение
+    обновлений для всех чатов. Воркер, упавший max_restarts раз подряд, считается неработающим
+    до тех пор, пока снова не проработает restart_max_delay секунд.
+    """
+
+    def __init__(self, bot: Bot, workers: int = 2, queue_size: int = 1000,
+                 restart_delay: float = 1.0, restart_max_delay: float = 60.0, max_restarts: int = 10,
+                 metrics_interval: float = 10.0, metrics_path: Optional[str] = None):
+        """
+        :param bot: Экземпляр бота (используется только для получения обновлений)
+        :param workers: количество процессов-воркеров
+        :param queue_size: размер очереди обновлений каждого воркера
+        :param restart_delay: пауза перед первым перезапуском упавшего воркера (в секундах)
+        :param restart_max_delay: предел паузы перед перезапуском (в секундах); воркер, проработавший
+                                  дольше нее, считается восстановленным
+        :param max_restarts: падений подряд, после которых воркер считается неработающим (0 - никогда)
+        :param metrics_interval: интервал записи показателей (в секундах)
+        :param metrics_path: файл для показателей воркеров
+        """
+        self.bot = bot
+        self.restart_delay = restart_delay
+        self.restart_max_delay = max(restart_max_delay, restart_delay)
+        self.max_restarts = max_restarts
+        self.metrics_interval = metrics_interval
+        self.metrics_path = metrics_path
+
+        # spawn - чистый интерпретатор в каждом воркере, без копии цикла событий родителя
+        self.context = multiprocessing.get_context("spawn")
+        self.ring = HashRing(range(workers))
+        self.workers: List[WorkerHandle] = [WorkerHandle(i, queue_size) for i in range(workers)]
+        # Отдельные потоки для блокирующей отправки в каналы воркеров
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="supervisor")
+        self.stopping = False
+
+    def spawn(self, worker: WorkerHandle):
+        """Запуск (или перезапуск) процесса-воркера с новыми каналами"""
+        updates_recv, updates_send = self.context.Pipe(duplex=False)
+        metrics_recv, metrics_send = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=worker_main,
+            args=(worker.index, updates_recv, metrics_send),
+            name=f"bot-worker-{worker.index}",
+            daemon=True,
+        )
+        process.start()
+        # Концы каналов, принадлежащие воркеру, в супервизоре больше не нужны
+        updates_recv.close()
+        metrics_send.close()
+
+        worker.process = process
+        worker.updates_conn = updates_send
+        worker.metrics_conn = metrics_recv
+        worker.started_at = time.monotonic()
+        # Показатели приходят без блокировки цикла событий - по готовности канала к чтению
+        asyncio.get_running_loop().add_reader(metrics_recv.fileno(), self._read_metrics, worker)
+        logger.info(f"Воркер {worker.index} запущен (pid {process.pid})")
+
+    def _read_metrics(self, worker: WorkerHandle):
+        """Прием показателей от воркера"""
+        try:
+            worker.metrics = worker.metrics_conn.recv()
+        except (EOFError, OSError):
+            # Воркер завершился - канал будет пересоздан при перезапуске
+            asyncio.get_running_loop().remove_reader(worker.metrics_conn.fileno())
+
+    async def _send_loop(self, worker: WorkerHandle):
+        """Передача обновлений из очереди супервизора в канал воркера"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await worker.queue.get()
+            while True:
+                try:
+                    # Отправка блокируется, если воркер не успевает читать - это и есть
+                    # обратное давление, поэтому она вынесена в отдельный поток
+                    await loop.run_in_executor(self.executor, worker.updates_conn.send, item)
+                    break
+                except (BrokenPipeError, OSError, AttributeError):
+                    # Воркер упал: ждем перезапуска и повторяем отправку в новый канал
+                    await asyncio.sleep(self.restart_delay)
+                    if self.stopping:
+                        return
+
+    async def _monitor_loop(self):
+        """Перезапуск упавших воркеров"""
+        while not self.stopping:
+            await asyncio.sleep(min(1.0, self.restart_delay))
+            self._check_workers(time.monotonic())
+
+    def _check_workers(self, now: float):
+        """
+        Одна проверка воркеров: учет падений и перезапуск тех, чья пауза истекла
+
+        Паузы перезапуска у каждого воркера свои, поэтому долгая пауза одного воркера
+        не задерживает перезапуск остальных.
+        """
+        for worker in self.workers:
+            if self.stopping:
+                return
+            if worker.process.is_alive():
+                # Воркер, проработавший дольше предельной паузы, считается восстановленным
+                if worker.crashes and now - worker.started_at >= self.restart_max_delay:
+                    if worker.down:
+                        logger.warning(f"Воркер {worker.index} восстановлен, отброшено обновлений: {worker.dropped}")
+                    worker.crashes = 0
+                    worker.down = False
+                continue
+
+            if worker.updates_conn is not None:
+                # Воркер только что завершился: закрываем каналы и назначаем перезапуск
+                logger.error(f"Воркер {worker.index} завершился с кодом {worker.process.exitcode}")
+                self._close_channels(worker)
+                worker.crashes += 1
+                delay = min(self.restart_delay * 2 ** (worker.crashes - 1), self.restart_max_delay)
+                worker.restart_at = now + delay
+                if self.max_restarts and worker.crashes >= self.max_restarts and not worker.down:
+                    worker.down = True
+                    logger.critical(
+                        f"Воркер {worker.index} упал {worker.crashes} раз подряд, "
+                        f"перезапуск - каждые {self.restart_max_delay:g} сек"
+                    )
+
+            if now >= worker.restart_at:
+                worker.restarts += 1
+                self.spawn(worker)
+
+    def _close_channels(self, worker: WorkerHandle):
+        """Закрытие каналов завершившегося воркера"""
+        if worker.metrics_conn is not None:
+            asyncio.get_running_loop().remove_reader(worker.metrics_conn.fileno())
+            worker.metrics_conn.close()
+            worker.metrics_conn = None
+        if worker.updates_conn is not None:
+            worker.updates_conn.close()
+            worker.updates_conn = None
+
+    async def _poll_loop(self, allowed_updates: List[str]):
+        """Получение обновлений long polling'ом и распределение по воркерам"""
+        offset = None
+        backoff = 1.0
+        while not self.stopping:
+            try:
+                updates = await self.bot.get_updates(offset=offset, timeout=30,
+                                                     allowed_updates=allowed_updates)
+                backoff = 1.0
+            except Exception as e:
+                logger.error(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+
+            for update in updates:
+                raw = update.model_dump(mode="json", exclude_unset=True, by_alias=True)
+                chat_id = update_chat_id(raw)
+                worker = self.workers[self.ring.get(chat_id)]
+                if await self._route(worker, (chat_id, raw)):
+                    worker.routed += 1
+                offset = update.update_id + 1
+
+    async def _route(self, worker: WorkerHandle, item: tuple) -> bool:
+        """
+        Постановка обновления в очередь воркера
+
+        При полной очереди работающего воркера ждем - Telegram придержит остальные обновления.
+        Завершившийся воркер очередь не разбирает, поэтому для него обновление, не поместившееся
+        в очередь, отбрасывается: получение обновлений для чатов остальных воркеров продолжается.
+
+        :return: True, если обновление поставлено в очередь
+        """
+        while True:
+            try:
+                worker.queue.put_nowait(item)
+                return True
+            except asyncio.QueueFull:
+                pass
+            if worker.down or not worker.process.is_alive():
+                worker.dropped += 1
+                return False
+            try:
+                await asyncio.wait_for(worker.queue.put(item), timeout=self.restart_delay)
+                return True
+            except asyncio.TimeoutError:
+                # Очередь все еще полна - проверяем, жив ли воркер, и ждем дальше
+                continue
+
+    async def _metrics_loop(self):
+        """Периодическая запись показателей воркеров в файл и лог"""
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            stats = self.get_stats()
+            if self.metrics_path:
+                await asyncio.to_thread(self._write_metrics, stats)
+            logger.info("Воркеры: " + ", ".join(
+                f"#{w['index']} очередь {w['queue']} в работе {w['in_flight']} обработано {w['processed']}"
+                for w in stats["workers"]
+            ))
+
+    def _write_metrics(self, stats: Dict[str, Any]):
+        """Атомарная запись показателей: сначала во временный файл, затем переименование"""
+        os.makedirs(os.path.dirname(self.metrics_path), exist_ok=True)
+        tmp_path = f"{self.metrics_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(stats, file)
+        os.replace(tmp_path, self.metrics_path)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Показатели нагрузки по воркерам
+
+        :return: Словарь с временем сбора и списком воркеров
+        """
+        workers = []
+        for worker in self.workers:
+            metrics = worker.metrics
+            processed = metrics.get("processed", 0)
+            workers.append({
+                "index": worker.index,
+                "pid": worker.process.pid if worker.process else None,
+                "alive": bool(worker.process and worker.process.is_alive()),
+                "down": worker.down,
+                "restarts": worker.restarts,
+                "uptime": time.monotonic() - worker.started_at,
+                "queue": worker.queue.qsize(),
+                "routed": worker.routed,
+                "dropped": worker.dropped,
+                "processed": processed,
+                "errors": metrics.get("errors", 0),
+                "in_flight": metrics.get("in_flight", 0),
+                "chats": metrics.get("chats", 0),
+                "avg_ms": metrics.get("total_ms", 0.0) / processed if processed else 0.0,
+                "max_ms": metrics.get("max_ms", 0.0),
+            })
+        return {"updated_at": time.time(), "workers": workers}
+
+    async def run(self, allowed_updates: List[str]):
+        """Запуск воркеров и распределение обновлений до остановки"""
+        for worker in self.workers:
+            self.spawn(worker)
+        tasks = [asyncio.create_task(self._send_loop(worker)) for worker in self.workers]
+        tasks += [
+            asyncio.create_task(self._monitor_loop()),
+            asyncio.create_task(self._metrics_loop()),
+        ]
+        try:
+            await self._poll_loop(allowed_updates)
+        finally:
+            await self.stop(tasks)
+
+    async def stop(self, tasks: List[asyncio.Task]):
+        """Остановка: воркеры дорабатывают полученные обновления и завершаются"""
+        self.stopping = True
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            # Дожидаемся передачи уже распределенных обновлений
+            while not worker.queue.empty() and worker.process.is_alive():
+                await asyncio.sleep(0.1)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        for worker in self.workers:
+            if worker.process.is_alive() and worker.updates_conn is not None:
+                # None - сигнал воркеру завершиться после текущих обновлений
+                try:
+                    await loop.run_in_executor(self.executor, worker.updates_conn.send, None)
+                except OSError:
+                    # Воркер уже завершается сам (например, тоже получил Ctrl+C)
+                    pass
+        for worker in self.workers:
+            await loop.run_in_executor(self.executor, worker.process.join, 30)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            self._close_channels(worker)
+        self.executor.shutdown(wait=False)
+
+
+def read_worker_stats() -> Optional[Dict[str, Any]]:
+    """
+    Показатели воркеров, записанные супервизором (для /stats в процессе воркера)
+
+    :return: Словарь из get_stats() или None, если супервизор не запущен или данные устарели
+    """
+    path = config.supervisor.metrics_path
+    try:
+        with open(path, encoding="utf-8") as file:
+            stats = json.load(file)
+    except (OSError, ValueError):
+        return None
+    # Файл от прошлого запуска в многопроцессном режиме не показываем
+    if time.time() - stats.get("updated_at", 0) > 3 * config.supervisor.metrics_interval:
+        return None
+    return stats
+
+
+async def run_supervisor(bot: Bot):
+    """
+    Запуск бота в многопроцессном режиме
+
+    :param bot: Экземпляр бота
+    """
+    # Типы обновлений определяются по обработчикам так же, как в режиме polling
+    from handlers import register_all_handlers
+    probe = Dispatcher()
+    register_all_handlers(probe)
+
+    supervisor = Supervisor(
+        bot,
+        workers=config.supervisor.workers,
+        queue_size=config.supervisor.queue_size,
+        restart_delay=config.supervisor.restart_delay,
+        restart_max_delay=config.supervisor.restart_max_delay,
+        max_restarts=config.supervisor.max_restarts,
+        metrics_interval=config.supervisor.metrics_interval,
+        metrics_path=config.supervisor.metrics_path,
+    )
+    try:
+        # Обновления получает только супервизор, поэтому webhook должен быть снят
+        await bot.delete_webhook()
+        # Обновления ставятся в очереди воркеров, пока те запускаются, поэтому
+        # супервизор готов принимать обновления сразу после снятия webhook
+        startup_profiler.mark_ready(config.startup.ready_file, verbose=config.startup.profile)
+        await supervisor.run(probe.resolve_used_update_types())
+    finally:
+        startup_profiler.clear_ready()
+        await bot.session.close()
@@ -0,0 +1,36 @@
+import asyncio
+
+from services.active_users import ActiveUsersTracker
+
+
+def make_tracker(tmp_path, index: int, workers: int = 2) -> ActiveUsersTracker:
+    """Оценка активных пользователей воркера с файлами, как их настраивает супервизор"""
+    tracker = ActiveUsersTracker(str(tmp_path / f"active.json.worker{index}"))
+    tracker.peer_paths = [str(tmp_path / f"active.json.worker{other}") for other in range(workers) if other != index]
+    return tracker
+
+
+def test_estimates_merge_other_workers(tmp_path):
+    async def scenario():
+        first, second = make_tracker(tmp_path, 0), make_tracker(tmp_path, 1)
+        # Часть пользователей пишет в чаты обоих воркеров - в объединении они считаются один раз
+        for user_id in range(0, 3000):
+            first.add(user_id)
+        for user_id in range(2000, 5000):
+            second.add(user_id)
+        await second.save()
+        before = first.estimate("today")
+        await first.refresh_peers()
+
+        everyone = ActiveUsersTracker(str(tmp_path / "all.json"))
+        for user_id in range(5000):
+            everyone.add(user_id)
+        assert first.estimate("today") == everyone.estimate("today") > before
+        assert first.estimate("month") == everyone.estimate("month")
+        # Оценки других воркеров в свой файл не попадают
+        await first.save()
+        restored = ActiveUsersTracker(first.path)
+        restored.load()
+        assert restored.estimate("today") == before
+
+    asyncio.run(scenario())
@@ -0,0 +1,108 @@
+import asyncio
+import datetime
+from typing import Any, AsyncIterator, List, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import EditMessageText, SendMessage, TelegramMethod
+
+from config import config
+from services.broadcast import Broadcaster
+from services.db import db
+from services.rollups import apply_events, create_rollup_tables
+
+
+# Тесты выполняются на временной базе PostgreSQL (фикстура pg_database, TEST_DATABASE_URL)
+
+
+BLOCKED_USER = 13
+
+
+class RecordingSession(BaseSession):
+    """Сессия Bot API без сети: запоминает отправки, один получатель заблокировал бота"""
+
+    def __init__(self):
+        super().__init__()
+        self.sent: List[int] = []
+        self.reports: List[str] = []
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        if isinstance(method, SendMessage):
+            if method.chat_id == BLOCKED_USER:
+                raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+            self.sent.append(method.chat_id)
+        elif isinstance(method, EditMessageText):
+            self.reports.append(method.text)
+        return True
+
+    async def stream_content(self, *args, **kwargs) -> AsyncIterator[bytes]:
+        yield b""
+
+    async def close(self):
+        pass
+
+
+async def add_users(count: int):
+    now = datetime.datetime.now()
+    batch = [(now, "message", user_id, None, user_id, "привет", None) for user_id in range(1, count + 1)]
+    async with db.acquire() as conn:
+        await create_rollup_tables(conn)
+        async with conn.transaction():
+            await apply_events(conn, batch)
+
+
+def test_broadcast_uses_single_connection(pg_database):
+    async def scenario():
+        # Пул из одного соединения: рассылка держит его все время работы, поэтому
+        # контрольные точки и итоговый статус должны писаться на нем же
+        db.min_size, db.max_size = 1, 1
+        acquire_timeout, db.acquire_timeout = db.acquire_timeout, 1.0
+        try:
+            await add_users(23)
+            broadcaster = Broadcaster(concurrency=4, batch_size=5, progress_interval=0.0)
+            bot = Bot("123456:test", session=RecordingSession())
+            broadcast_id = await broadcaster.create(admin_chat_id=1000, progress_message_id=1, text="новости")
+            broadcaster.launch(bot, broadcast_id)
+            await asyncio.gather(*broadcaster.tasks.values())
+
+            async with db.acquire() as conn:
+                row = await conn.fetchrow(f"SELECT * FROM {config.broadcast.table} WHERE id = $1", broadcast_id)
+                blocked = await conn.fetch(f"SELECT user_id FROM {config.broadcast.blocked_table}")
+            assert row["status"] == "done" and row["finished_at"] is not None
+            assert row["last_user_id"] == 23
+            assert (row["sent"], row["blocked"], row["failed"]) == (22, 1, 0)
+            assert [record["user_id"] for record in blocked] == [BLOCKED_USER]
+            assert sorted(bot.session.sent) == [user_id for user_id in range(1, 24) if user_id != BLOCKED_USER]
+            assert "завершена" in bot.session.reports[-1]
+        finally:
+            db.acquire_timeout = acquire_timeout
+            await db.stop()
+
+    asyncio.run(scenario())
+
+
+def test_broadcast_resumes_from_checkpoint(pg_database):
+    async def scenario():
+        db.min_size, db.max_size = 1, 1
+        try:
+            await add_users(12)
+            broadcaster = Broadcaster(concurrency=2, batch_size=5)
+            bot = Bot("123456:test", session=RecordingSession())
+            broadcast_id = await broadcaster.create(admin_chat_id=1000, progress_message_id=0, text="новости")
+            # Рассылка прервалась после первой пачки
+            async with db.acquire() as conn:
+                await conn.execute(
+                    f"UPDATE {config.broadcast.table} SET last_user_id = 5, sent = 5 WHERE id = $1", broadcast_id
+                )
+            broadcaster.launch(bot, broadcast_id)
+            await asyncio.gather(*broadcaster.tasks.values())
+
+            assert sorted(bot.session.sent) == [user_id for user_id in range(6, 13) if user_id != BLOCKED_USER]
+            async with db.acquire() as conn:
+                row = await conn.fetchrow(f"SELECT * FROM {config.broadcast.table} WHERE id = $1", broadcast_id)
+            assert row["status"] == "done" and row["sent"] == 12
+        finally:
+            await db.stop()
+
+    asyncio.run(scenario())
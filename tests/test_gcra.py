@@ -0,0 +1,98 @@
+import pytest
+
+from utils.gcra import GCRALimiter
+
+
+# Время передается явно (now), поэтому тесты не зависят от скорости машины
+
+
+def make_limiter(rate=1.0, burst=3.0, sweep_interval=60.0) -> GCRALimiter:
+    limiter = GCRALimiter(rate=rate, burst=burst, sweep_interval=sweep_interval)
+    # Отсчет времени тестов начинается с нуля
+    limiter.last_sweep = 0.0
+    return limiter
+
+
+def test_burst_then_retry_after():
+    limiter = make_limiter(rate=1.0, burst=3.0)
+    assert [limiter.hit(1, now=0.0)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.hit(1, now=0.0)
+    assert not allowed
+    # Следующая единица восстанавливается за 1 / rate секунд
+    assert retry_after == pytest.approx(1.0)
+    # Другой ключ не затронут
+    assert limiter.hit(2, now=0.0) == (True, 0.0)
+
+
+def test_steady_rate_after_burst():
+    limiter = make_limiter(rate=2.0, burst=2.0)
+    assert limiter.hit(1, now=0.0)[0] and limiter.hit(1, now=0.0)[0]
+    # После исчерпания запаса - одна единица каждые 1 / rate = 0.5 секунды
+    assert limiter.hit(1, now=0.25) == (False, pytest.approx(0.25))
+    assert limiter.hit(1, now=0.5)[0]
+    assert not limiter.hit(1, now=0.5)[0]
+    assert limiter.hit(1, now=1.0)[0]
+
+
+def test_rejected_requests_do_not_extend_block():
+    limiter = make_limiter(rate=1.0, burst=1.0)
+    assert limiter.hit(1, now=0.0)[0]
+    for now in (0.1, 0.2, 0.5, 0.9):
+        assert not limiter.hit(1, now=now)[0]
+    # Отклоненные запросы не тратят запас: разрешено ровно через 1 / rate после последнего разрешенного
+    assert limiter.hit(1, now=1.0)[0]
+
+
+def test_full_recovery_after_idle():
+    limiter = make_limiter(rate=1.0, burst=3.0)
+    for _ in range(3):
+        limiter.hit(1, now=0.0)
+    # За burst / rate секунд запас восстанавливается полностью, но не больше burst
+    assert [limiter.hit(1, now=100.0)[0] for _ in range(4)] == [True, True, True, False]
+
+
+def test_cost_is_charged_in_units():
+    limiter = make_limiter(rate=1.0, burst=5.0)
+    assert limiter.hit(1, 3.0, now=0.0)[0]
+    allowed, retry_after = limiter.hit(1, 3.0, now=0.0)
+    # Не хватает одной единицы из трех - ждать 1 / rate секунд
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+    assert limiter.hit(1, 2.0, now=0.0)[0]
+    assert not limiter.hit(1, 0.5, now=0.0)[0]
+
+
+def test_fractional_cost():
+    limiter = make_limiter(rate=1.0, burst=3.0)
+    # Запрос стоимостью 0.5 - шесть запросов из запаса 3
+    assert sum(limiter.hit(1, 0.5, now=0.0)[0] for _ in range(10)) == 6
+    assert limiter.hit(1, 0.5, now=0.5)[0]
+
+
+def test_sweep_forgets_idle_keys():
+    limiter = make_limiter(rate=1.0, burst=3.0, sweep_interval=10.0)
+    limiter.hit(1, now=0.0)
+    limiter.hit(2, 3.0, now=0.0)
+    assert len(limiter) == 2
+    # Через 2 секунды запас ключа 1 уже полон (TAT = 1), а у ключа 2 - еще нет (TAT = 3)
+    limiter.sweep(now=2.0)
+    assert len(limiter) == 1
+    # Очистка при обращении - не чаще sweep_interval
+    limiter.hit(3, now=5.0)
+    assert len(limiter) == 2
+    limiter.hit(3, now=20.0)
+    assert len(limiter) == 1
+
+
+def test_swept_key_behaves_as_new():
+    limiter = make_limiter(rate=1.0, burst=2.0)
+    limiter.hit(1, now=0.0)
+    limiter.sweep(now=10.0)
+    assert len(limiter) == 0
+    assert [limiter.hit(1, now=10.0)[0] for _ in range(3)] == [True, True, False]
+
+
+@pytest.mark.parametrize("rate, burst", [(0.0, 1.0), (1.0, 0.0), (-1.0, 1.0)])
+def test_invalid_parameters(rate, burst):
+    with pytest.raises(ValueError):
+        GCRALimiter(rate=rate, burst=burst)
@@ -0,0 +1,80 @@
+import pytest
+
+from utils.hyperloglog import HyperLogLog
+
+
+# Хэш детерминирован, поэтому оценки в тестах воспроизводимы. Допуск - три стандартные
+# ошибки (1.04 / sqrt(2^precision)): за ним оценка оказывается с вероятностью ~0.3%
+
+
+def estimate(values, precision: int = 12) -> HyperLogLog:
+    hll = HyperLogLog(precision)
+    for value in values:
+        hll.add(value)
+    return hll
+
+
+@pytest.mark.parametrize("count", [1_000, 10_000, 100_000])
+def test_error_within_bounds(count):
+    hll = estimate(range(count))
+    assert abs(hll.count() - count) <= 3 * hll.error * count
+
+
+@pytest.mark.parametrize("precision", [8, 10, 14])
+def test_error_depends_on_precision(precision):
+    count = 50_000
+    hll = estimate(range(10**9, 10**9 + count), precision)
+    assert hll.error == pytest.approx(1.04 / 2 ** (precision / 2))
+    assert abs(hll.count() - count) <= 3 * hll.error * count
+
+
+def test_small_counts_are_nearly_exact():
+    # Для малых значений работает линейный подсчет по пустым регистрам:
+    # ошибка - только от совпадения регистров у разных значений
+    assert estimate([]).count() == 0
+    assert estimate([42]).count() == 1
+    for count in (10, 100, 1_000):
+        hll = estimate(range(count))
+        assert abs(hll.count() - count) <= max(1, 3 * hll.error * count)
+
+
+def test_duplicates_do_not_change_estimate():
+    hll = estimate(range(5_000))
+    before = hll.count()
+    for value in range(5_000):
+        hll.add(value)
+    assert hll.count() == before
+
+
+def test_telegram_like_ids():
+    # ID пользователей Telegram - большие числа, идущие почти подряд
+    ids = range(5_000_000_000, 5_000_000_000 + 20_000)
+    hll = estimate(ids)
+    assert abs(hll.count() - 20_000) <= 3 * hll.error * 20_000
+
+
+def test_merge_is_union():
+    monday = estimate(range(0, 30_000))
+    tuesday = estimate(range(20_000, 50_000))
+    week = monday.copy()
+    week.merge(tuesday)
+    # Объединение - то же, что оценка по всем значениям сразу
+    assert week.to_bytes() == estimate(range(50_000)).to_bytes()
+    assert abs(week.count() - 50_000) <= 3 * week.error * 50_000
+    # Копия независима от исходной оценки
+    assert monday.to_bytes() == estimate(range(0, 30_000)).to_bytes()
+
+
+def test_restore_from_bytes():
+    hll = estimate(range(10_000))
+    restored = HyperLogLog(12, hll.to_bytes())
+    assert restored.count() == hll.count()
+
+
+def test_invalid_parameters():
+    with pytest.raises(ValueError):
+        HyperLogLog(3)
+    with pytest.raises(ValueError):
+        HyperLogLog(12, bytes(100))
+    with pytest.raises(ValueError):
+        HyperLogLog(12).merge(HyperLogLog(10))
@@ -0,0 +1,38 @@
+import json
+
+from aiogram import Bot
+
+from keyboards.inline import get_topics_keyboard
+from keyboards.menu import MAIN_MENU, MAIN_MENU_PLACEHOLDER, TOPICS, TOPICS_LAYOUT
+from keyboards.registry import keyboards
+from keyboards.reply import get_main_keyboard
+
+
+def serialize(markup) -> dict:
+    """Клавиатура в том виде, в каком сессия aiogram отправляет ее в Telegram"""
+    bot = Bot("123456:test")
+    return json.loads(bot.session.prepare_value(markup, bot=bot, files={}))
+
+
+def test_main_keyboard_serialization():
+    # Только заданные поля, без пустых (null) полей кнопок
+    assert serialize(keyboards.main) == {
+        "keyboard": [[{"text": text} for text in row] for row in MAIN_MENU],
+        "resize_keyboard": True,
+        "input_field_placeholder": MAIN_MENU_PLACEHOLDER,
+    }
+
+
+def test_topics_keyboard_serialization():
+    assert serialize(keyboards.topics) == {
+        "inline_keyboard": [
+            [{"text": TOPICS[key].title, "callback_data": f"topic:{key}"} for key in row]
+            for row in TOPICS_LAYOUT
+        ],
+    }
+
+
+def test_keyboards_are_built_once():
+    assert get_main_keyboard() is keyboards.main
+    assert get_topics_keyboard() is keyboards.topics
+
@@ -0,0 +1,87 @@
+import pytest
+
+from handlers.user import KEYWORD_TOPICS
+from utils.keyword_router import KeywordRouter
+
+
+@pytest.fixture(scope="module")
+def router() -> KeywordRouter:
+    # Таблица тем бота - тесты проверяют и автомат, и сами ключевые слова
+    return KeywordRouter(KEYWORD_TOPICS)
+
+
+@pytest.mark.parametrize("text, topic", [
+    ("hi", "greeting"),
+    ("Hi!", "greeting"),
+    ("hi, как дела", "greeting"),
+    ("(hi)", "greeting"),
+    ("say hi", "greeting"),
+    # Слово без "*" внутри другого слова не совпадает
+    ("this", None),
+    ("hint", None),
+    ("chi", None),
+    ("hi_there", None),
+    ("hi2", None),
+])
+def test_whole_word(router, text, topic):
+    assert router.route(text) == topic
+
+
+@pytest.mark.parametrize("text, topic", [
+    ("Приветствую всех", "greeting"),
+    ("стартапы", "business"),
+    ("о стартапах", "business"),
+    ("бизнес-план", "business"),
+    ("BUSINESSES", "business"),
+    # Шаблон начала слова должен начинаться на границе слова
+    ("микробизнес", None),
+    ("непривет", None),
+])
+def test_word_prefix(router, text, topic):
+    assert router.route(text) == topic
+
+
+@pytest.mark.parametrize("text, topic", [
+    ("ии", "ai"),
+    ("Что такое ИИ?", "ai"),
+    ("искусственный интеллект", "ai"),
+    ("про AI", "ai"),
+    ("chatgpt", "ai"),
+    # "ии" и "ai" не находятся внутри слов
+    ("линии", None),
+    ("again", None),
+    ("said", None),
+    # Без "*" окончание тоже должно быть на границе слова
+    ("gpts", None),
+])
+def test_cyrillic_and_phrases(router, text, topic):
+    assert router.route(text) == topic
+
+
+def test_topic_priority_is_table_order(router):
+    # Побеждает тема, объявленная раньше, независимо от позиции слова в тексте
+    assert router.route("стартап и ИИ") == "ai"
+    assert router.route("стартап, ИИ, привет") == "greeting"
+    assert router.route("нейросети для бизнеса") == "ai"
+
+
+def test_empty_and_unmatched(router):
+    assert router.route(None) is None
+    assert router.route("") is None
+    assert router.route("как дела?") is None
+
+
+def test_overlapping_keywords():
+    router = KeywordRouter({"short": ["he"], "long": ["hello*"]})
+    # "he" - целое слово только в первом случае, а "hello*" - начало слова во втором
+    assert router.route("he said") == "short"
+    assert router.route("hellooo") == "long"
+    assert router.route("she") is None
+    # Суффиксная ссылка: "ahello" не начинается на границе слова
+    assert router.route("ahello") is None
+
+
+def test_empty_keyword_is_ignored():
+    router = KeywordRouter({"empty": ["*", ""], "word": ["go"]})
+    assert router.route("go") == "word"
+    assert router.route("anything") is None
@@ -0,0 +1,59 @@
+import json
+import time
+import asyncio
+
+import pytest
+
+from utils.log_analyzer import analyze, analyze_async
+
+
+def write_events(directory, events, name="events.jsonl"):
+    with open(directory / name, "w", encoding="utf-8") as file:
+        for event in events:
+            file.write(json.dumps(event) + "\n")
+
+
+def sample_events():
+    now = time.time()
+    return [
+        {"t": now, "u": 1, "e": "message", "n": "alice"},
+        {"t": now, "u": 1, "e": "message", "n": "alice"},
+        {"t": now, "u": 2, "e": "callback"},
+        {"t": now - 30 * 86400, "u": 3, "e": "message"},
+        {"dropped": 4},
+    ]
+
+
+def test_analyze_counts_events(tmp_path):
+    write_events(tmp_path, sample_events())
+    result = analyze(str(tmp_path), workers=1)
+    assert result["events"] == 4 and result["dropped"] == 4
+    assert result["messages"]["total_messages"] == 3
+    assert result["messages"]["today_messages"] == 2
+    assert result["users"]["total_users"] == 3
+    assert result["users"]["active_today"] == 2
+    assert result["users"]["top_users"][0] == ("alice", 1, 2)
+
+
+def test_analyze_async_runs_analyzer_command(tmp_path):
+    # Два файла - две задачи, которые анализатор выполняет в пуле из двух процессов
+    write_events(tmp_path, sample_events())
+    write_events(tmp_path, sample_events(), "events.1.jsonl")
+    started = time.perf_counter()
+    result = asyncio.run(analyze_async(str(tmp_path), workers=2))
+    elapsed = time.perf_counter() - started
+    # Тот же результат, что и в текущем процессе (пары значений - списками JSON)
+    expected = analyze(str(tmp_path), workers=1)
+    assert result["users"]["total_users"] == expected["users"]["total_users"]
+    assert result["messages"] == json.loads(json.dumps(expected["messages"]))
+    assert result["users"]["top_users"][0] == ["alice", 1, 4]
+    assert result["events"] == 8 and result["files"] == 2
+    # Процессы анализатора не импортируют модули бота (aiogram и др.)
+    assert elapsed < 5.0
+
+
+def test_analyze_async_reports_failure(tmp_path):
+    # Поврежденный сжатый файл - анализатор завершается с ошибкой
+    (tmp_path / "events.jsonl.gz").write_bytes(b"not gzip")
+    with pytest.raises(RuntimeError, match="анализатор завершился с кодом"):
+        asyncio.run(analyze_async(str(tmp_path), workers=1))
@@ -0,0 +1,232 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import services.response_cache as response_cache_module
+from services.response_cache import ResponseCache, make_cache_key, normalize_prompt
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемые монотонные часы кэша (срок жизни записей)"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(response_cache_module, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_normalized_prompts_share_key():
+    assert normalize_prompt("  Как написать Бизнес-план?! ") == "как написать бизнес план"
+    assert normalize_prompt("Ёлка") == normalize_prompt("елка")
+    assert make_cache_key("Привет!", "gpt", "sys") == make_cache_key("привет", "gpt", "sys")
+    # Другая модель или системная инструкция - другой ключ
+    assert make_cache_key("привет", "gpt", "sys") != make_cache_key("привет", "gpt-2", "sys")
+    assert make_cache_key("привет", "gpt", "sys") != make_cache_key("привет", "gpt", "sys2")
+
+
+def test_lru_eviction_keeps_recently_used(clock):
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    # Обращение делает запись свежей - вытесняется давно не использованная
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.evictions_lru == 1
+
+
+def test_ttl_expiry(clock):
+    cache = ResponseCache(ttl=60.0)
+    cache.set("a", "1")
+    clock.value += 59.0
+    assert cache.get("a") == "1"
+    clock.value += 1.0
+    assert cache.get("a") is None
+    assert cache.evictions_ttl == 1
+    assert cache.current_bytes == 0
+
+
+def test_memory_limit_eviction(clock):
+    cache = ResponseCache(max_bytes=100)
+    cache.set("a", "x" * 40)
+    cache.set("b", "y" * 40)
+    cache.set("c", "z" * 40)
+    # Три записи по 41 байту не помещаются в 100 - вытесняется самая старая
+    assert cache.get("a") is None
+    assert cache.current_bytes == 82
+    assert cache.evictions_memory == 1
+    # Ответ больше всего лимита не кэшируется и ничего не вытесняет
+    cache.set("d", "w" * 200)
+    assert cache.get("d") is None
+    assert len(cache.entries) == 2
+
+
+def test_overwrite_updates_size(clock):
+    cache = ResponseCache()
+    cache.set("a", "x" * 10)
+    cache.set("a", "x" * 20)
+    assert len(cache.entries) == 1
+    assert cache.current_bytes == 21
+
+
+def test_empty_answer_is_not_cached(clock):
+    cache = ResponseCache()
+    cache.set("a", "")
+    assert cache.get("a") is None
+    assert cache.current_bytes == 0
+
+
+def test_single_flight_coalesces_concurrent_requests():
+    async def scenario():
+        cache = ResponseCache()
+        calls = 0
+        release = asyncio.Event()
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "ответ"
+
+        waiters = [asyncio.create_task(cache.get_or_compute("k", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(*waiters) == ["ответ"] * 5
+        # К API ушел один запрос, остальные присоединились к нему
+        assert calls == 1
+        assert (cache.misses, cache.coalesced) == (1, 4)
+        assert not cache.inflight
+        # Следующий запрос - из кэша
+        assert await cache.get_or_compute("k", compute) == "ответ"
+        assert cache.hits == 1 and calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_single_flight_error_is_shared_and_not_cached():
+    async def scenario():
+        cache = ResponseCache()
+        calls = 0
+
+        async def failing():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0)
+            raise RuntimeError("API недоступен")
+
+        results = await asyncio.gather(
+            *(cache.get_or_compute("k", failing) for _ in range(3)), return_exceptions=True
+        )
+        assert calls == 1
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert not cache.inflight and cache.get("k") is None
+
+        # После ошибки запрос выполняется заново
+        async def ok():
+            return "ответ"
+
+        assert await cache.get_or_compute("k", ok) == "ответ"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_cancel_shared_request():
+    async def scenario():
+        cache = ResponseCache()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "ответ"
+
+        first = asyncio.create_task(cache.get_or_compute("k", compute))
+        second = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await second == "ответ"
+        assert first.cancelled()
+        assert cache.get("k") == "ответ"
+
+    asyncio.run(scenario())
+
+
+def test_stream_followers_receive_leader_parts():
+    async def scenario():
+        cache = ResponseCache()
+        flight = cache.start_stream("k")
+        assert flight is not None
+        # Второй такой же потоковый запрос ведущим не становится
+        assert cache.start_stream("k") is None
+
+        async def collect():
+            return [part async for part in cache.follow("k")]
+
+        followers = [asyncio.create_task(collect()) for _ in range(2)]
+        flight.push("При")
+        await asyncio.sleep(0)
+        flight.push("вет")
+        # Обычная генерация того же вопроса ждет полный ответ потока
+        waiter = asyncio.create_task(cache.get_or_compute("k", lambda: pytest.fail("лишний запрос")))
+        await asyncio.sleep(0)
+        cache.finish_stream("k", flight, "Привет")
+
+        assert await asyncio.gather(*followers) == [["При", "вет"]] * 2
+        assert await waiter == "Привет"
+        assert not cache.inflight
+        assert cache.get("k") == "Привет"
+        # После завершения ответ отдается из кэша одной частью
+        assert [part async for part in cache.follow("k")] == ["Привет"]
+
+    asyncio.run(scenario())
+
+
+def test_failed_stream_is_not_cached():
+    async def scenario():
+        cache = ResponseCache()
+        flight = cache.start_stream("k")
+
+        async def collect():
+            return [part async for part in cache.follow("k")]
+
+        follower = asyncio.create_task(collect())
+        flight.push("част")
+        await asyncio.sleep(0)
+        cache.fail_stream("k", flight, TimeoutError())
+
+        with pytest.raises(TimeoutError):
+            await follower
+        assert not cache.inflight and cache.get("k") is None
+        # Нового запроса никто не ведет - follow() сообщает о промахе
+        assert cache.follow("k") is None
+
+    asyncio.run(scenario())
+
+
+def test_empty_stream_answer_is_not_cached():
+    async def scenario():
+        cache = ResponseCache()
+        flight = cache.start_stream("k")
+        cache.finish_stream("k", flight, "")
+        assert await flight.result == ""
+        assert cache.get("k") is None and not cache.inflight
+
+    asyncio.run(scenario())
+
+
+def test_stats():
+    async def scenario():
+        cache = ResponseCache()
+
+        async def compute():
+            return "ответ"
+
+        await cache.get_or_compute("k", compute)
+        await cache.get_or_compute("k", compute)
+        stats = cache.get_stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+        assert stats["hit_ratio"] == 0.5
+
+    asyncio.run(scenario())
@@ -0,0 +1,137 @@
+import random
+import asyncio
+import datetime
+
+from config import config
+from services.db import db
+from services.schema import create_tables
+from services.rollups import (
+    DAILY_USERS_RETENTION_DAYS, apply_events, backfill, prune_daily_users, rollup_table,
+)
+
+
+# Тесты выполняются на временной базе PostgreSQL (фикстура pg_database, TEST_DATABASE_URL)
+
+
+COLUMNS = ["timestamp", "event_type", "user_id", "username", "chat_id", "text", "data"]
+
+
+def make_batches(seed: int, batches: int = 6, size: int = 80):
+    """
+    Пачки событий с пересечением: одни и те же пользователи в разных пачках и днях,
+    события пачки - вперемешку по времени, в том числе запоздавшие за прошлые дни
+    """
+    rng = random.Random(seed)
+    now = datetime.datetime.now().replace(microsecond=0)
+    result = []
+    for _ in range(batches):
+        batch = []
+        for _ in range(size):
+            user_id = rng.randint(1, 40)
+            timestamp = now - datetime.timedelta(days=rng.randint(0, 10), minutes=rng.randint(0, 600))
+            event_type = rng.choice(["message", "message", "callback"])
+            username = rng.choice([None, f"user{user_id}"])
+            batch.append((timestamp, event_type, user_id, username, user_id, "текст", None))
+        result.append(batch)
+    return result
+
+
+async def write(conn, batch):
+    """Запись пачки так же, как фоновая запись логов: события и агрегаты в одной транзакции"""
+    async with conn.transaction():
+        await conn.copy_records_to_table(config.bot.basic_logs_db_table_name, records=batch, columns=COLUMNS)
+        await apply_events(conn, batch)
+
+
+async def snapshot(conn) -> dict:
+    return {
+        "daily_stats": [tuple(row) for row in await conn.fetch(
+            f"SELECT day, messages, events, active_users, last_active FROM {rollup_table('daily_stats')} ORDER BY day"
+        )],
+        "daily_users": [tuple(row) for row in await conn.fetch(
+            f"SELECT day, user_id FROM {rollup_table('daily_users')} ORDER BY day, user_id"
+        )],
+        "user_stats": [tuple(row) for row in await conn.fetch(
+            f"SELECT user_id, messages, events, first_seen, last_seen FROM {rollup_table('user_stats')} ORDER BY user_id"
+        )],
+        "totals": tuple(await conn.fetchrow(f"SELECT users, messages, events FROM {rollup_table('totals')}")),
+        "last_active": await conn.fetchval(f"SELECT SUM(last_active) FROM {rollup_table('daily_stats')}"),
+    }
+
+
+def test_apply_events_matches_backfill(pg_database):
+    async def scenario():
+        try:
+            async with db.acquire() as conn:
+                await create_tables(conn)
+                for batch in make_batches(seed=7):
+                    await write(conn, batch)
+                incremental = await snapshot(conn)
+                await backfill(conn)
+                exact = await snapshot(conn)
+            # Каждый пользователь ровно один раз учтен в своем последнем активном дне
+            assert incremental["last_active"] == incremental["totals"][0] == len(exact["user_stats"])
+            assert incremental == exact
+        finally:
+            await db.stop()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_writers_match_backfill(pg_database):
+    async def scenario():
+        try:
+            async with db.acquire() as conn:
+                await create_tables(conn)
+
+            # Пачки с общими пользователями записываются одновременно на разных соединениях
+            async def writer(batches):
+                for batch in batches:
+                    async with db.acquire() as conn:
+                        await write(conn, batch)
+
+            await asyncio.gather(writer(make_batches(seed=1)), writer(make_batches(seed=2)))
+            async with db.acquire() as conn:
+                incremental = await snapshot(conn)
+                await backfill(conn)
+                exact = await snapshot(conn)
+            assert incremental == exact
+        finally:
+            await db.stop()
+
+    asyncio.run(scenario())
+
+
+def test_daily_users_retention(pg_database):
+    async def scenario():
+        today = datetime.datetime.now().date()
+        old = datetime.datetime.now() - datetime.timedelta(days=DAILY_USERS_RETENTION_DAYS + 5)
+        recent = datetime.datetime.now() - datetime.timedelta(days=DAILY_USERS_RETENTION_DAYS - 1)
+        try:
+            async with db.acquire() as conn:
+                await create_tables(conn)
+                # Пары, записанные до появления срока хранения
+                await conn.execute(
+                    f"INSERT INTO {rollup_table('daily_users')} (day, user_id) VALUES ($1, 1), ($1, 2)", old.date()
+                )
+                # Запоздавшее событие старого дня не добавляет пару, событие в пределах срока - добавляет
+                await write(conn, [
+                    (old, "message", 3, None, 3, "текст", None),
+                    (recent, "message", 4, None, 4, "текст", None),
+                ])
+                assert await conn.fetchval(
+                    f"SELECT COUNT(*) FROM {rollup_table('daily_users')} WHERE day = $1", old.date()
+                ) == 2
+
+                assert await prune_daily_users(conn, today) == 2
+                assert await prune_daily_users(conn, today) == 0
+                rows = await conn.fetch(f"SELECT day, user_id FROM {rollup_table('daily_users')}")
+                assert [tuple(row) for row in rows] == [(recent.date(), 4)]
+                # Остальные агрегаты учитывают оба события
+                assert tuple(await conn.fetchrow(
+                    f"SELECT users, messages, events FROM {rollup_table('totals')}"
+                )) == (2, 2, 2)
+        finally:
+            await db.stop()
+
+    asyncio.run(scenario())
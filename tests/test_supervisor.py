@@ -0,0 +1,102 @@
+import time
+import asyncio
+
+from supervisor import Supervisor
+
+
+class FakeProcess:
+    """Процесс воркера без запуска: состояние задается тестом"""
+
+    pid = 1
+    exitcode = 1
+
+    def __init__(self, alive: bool = True):
+        self.alive = alive
+
+    def is_alive(self) -> bool:
+        return self.alive
+
+
+class FakeChannel:
+    def close(self):
+        pass
+
+
+def make_supervisor(**kwargs) -> Supervisor:
+    supervisor = Supervisor(None, workers=1, queue_size=2, **kwargs)
+    worker = supervisor.workers[0]
+    worker.process = FakeProcess()
+    worker.updates_conn = FakeChannel()
+    # Перезапуск только отмечается: новый процесс считается работающим
+    supervisor.spawned = []
+
+    def spawn(handle):
+        supervisor.spawned.append(handle.index)
+        handle.process = FakeProcess()
+        handle.updates_conn = FakeChannel()
+        handle.started_at = time.monotonic()
+
+    supervisor.spawn = spawn
+    return supervisor
+
+
+def test_dead_worker_does_not_block_routing():
+    async def scenario():
+        supervisor = make_supervisor(restart_delay=0.05)
+        worker = supervisor.workers[0]
+        worker.process.alive = False
+        results = [await asyncio.wait_for(supervisor._route(worker, (1, {})), timeout=1.0) for _ in range(5)]
+        # Очередь принимает два обновления, остальные отбрасываются без ожидания
+        assert results == [True, True, False, False, False]
+        assert worker.dropped == 3 and worker.queue.qsize() == 2
+
+    asyncio.run(scenario())
+
+
+def test_alive_worker_applies_backpressure():
+    async def scenario():
+        supervisor = make_supervisor(restart_delay=0.05)
+        worker = supervisor.workers[0]
+        for _ in range(2):
+            assert await supervisor._route(worker, (1, {}))
+        route = asyncio.create_task(supervisor._route(worker, (1, {})))
+        await asyncio.sleep(0.2)
+        # Полная очередь работающего воркера: ждем места, ничего не отбрасывая
+        assert not route.done()
+        worker.queue.get_nowait()
+        assert await route and worker.dropped == 0
+
+        # Воркер упал, пока его ждали: ожидание прерывается
+        route = asyncio.create_task(supervisor._route(worker, (1, {})))
+        await asyncio.sleep(0.01)
+        worker.process.alive = False
+        assert await asyncio.wait_for(route, timeout=1.0) is False
+        assert worker.dropped == 1
+
+    asyncio.run(scenario())
+
+
+def test_restarts_back_off_and_never_stop():
+    supervisor = make_supervisor(restart_delay=1.0, restart_max_delay=8.0, max_restarts=3)
+    worker = supervisor.workers[0]
+    now = 1000.0
+    delays = []
+    for _ in range(6):
+        worker.process.alive = False
+        supervisor._check_workers(now)
+        # Перезапуск назначен, но до истечения паузы не выполняется
+        delay = worker.restart_at - now
+        delays.append(delay)
+        supervisor._check_workers(now + delay - 0.01)
+        assert worker.updates_conn is None
+        now += delay
+        supervisor._check_workers(now)
+        assert worker.process.is_alive()
+    assert delays == [1.0, 2.0, 4.0, 8.0, 8.0, 8.0]
+    assert supervisor.spawned == [0] * 6 and worker.restarts == 6
+    assert worker.down
+
+    # Проработав дольше предельной паузы, воркер снова считается работающим
+    worker.started_at = time.monotonic() - 10.0
+    supervisor._check_workers(time.monotonic())
+    assert not worker.down and worker.crashes == 0
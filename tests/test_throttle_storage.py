@@ -0,0 +1,212 @@
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # Lua-скрипты в fakeredis
+
+from services.throttle_storage import MemoryThrottleStorage, RedisThrottleStorage, ThrottleStorage
+
+
+# Тесты общего хранилища выполняются на fakeredis: сервер Redis в памяти процесса
+# с тем же Lua-интерпретатором скриптов. Несколько экземпляров хранилища с общим
+# FakeServer - это несколько процессов бота с одним сервером Redis
+
+
+def make_storage(server, rate=1.0, burst=5.0, lease_fraction=0.0, lease_ttl=1.0) -> RedisThrottleStorage:
+    return RedisThrottleStorage(
+        rate=rate, burst=burst, lease_fraction=lease_fraction, lease_ttl=lease_ttl,
+        client=fakeredis.FakeAsyncRedis(server=server),
+    )
+
+
+async def spend(storage, key, times: int, cost: float = 1.0) -> int:
+    """Количество разрешенных из times запросов"""
+    allowed = 0
+    for _ in range(times):
+        ok, _ = await storage.hit(key, cost)
+        allowed += ok
+    return allowed
+
+
+def test_burst_then_retry_after():
+    async def scenario():
+        storage = make_storage(fakeredis.FakeServer())
+        assert await spend(storage, 1, 5) == 5
+        allowed, retry_after = await storage.hit(1)
+        assert not allowed
+        # Следующая единица восстанавливается за 1 / rate секунд
+        assert 0.9 < retry_after <= 1.0
+        # Другой ключ не затронут
+        assert await spend(storage, 2, 1) == 1
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_cost_is_charged_in_units():
+    async def scenario():
+        storage = make_storage(fakeredis.FakeServer())
+        # Запрос стоимостью 3 из запаса 5 - второй такой уже не помещается
+        assert (await storage.hit(1, 3.0))[0]
+        allowed, retry_after = await storage.hit(1, 3.0)
+        assert not allowed
+        assert 0.9 < retry_after <= 1.0
+        assert (await storage.hit(1, 2.0))[0]
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_instances_share_limit_atomically():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        instances = [make_storage(server) for _ in range(4)]
+        # Одновременные запросы из четырех "процессов" - запас 5 выдается ровно один раз
+        results = await asyncio.gather(*(
+            instance.hit(42) for _ in range(10) for instance in instances
+        ))
+        assert sum(allowed for allowed, _ in results) == 5
+        for instance in instances:
+            await instance.close()
+
+    asyncio.run(scenario())
+
+
+def test_lease_overshoot_is_bounded():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        instances = [make_storage(server, lease_fraction=0.5, lease_ttl=10.0) for _ in range(3)]
+        allowed = 0
+        for _ in range(10):
+            for instance in instances:
+                allowed += await spend(instance, 7, 1)
+        # Сверх запаса - не больше lease_fraction от запаса на каждый процесс
+        assert 5 <= allowed <= 5 + len(instances) * 0.5 * 5
+        assert sum(instance.local_hits for instance in instances) > 0
+        for instance in instances:
+            await instance.close()
+
+    asyncio.run(scenario())
+
+
+def test_lease_spend_is_reported_on_next_remote_hit():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        storage = make_storage(server, lease_fraction=0.5, lease_ttl=10.0)
+        other = make_storage(server)
+        # Первый запрос - сервер (остается 4, аренда 2), два следующих - по аренде
+        assert await spend(storage, 1, 3) == 3
+        assert storage.local_hits == 2
+        # Аренда исчерпана: следующий запрос идет на сервер вместе с потраченным по ней
+        assert await spend(storage, 1, 1) == 1
+        assert storage.leases[1][2] == 0.0
+        # Другой процесс видит все 4 потраченные единицы
+        assert await spend(other, 1, 5) == 1
+        await storage.close()
+        await other.close()
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_spend_is_reported_by_sweep():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        storage = make_storage(server, lease_fraction=1.0, lease_ttl=0.05)
+        other = make_storage(server)
+        assert await spend(storage, 1, 3) == 3          # 1 на сервере, 2 по аренде
+        assert storage.leases[1][2] == 2.0
+        await asyncio.sleep(0.1)
+        # Запрос другого пользователя запускает очистку: аренда истекла и удаляется,
+        # а потраченное по ней передается на сервер
+        await storage.hit(2)
+        assert 1 not in storage.leases
+        await asyncio.gather(*storage.report_tasks)
+        # Из запаса 5 потрачено 3 (восстановилось не больше одной единицы за время теста)
+        assert await spend(other, 1, 5) in (2, 3)
+        await storage.close()
+        await other.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_reports_active_leases():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        storage = make_storage(server, lease_fraction=1.0, lease_ttl=10.0)
+        assert await spend(storage, 1, 4) == 4          # 1 на сервере, 3 по аренде
+        await storage.close()
+        other = make_storage(server)
+        assert await spend(other, 1, 5) == 1
+        await other.close()
+
+    asyncio.run(scenario())
+
+
+def test_redis_unavailable_allows_requests():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        server.connected = False
+        storage = make_storage(server)
+        # Недоступность Redis не останавливает бота: запросы разрешаются и считаются ошибками
+        assert await spend(storage, 1, 10) == 10
+        assert storage.errors == 10
+        assert storage.get_stats()["errors"] == 10
+
+        # После восстановления сервера ограничение снова действует
+        server.connected = True
+        assert await spend(storage, 1, 10) == 5
+
+    asyncio.run(scenario())
+
+
+def test_report_error_does_not_drop_other_keys():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        storage = make_storage(server, lease_fraction=1.0, lease_ttl=10.0)
+        other = make_storage(server)
+        for key in (1, 2, 3):
+            assert await spend(storage, key, 3) == 3      # 1 на сервере, 2 по аренде
+
+        # Передача по ключу 2 завершается ошибкой, остальные ключи все равно передаются
+        script = storage.script
+
+        async def flaky(keys, args):
+            if keys == ["throttle:2"]:
+                raise ConnectionError("Redis недоступен")
+            return await script(keys=keys, args=args)
+
+        storage.script = flaky
+        await storage.close()
+        assert storage.errors == 1
+        assert storage.lost_spend == 2.0
+        assert storage.get_stats()["lost_spend"] == 2.0
+        # Ключи 1 и 3: потрачено 3 из 5, ключ 2: сервер знает только об одной единице
+        assert await spend(other, 1, 5) in (2, 3)
+        assert await spend(other, 3, 5) in (2, 3)
+        assert await spend(other, 2, 5) in (4, 5)
+        await other.close()
+
+    asyncio.run(scenario())
+
+
+def test_memory_storage_matches_redis_decisions():
+    async def scenario():
+        redis_storage = make_storage(fakeredis.FakeServer(), rate=2.0, burst=4.0)
+        memory_storage = MemoryThrottleStorage(rate=2.0, burst=4.0)
+        for cost in (1.0, 0.5, 2.0, 1.0, 0.5, 3.0):
+            assert (await redis_storage.hit(1, cost))[0] == (await memory_storage.hit(1, cost))[0]
+        await redis_storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_storage_interface_is_abstract():
+    with pytest.raises(TypeError):
+        ThrottleStorage()
+
+    class Incomplete(ThrottleStorage):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
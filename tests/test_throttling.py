@@ -0,0 +1,123 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram import Dispatcher
+
+from config import config
+from handlers import register_all_handlers
+from handlers.common import cmd_help, cmd_start
+from handlers.user import handle_keyword_topic, handle_other_messages
+from middlewares.throttling import ThrottlingMiddleware
+from services.throttle_storage import MemoryThrottleStorage
+
+
+class FakeMessage:
+    """Сообщение с отправителем и записью ответов бота"""
+
+    def __init__(self, user_id: int):
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+
+    async def answer(self, text: str):
+        self.answers.append(text)
+
+
+@pytest.fixture(scope="module")
+def handlers():
+    """Обработчики в том виде, в каком их регистрирует бот, по функции обработчика"""
+    dp = Dispatcher()
+    register_all_handlers(dp)
+    return {handler.callback: handler for handler in dp.message.handlers}
+
+
+def make_middleware() -> ThrottlingMiddleware:
+    # Запас - как у бота, а скорость восстановления ничтожная: запас не пополняется во время теста
+    return ThrottlingMiddleware(storage=MemoryThrottleStorage(rate=0.001, burst=config.throttling.burst))
+
+
+async def send(middleware, handler, message) -> bool:
+    """Сообщение через middleware: True, если оно дошло до обработчика"""
+    async def reached(event, data):
+        return True
+
+    return bool(await middleware(reached, message, {"handler": handler}))
+
+
+def test_default_costs():
+    assert config.throttling.burst == 5
+    assert config.throttling.llm_cost == 3
+
+
+def test_handler_cost_flags(handlers):
+    assert handlers[handle_other_messages].flags["throttling_cost"] == config.throttling.llm_cost
+    assert handlers[cmd_start].flags["throttling_cost"] == 0.5
+    assert handlers[cmd_help].flags["throttling_cost"] == 0.5
+    # Ответы по ключевым словам стоят по умолчанию - одну единицу
+    assert "throttling_cost" not in handlers[handle_keyword_topic].flags
+
+
+def test_llm_message_spends_three_units(handlers):
+    async def scenario():
+        middleware = make_middleware()
+        message = FakeMessage(1)
+        llm = handlers[handle_other_messages]
+        # Из запаса 5 помещается один запрос к OpenAI, второму не хватает единицы
+        assert await send(middleware, llm, message)
+        assert not await send(middleware, llm, message)
+        # Оставшиеся 2 единицы - четыре команды /start или /help
+        assert [await send(middleware, handlers[cmd_help], message) for _ in range(5)] == [True] * 4 + [False]
+
+    asyncio.run(scenario())
+
+
+def test_start_and_help_cost_half_unit(handlers):
+    async def scenario():
+        middleware = make_middleware()
+        message = FakeMessage(1)
+        commands = [handlers[cmd_start], handlers[cmd_help]] * 6
+        results = [await send(middleware, handler, message) for handler in commands]
+        # Запас 5 - десять команд по 0.5
+        assert results == [True] * 10 + [False] * 2
+
+    asyncio.run(scenario())
+
+
+def test_keyword_message_costs_one_unit(handlers):
+    async def scenario():
+        middleware = make_middleware()
+        message = FakeMessage(1)
+        results = [await send(middleware, handlers[handle_keyword_topic], message) for _ in range(6)]
+        assert results == [True] * 5 + [False]
+
+    asyncio.run(scenario())
+
+
+def test_users_are_limited_separately(handlers):
+    async def scenario():
+        middleware = make_middleware()
+        llm = handlers[handle_other_messages]
+        first, second = FakeMessage(1), FakeMessage(2)
+        assert await send(middleware, llm, first)
+        assert not await send(middleware, llm, first)
+        assert await send(middleware, llm, second)
+
+    asyncio.run(scenario())
+
+
+def test_notifies_once_per_limited_period(handlers):
+    async def scenario():
+        middleware = make_middleware()
+        message = FakeMessage(1)
+        llm = handlers[handle_other_messages]
+        assert await send(middleware, llm, message)
+        for _ in range(3):
+            assert not await send(middleware, llm, message)
+        assert len(message.answers) == 1
+        assert message.answers[0].startswith("⏳")
+        # После разрешенного сообщения следующее ограничение снова сопровождается уведомлением
+        assert await send(middleware, handlers[cmd_start], message)
+        assert not await send(middleware, llm, message)
+        assert len(message.answers) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+import asyncio
+
+from services.token_budget import TokenBudget
+
+
+def make_budget(tmp_path, index: int, workers: int = 2) -> TokenBudget:
+    """Учет токенов воркера с файлами, как их настраивает супервизор"""
+    budget = TokenBudget(str(tmp_path / f"usage.json.worker{index}"), daily_quota=1000)
+    budget.peer_paths = [str(tmp_path / f"usage.json.worker{other}") for other in range(workers) if other != index]
+    return budget
+
+
+def test_quota_is_shared_between_workers(tmp_path):
+    async def scenario():
+        first, second = make_budget(tmp_path, 0), make_budget(tmp_path, 1)
+        # Пользователь 1 пишет в чаты обоих воркеров (личный чат и группа)
+        first.record(1, 300, 300)
+        second.record(1, 200, 200)
+        second.record(2, 50, 50)
+        await second.save()
+        await first.refresh_peers()
+
+        assert first.used(1) == 1000 and first.total(1) == 1000
+        assert first.remaining(1) == 0 and not first.allow(1)
+        assert first.top_users() == [(1, 1000), (2, 100)]
+        stats = first.get_stats()
+        assert stats["day"] == 1100 and stats["users"] == 2
+        # Свой файл содержит только свой расход
+        await first.save()
+        restored = TokenBudget(first.path, daily_quota=1000)
+        restored.load()
+        assert restored.used(1) == 600 and restored.used(2) == 0
+
+    asyncio.run(scenario())
+
+
+def test_missing_peer_files_are_skipped(tmp_path):
+    async def scenario():
+        budget = make_budget(tmp_path, 0, workers=3)
+        (tmp_path / "usage.json.worker2").write_text("{broken", encoding="utf-8")
+        budget.record(1, 10, 10)
+        await budget.refresh_peers()
+        assert budget.used(1) == 20 and budget.peer_usage == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,135 @@
+import asyncio
+import datetime
+from typing import Any, AsyncIterator, List, Optional
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Message
+
+from webhook import FastPathRequestHandler
+
+
+# FastPathRequestHandler опирается на сборку ответа aiogram (_build_response_writer):
+# тест проверяет оба пути на установленной версии aiogram
+
+
+SECRET = "test-secret"
+
+
+class RecordingSession(BaseSession):
+    """Сессия Bot API без сети: запоминает отправленные отдельными запросами методы"""
+
+    def __init__(self):
+        super().__init__()
+        self.sent: List[TelegramMethod] = []
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.sent.append(method)
+        return True
+
+    async def stream_content(self, *args, **kwargs) -> AsyncIterator[bytes]:
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def make_update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.datetime.now().timestamp()),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "u"},
+            "text": text,
+        },
+    }
+
+
+async def fast(message: Message):
+    return message.answer("быстро")
+
+
+async def slow(message: Message):
+    await asyncio.sleep(0.2)
+    return message.answer("медленно")
+
+
+async def make_client(answer_timeout: float):
+    bot = Bot("123456:test", session=RecordingSession())
+    dp = Dispatcher()
+    dp.message.register(fast, F.text == "fast")
+    dp.message.register(slow, F.text == "slow")
+    handler = FastPathRequestHandler(dispatcher=dp, bot=bot, answer_timeout=answer_timeout, secret_token=SECRET)
+    app = web.Application()
+    handler.register(app, path="/webhook")
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    return client, bot, handler
+
+
+async def post(client: TestClient, update: dict, secret: str = SECRET):
+    response = await client.post("/webhook", json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+    return response.status, await response.read()
+
+
+async def drain(handler: FastPathRequestHandler):
+    """Ожидание фоновой обработки и отложенных отправок"""
+    while handler.tasks:
+        await asyncio.gather(*handler.tasks)
+
+
+def test_fast_handler_answers_in_response():
+    async def scenario():
+        client, bot, _ = await make_client(answer_timeout=0.1)
+        status, body = await post(client, make_update(1, "fast"))
+        assert status == 200
+        # Метод отправлен в теле ответа (multipart), отдельного запроса к Bot API нет
+        assert b"sendMessage" in body and "быстро".encode() in body
+        assert bot.session.sent == []
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_slow_handler_is_sent_separately():
+    async def scenario():
+        client, bot, handler = await make_client(answer_timeout=0.05)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        status, body = await post(client, make_update(2, "slow"))
+        # Запрос Telegram не ждет обработчик дольше answer_timeout
+        assert loop.time() - started < 0.15
+        assert status == 200 and body == b"{}"
+        await drain(handler)
+        assert [method.text for method in bot.session.sent] == ["медленно"]
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_zero_timeout_never_waits():
+    async def scenario():
+        client, bot, handler = await make_client(answer_timeout=0.0)
+        status, body = await post(client, make_update(3, "fast"))
+        assert status == 200 and body == b"{}"
+        await drain(handler)
+        assert [method.text for method in bot.session.sent] == ["быстро"]
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_wrong_secret_is_rejected():
+    async def scenario():
+        client, bot, handler = await make_client(answer_timeout=0.1)
+        status, _ = await post(client, make_update(4, "fast"), secret="wrong")
+        assert status == 401
+        assert not handler.tasks and bot.session.sent == []
+        await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,40 @@
+import os
+import sys
+import asyncio
+
+
+# Добавляем родительский каталог в sys.path для импорта config
+# Это позволяет импортировать модули из родительской директории
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from services.db import db
+from services.rollups import backfill
+from services.schema import create_tables
+
+
+async def backfill_stats():
+    """Пересчет таблиц агрегатов /stats по уже накопленным логам"""
+    try:
+        async with db.acquire() as conn:
+            # Таблицы агрегатов могут еще не существовать в старой базе
+            await create_tables(conn)
+            users, events = await backfill(conn)
+            print(f"Агрегаты пересчитаны: {users} пользователей, {events} событий")
+
+    except Exception as e:
+        # Обрабатываем возможные ошибки при подключении или выполнении запросов
+        print(f"Ошибка при пересчете агрегатов: {e}")
+
+
+async def main():
+    """Создание пула, пересчет агрегатов и корректное закрытие пула"""
+    await db.start()
+    try:
+        await backfill_stats()
+    finally:
+        await db.stop()
+
+
+# Проверяем, запущен ли скрипт напрямую (а не импортирован)
+if __name__ == "__main__":
+    # Пересчет нужен один раз после обновления бота на базе с накопленными логами
+    asyncio.run(main())
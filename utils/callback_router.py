@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional
+
+
+@dataclass(frozen=True)
+class Route:
+    """Маршрут callback-запроса: обработчик и заранее подготовленные для него данные"""
+    name: str                    # Полные данные callback ("topic:business_plan") - для логов
+    handler: Callable[..., Awaitable[Any]]  # Обработчик (callback, payload)
+    payload: Any                 # Готовый ответ или другие данные маршрута
+
+
+class CallbackRouter:
+    """
+    Таблица маршрутов callback-запросов
+
+    Данные callback имеют вид "<префикс>:<значение>". Таблица - два уровня словарей
+    (префикс -> значение -> маршрут), поэтому нажатие кнопки разбирается одним
+    разбиением строки и двумя поисками в словаре, независимо от количества кнопок,
+    вместо проверки цепочки фильтров для каждого обработчика.
+    """
+
+    def __init__(self, separator: str = ":"):
+        """
+        :param separator: разделитель префикса и значения в данных callback
+        """
+        self.separator = separator
+        self.table: Dict[str, Dict[str, Route]] = {}
+
+    def add(self, prefix: str, handler: Callable[..., Awaitable[Any]], payloads: Mapping[str, Any]):
+        """
+        Регистрация маршрутов одного префикса
+
+        :param prefix: префикс данных callback
+        :param handler: обработчик всех значений префикса
+        :param payloads: значение -> данные, которые получит обработчик
+        """
+        routes = self.table.setdefault(prefix, {})
+        for value, payload in payloads.items():
+            routes[value] = Route(f"{prefix}{self.separator}{value}", handler, payload)
+
+    def resolve(self, data: Optional[str]) -> Optional[Route]:
+        """
+        Поиск маршрута по данным callback
+
+        :return: Маршрут или None, если кнопка неизвестна (например, из старой версии бота)
+        """
+        if not data:
+            return None
+        prefix, _, value = data.partition(self.separator)
+        routes = self.table.get(prefix)
+        if routes is None:
+            return None
+        return routes.get(value)
+
+    def __len__(self) -> int:
+        return sum(len(routes) for routes in self.table.values())
@@ -0,0 +1,62 @@
+import time
+from typing import Dict, Hashable, Optional, Tuple
+
+
+class GCRALimiter:
+    """
+    Ограничение частоты запросов по алгоритму GCRA (Generic Cell Rate Algorithm)
+
+    Эквивалентен token bucket с емкостью burst и пополнением rate токенов в секунду,
+    но хранит на каждого пользователя одно число - теоретическое время прибытия (TAT).
+    Пользователь, чей TAT уже в прошлом, имеет полный запас и из памяти удаляется,
+    поэтому хранятся только недавно активные пользователи.
+    """
+
+    def __init__(self, rate: float = 1.0, burst: float = 3.0, sweep_interval: float = 60.0):
+        """
+        :param rate: устойчивая скорость (единиц стоимости в секунду)
+        :param burst: сколько единиц стоимости можно потратить разом после простоя
+        :param sweep_interval: интервал удаления записей простаивающих пользователей (в секундах)
+        """
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate и burst должны быть положительными")
+        self.rate = rate
+        self.burst = burst
+        self.emission_interval = 1.0 / rate        # Время восстановления одной единицы
+        self.burst_offset = burst / rate           # Насколько TAT может опережать текущее время
+        self.sweep_interval = sweep_interval
+
+        self.tats: Dict[Hashable, float] = {}      # Ключ -> теоретическое время прибытия
+        self.last_sweep = time.monotonic()
+
+    def hit(self, key: Hashable, cost: float = 1.0, now: Optional[float] = None) -> Tuple[bool, float]:
+        """
+        Попытка потратить cost единиц
+
+        :param key: ключ ограничения (обычно ID пользователя)
+        :param cost: стоимость запроса
+        :param now: текущее время по монотонным часам (для тестов)
+        :return: (разрешено ли, через сколько секунд запрос будет разрешен)
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.last_sweep >= self.sweep_interval:
+            self.sweep(now)
+
+        tat = max(self.tats.get(key, now), now)
+        new_tat = tat + cost * self.emission_interval
+        allow_at = new_tat - self.burst_offset
+        if now < allow_at:
+            # Запрос отклонен, состояние не меняется: отклоненные запросы не продлевают блокировку
+            return False, allow_at - now
+
+        self.tats[key] = new_tat
+        return True, 0.0
+
+    def sweep(self, now: Optional[float] = None):
+        """Удаление пользователей с полным запасом - их состояние совпадает с отсутствующим"""
+        now = time.monotonic() if now is None else now
+        self.tats = {key: tat for key, tat in self.tats.items() if tat > now}
+        self.last_sweep = now
+
+    def __len__(self) -> int:
+        return len(self.tats)
@@ -0,0 +1,62 @@
+import bisect
+import hashlib
+from typing import Dict, Hashable, Iterable, List
+
+
+def _hash(key: str) -> int:
+    """
+    Стабильный 64-битный хэш строки
+
+    Встроенный hash() для строк различается между процессами (PYTHONHASHSEED),
+    поэтому используется blake2b - одинаковый в любом процессе и при любом запуске.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Консистентное хэширование ключей по узлам
+
+    Каждый узел размещается на кольце в replicas точках. Ключ достается первому узлу
+    по часовой стрелке от своего хэша. При добавлении или удалении узла переезжает
+    только ~1/N ключей, а не почти все, как при hash(key) % N.
+    """
+
+    def __init__(self, nodes: Iterable[Hashable] = (), replicas: int = 64):
+        """
+        :param nodes: начальные узлы
+        :param replicas: количество точек узла на кольце (больше - равномернее распределение)
+        """
+        self.replicas = replicas
+        self.points: List[int] = []              # Отсортированные точки кольца
+        self.owners: Dict[int, Hashable] = {}    # Точка -> узел
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: Hashable):
+        """Добавление узла на кольцо"""
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if point in self.owners:
+                continue
+            self.owners[point] = node
+            bisect.insort(self.points, point)
+
+    def remove(self, node: Hashable):
+        """Удаление узла с кольца"""
+        for replica in range(self.replicas):
+            point = _hash(f"{node}#{replica}")
+            if self.owners.get(point) == node:
+                del self.owners[point]
+                self.points.remove(point)
+
+    def get(self, key: Hashable) -> Hashable:
+        """
+        Узел, отвечающий за ключ
+
+        :raises LookupError: если на кольце нет узлов
+        """
+        if not self.points:
+            raise LookupError("На кольце нет узлов")
+        index = bisect.bisect(self.points, _hash(str(key))) % len(self.points)
+        return self.owners[self.points[index]]
@@ -0,0 +1,119 @@
+from collections import deque
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    """Является ли символ частью слова (буква, цифра или подчеркивание)"""
+    return ch.isalnum() or ch == "_"
+
+
+class KeywordRouter:
+    """
+    Маршрутизатор сообщений по ключевым словам
+
+    Все ключевые слова всех тем компилируются один раз в автомат Ахо-Корасик,
+    поэтому сообщение просматривается за один проход независимо от количества слов.
+
+    Формат ключевых слов:
+    - "hi"      - совпадение только целым словом ("hi", "hi!"), но не внутри "this";
+    - "бизнес*" - совпадение с началом слова ("бизнес", "бизнесом", "бизнес-план").
+    Совпадение всегда начинается на границе слова. Регистр не учитывается.
+
+    Если сообщение подходит под несколько тем, побеждает тема, объявленная раньше.
+    """
+
+    def __init__(self, topics: Mapping[str, Iterable[str]]):
+        """
+        :param topics: Упорядоченное соответствие "тема -> ключевые слова"
+        """
+        # Приоритет темы - ее позиция в таблице (меньше - важнее)
+        self.topics: List[str] = list(topics)
+
+        # Описание шаблонов: (длина, приоритет темы, совпадение с началом слова)
+        self.patterns: List[Tuple[int, int, bool]] = []
+
+        # Автомат: переходы, суффиксные ссылки и шаблоны, заканчивающиеся в узле
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[int]] = [[]]
+
+        for priority, topic in enumerate(self.topics):
+            for keyword in topics[topic]:
+                self._add(keyword, priority)
+        self._build_fail_links()
+
+    def _add(self, keyword: str, priority: int):
+        """Добавление ключевого слова в бор"""
+        prefix = keyword.endswith("*")
+        word = keyword.rstrip("*").lower()
+        if not word:
+            return
+
+        node = 0
+        for ch in word:
+            next_node = self.goto[node].get(ch)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][ch] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+            node = next_node
+
+        self.output[node].append(len(self.patterns))
+        self.patterns.append((len(word), priority, prefix))
+
+    def _build_fail_links(self):
+        """Построение суффиксных ссылок обходом бора в ширину"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                # Ищем самый длинный собственный суффикс, который тоже есть в боре
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                fallback = self.goto[state].get(ch, 0)
+                self.fail[child] = fallback if fallback != child else 0
+                # Шаблоны суффикса тоже заканчиваются в этом узле
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def route(self, text: Optional[str]) -> Optional[str]:
+        """
+        Определение темы сообщения за один проход по тексту
+
+        :param text: Текст сообщения
+        :return: Тема с наивысшим приоритетом или None, если ключевых слов нет
+        """
+        if not text:
+            return None
+
+        goto, fail, output, patterns = self.goto, self.fail, self.output, self.patterns
+        best = len(self.topics)
+        length = len(text)
+        state = 0
+
+        for i, ch in enumerate(text):
+            ch = ch.lower()
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+
+            for index in output[state]:
+                size, priority, prefix = patterns[index]
+                if priority >= best:
+                    continue
+                start = i - size + 1
+                # Слово должно начинаться на границе слова...
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                # ...и, если это не шаблон начала слова, на ней же заканчиваться
+                if not prefix and i + 1 < length and _is_word_char(text[i + 1]):
+                    continue
+                best = priority
+                # Тему с наивысшим приоритетом уже не перебить
+                if best == 0:
+                    return self.topics[0]
+
+        return self.topics[best] if best < len(self.topics) else None
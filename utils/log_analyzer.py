@@ -0,0 +1,376 @@
+import os
+import sys
+import gzip
+import json
+import mmap
+import bisect
+import asyncio
+import argparse
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+# Добавляем родительский каталог в sys.path для импорта модулей бота
+# Это позволяет запускать анализатор напрямую: python utils/log_analyzer.py
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+from utils.hyperloglog import HyperLogLog
+
+
+# Точность оценок уникальных пользователей: 16 КБ на оценку, ошибка ~0.8%.
+# До нескольких тысяч пользователей оценка практически точная (линейный подсчет)
+HLL_PRECISION = 14
+
+# Сколько самых активных пользователей отслеживается точно (алгоритм Misra-Gries).
+# Если пользователей меньше, топ точный; иначе счетчик занижен не более чем на N / (k + 1)
+TOP_CAPACITY = 10000
+
+# Размер части файла для одного процесса: большие несжатые файлы делятся на части
+CHUNK_SIZE = 64 * 1024 * 1024
+
+# Сколько ID пользователей запоминается, чтобы не добавлять их в оценки повторно
+_SEEN_CACHE_SIZE = 65536
+
+
+def find_event_files(directory: str) -> List[str]:
+    """
+    Файлы журнала событий в каталоге логов (текущие и ротированные, в том числе сжатые)
+
+    :param directory: каталог логов
+    :return: Отсортированный список путей
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith("events") and (name.endswith(".jsonl") or name.endswith(".jsonl.gz"))
+    )
+
+
+def _plan_tasks(paths: List[str], chunk_size: int) -> List[Tuple[str, int, int]]:
+    """
+    Разбиение файлов на задачи (путь, начало, конец)
+
+    Сжатые файлы читаются последовательно целиком (конец -1), несжатые делятся
+    на части по chunk_size байт - границы выравниваются по строкам при чтении.
+    """
+    tasks = []
+    for path in paths:
+        if path.endswith(".gz"):
+            tasks.append((path, 0, -1))
+            continue
+        size = os.path.getsize(path)
+        for start in range(0, size, chunk_size):
+            tasks.append((path, start, min(start + chunk_size, size)))
+    return tasks
+
+
+def _iter_lines(path: str, start: int, end: int) -> Iterator[bytes]:
+    """
+    Строки части файла
+
+    Несжатый файл отображается в память (mmap): ОС подгружает страницы по мере чтения,
+    поэтому память процесса не растет с размером файла. Часть включает строки,
+    начинающиеся в [start, end), - строка на границе достается одной части.
+    """
+    if end < 0:
+        with gzip.open(path, "rb") as file:
+            yield from file
+        return
+
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = min(end, size)
+            pos = start
+            if start > 0:
+                # Начало части - первая строка, начинающаяся не раньше start
+                newline = mm.find(b"\n", start - 1, end)
+                if newline < 0:
+                    return
+                pos = newline + 1
+            while pos < end:
+                newline = mm.find(b"\n", pos)
+                if newline < 0:
+                    newline = size
+                yield mm[pos:newline]
+                pos = newline + 1
+
+
+def _trim_top(counts: Dict[int, int], capacity: int):
+    """
+    Сокращение счетчиков до capacity (объединение сводок Misra-Gries)
+
+    Из всех счетчиков вычитается (capacity+1)-е по величине значение,
+    неположительные удаляются - так сводки можно объединять без потери гарантий.
+    """
+    if len(counts) <= capacity:
+        return
+    threshold = sorted(counts.values(), reverse=True)[capacity]
+    for user_id in list(counts):
+        counts[user_id] -= threshold
+        if counts[user_id] <= 0:
+            del counts[user_id]
+
+
+def scan_chunk(task: Tuple[str, int, int], midnights: List[float],
+               top_capacity: int = TOP_CAPACITY) -> Dict[str, Any]:
+    """
+    Подсчет показателей по части файла (выполняется в процессе-воркере)
+
+    Память ограничена независимо от размера файла: уникальные пользователи считаются
+    оценками HyperLogLog, самые активные - сводкой Misra-Gries из top_capacity счетчиков.
+
+    :param task: (путь, начало, конец) - часть файла
+    :param midnights: начала последних 8 дней (от 7 дней назад до сегодня) в Unix time
+    :param top_capacity: количество счетчиков самых активных пользователей
+    :return: Частичные показатели для объединения в merge_results
+    """
+    week_start = midnights[0]
+    today_start = midnights[-1]
+    users = HyperLogLog(HLL_PRECISION)
+    week_users = HyperLogLog(HLL_PRECISION)
+    today_users = HyperLogLog(HLL_PRECISION)
+    seen_all, seen_week, seen_today = set(), set(), set()
+
+    top: Dict[int, int] = {}
+    names: Dict[int, Optional[str]] = {}
+    day_messages = [0] * len(midnights)
+    result = {"lines": 0, "bad_lines": 0, "dropped": 0, "events": 0, "messages": 0}
+
+    for line in _iter_lines(*task):
+        result["lines"] += 1
+        try:
+            event = json.loads(line)
+            if "dropped" in event:
+                # Отметка о записях, отброшенных при переполнении очереди записи
+                result["dropped"] += event["dropped"]
+                continue
+            timestamp, user_id = event["t"], event["u"]
+        except (ValueError, KeyError, TypeError):
+            # Недописанная (при аварийной остановке) или поврежденная строка
+            result["bad_lines"] += 1
+            continue
+
+        result["events"] += 1
+        is_message = event.get("e") == "message"
+        result["messages"] += is_message
+
+        # Повторы одного пользователя не пересчитываются в оценках
+        if user_id not in seen_all:
+            if len(seen_all) >= _SEEN_CACHE_SIZE:
+                seen_all.clear()
+            seen_all.add(user_id)
+            users.add(user_id)
+
+        if timestamp >= week_start:
+            day = bisect.bisect_right(midnights, timestamp) - 1
+            day_messages[day] += is_message
+            if user_id not in seen_week:
+                if len(seen_week) >= _SEEN_CACHE_SIZE:
+                    seen_week.clear()
+                seen_week.add(user_id)
+                week_users.add(user_id)
+            if timestamp >= today_start and user_id not in seen_today:
+                if len(seen_today) >= _SEEN_CACHE_SIZE:
+                    seen_today.clear()
+                seen_today.add(user_id)
+                today_users.add(user_id)
+
+        # Сводка Misra-Gries: при переполнении все счетчики уменьшаются разом
+        top[user_id] = top.get(user_id, 0) + 1
+        if event.get("n"):
+            names[user_id] = event["n"]
+        if len(top) > 2 * top_capacity:
+            _trim_top(top, top_capacity)
+            # Имена храним только для отслеживаемых пользователей
+            names = {user_id: names[user_id] for user_id in top if user_id in names}
+
+    _trim_top(top, top_capacity)
+    result.update({
+        "users": users.to_bytes(),
+        "week_users": week_users.to_bytes(),
+        "today_users": today_users.to_bytes(),
+        "day_messages": day_messages,
+        "top": top,
+        "names": {user_id: names.get(user_id) for user_id in top},
+    })
+    return result
+
+
+def merge_results(parts: List[Dict[str, Any]], midnights: List[float],
+                  top_capacity: int = TOP_CAPACITY, top_limit: int = 5) -> Dict[str, Any]:
+    """
+    Объединение частичных показателей в статистику формата stats_service
+
+    :return: Словарь с ключами users и messages (как у get_stats) и показателями чтения
+    """
+    users = HyperLogLog(HLL_PRECISION)
+    week_users = HyperLogLog(HLL_PRECISION)
+    today_users = HyperLogLog(HLL_PRECISION)
+    day_messages = [0] * len(midnights)
+    top: Dict[int, int] = {}
+    names: Dict[int, Optional[str]] = {}
+    totals = {"lines": 0, "bad_lines": 0, "dropped": 0, "events": 0, "messages": 0}
+
+    for part in parts:
+        for key in totals:
+            totals[key] += part[key]
+        users.merge(HyperLogLog(HLL_PRECISION, part["users"]))
+        week_users.merge(HyperLogLog(HLL_PRECISION, part["week_users"]))
+        today_users.merge(HyperLogLog(HLL_PRECISION, part["today_users"]))
+        day_messages = [a + b for a, b in zip(day_messages, part["day_messages"])]
+        for user_id, count in part["top"].items():
+            top[user_id] = top.get(user_id, 0) + count
+        # Части идут в порядке файлов, поэтому последнее имя - самое свежее
+        names.update({user_id: name for user_id, name in part["names"].items() if name})
+        _trim_top(top, top_capacity)
+        names = {user_id: names[user_id] for user_id in top if user_id in names}
+
+    # Распределение по дням недели в формате stats_service: (номер дня, 0 - воскресенье)
+    days_of_week: Dict[int, int] = {}
+    for midnight, count in zip(midnights, day_messages):
+        if count:
+            day_of_week = (datetime.date.fromtimestamp(midnight).weekday() + 1) % 7
+            days_of_week[day_of_week] = days_of_week.get(day_of_week, 0) + count
+
+    leaders = sorted(top.items(), key=lambda item: item[1], reverse=True)[:top_limit]
+    return {
+        "users": {
+            "total_users": users.count(),
+            "active_today": today_users.count(),
+            "active_week": week_users.count(),
+            "top_users": [(names.get(user_id), user_id, count) for user_id, count in leaders],
+        },
+        "messages": {
+            "total_messages": totals["messages"],
+            "today_messages": day_messages[-1],
+            "week_messages": sum(day_messages),
+            "days_stats": sorted(days_of_week.items()),
+        },
+        "lines": totals["lines"],
+        "bad_lines": totals["bad_lines"],
+        "dropped": totals["dropped"],
+        "events": totals["events"],
+    }
+
+
+def _midnights(today: datetime.date) -> List[float]:
+    """Начала последних 8 дней (как в /stats: день >= сегодня - 7) в Unix time"""
+    return [
+        datetime.datetime.combine(today - datetime.timedelta(days=days), datetime.time()).timestamp()
+        for days in range(7, -1, -1)
+    ]
+
+
+def analyze(directory: str, workers: int = 0, chunk_size: int = CHUNK_SIZE,
+            today: Optional[datetime.date] = None) -> Dict[str, Any]:
+    """
+    Статистика использования бота по журналу событий без обращения к БД
+
+    Файлы (и части больших файлов) обрабатываются параллельно в нескольких процессах,
+    каждый читает свою часть потоково и возвращает компактные частичные показатели.
+
+    :param directory: каталог логов
+    :param workers: количество процессов (0 - по числу ядер, 1 - в текущем процессе)
+    :param chunk_size: размер части файла для одного процесса (в байтах)
+    :param today: текущий день (для тестов)
+    :return: Статистика в формате stats_service плюс количество файлов, байт и строк
+    """
+    midnights = _midnights(today or datetime.date.today())
+    paths = find_event_files(directory)
+    tasks = _plan_tasks(paths, chunk_size)
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+
+    if workers <= 1:
+        parts = [scan_chunk(task, midnights) for task in tasks]
+    else:
+        # spawn вместо fork: процессы не наследуют потоки и состояние вызывающего процесса.
+        # Процесс spawn заново импортирует главный модуль, поэтому из бота анализ
+        # запускается отдельной командой (см. analyze_async), а не этой функцией
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            parts = list(executor.map(scan_chunk, tasks, [midnights] * len(tasks)))
+
+    result = merge_results(parts, midnights)
+    result["files"] = len(paths)
+    result["bytes"] = sum(os.path.getsize(path) for path in paths)
+    return result
+
+
+async def analyze_async(directory: str, workers: int = 0) -> Dict[str, Any]:
+    """
+    Анализ журнала событий из бота (для /stats), не блокируя цикл событий
+
+    Пул spawn, созданный внутри бота, запускал бы процессы, которые сначала заново импортируют
+    главный модуль бота (main.py: aiogram, все сервисы) - секунды до начала чтения на каждый
+    вызов. Поэтому анализатор запускается командой python -m utils.log_analyzer --json:
+    главный модуль его процессов - сам анализатор, и они готовы к работе за доли секунды.
+
+    :param directory: каталог логов
+    :param workers: количество процессов (0 - по числу ядер)
+    :return: Статистика в формате analyze (пары значений - списками JSON)
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "utils.log_analyzer",
+        "--dir", os.path.abspath(directory), "--workers", str(workers), "--json",
+        cwd=PROJECT_DIR,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        # /stats отменен (например, при остановке бота) - анализатор больше не нужен
+        process.kill()
+        await process.wait()
+        raise
+    if process.returncode != 0:
+        error = stderr.decode("utf-8", "replace").strip().splitlines()
+        raise RuntimeError(f"анализатор завершился с кодом {process.returncode}: "
+                           f"{error[-1] if error else 'без вывода'}")
+    return json.loads(stdout)
+
+
+def main():
+    """Запуск из командной строки"""
+    from config import config
+
+    parser = argparse.ArgumentParser(description="Статистика бота по журналу событий (без БД)")
+    parser.add_argument("--dir", default=config.file_log.directory, help="каталог логов")
+    parser.add_argument("--workers", type=int, default=config.file_log.analyzer_workers,
+                        help="количество процессов (0 - по числу ядер)")
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_SIZE // (1024 * 1024),
+                        help="размер части файла для одного процесса (МБ)")
+    parser.add_argument("--json", action="store_true", help="вывести результат в формате JSON")
+    args = parser.parse_args()
+
+    started = datetime.datetime.now()
+    result = analyze(args.dir, args.workers, args.chunk_mb * 1024 * 1024)
+    elapsed = (datetime.datetime.now() - started).total_seconds()
+
+    if args.json:
+        print(json.dumps({**result, "seconds": elapsed}, ensure_ascii=False, indent=2))
+        return
+
+    users, messages = result["users"], result["messages"]
+    print(f"Файлов: {result['files']}, {result['bytes'] / 1024 / 1024:.1f} МБ, "
+          f"строк: {result['lines']} ({elapsed:.2f} сек)")
+    print(f"Пользователей: ~{users['total_users']}, сегодня: ~{users['active_today']}, "
+          f"за неделю: ~{users['active_week']}")
+    print(f"Сообщений: {messages['total_messages']}, сегодня: {messages['today_messages']}, "
+          f"за неделю: {messages['week_messages']}")
+    for username, user_id, count in users["top_users"]:
+        print(f"  {username or f'ID: {user_id}'} - {count} событий")
+    if result["bad_lines"] or result["dropped"]:
+        print(f"Поврежденных строк: {result['bad_lines']}, пропущено событий при записи: {result['dropped']}")
+
+
+# Проверяем, запущен ли скрипт напрямую (а не импортирован)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+import os
+import re
+import gzip
+import queue
+import shutil
+import logging
+import datetime
+import threading
+import logging.handlers
+from config import config
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Постановка записей лога в ограниченную очередь без ожидания
+
+    Вызывается в цикле событий: запись только форматируется и кладется в очередь.
+    Если поток записи не успевает и очередь заполнена, запись отбрасывается и учитывается
+    в счетчике dropped - обработка обновлений никогда не ждет диск.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0             # Отброшено записей из-за переполнения очереди
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RotatingLogFile(logging.handlers.BaseRotatingHandler):
+    """
+    Файл лога с ротацией по дням и по размеру
+
+    Текущие записи пишутся в {name}.log. При смене дня или превышении max_bytes файл
+    переименовывается в {name}_{ГГГГ-ММ-ДД}.log (при нескольких ротациях за день -
+    {name}_{ГГГГ-ММ-ДД}.{N}.log) и сжимается gzip в отдельном потоке, чтобы сжатие
+    не задерживало запись следующих строк. Файлы старше backup_days дней удаляются.
+    """
+
+    def __init__(self, directory: str, name: str = "bot_log", max_bytes: int = 50 * 1024 * 1024,
+                 backup_days: int = 14, compress: bool = True, extension: str = "log"):
+        """
+        :param directory: каталог для файлов лога
+        :param name: имя файла без расширения
+        :param max_bytes: размер, при котором файл ротируется досрочно (0 - только по дням)
+        :param backup_days: сколько дней хранить ротированные файлы (0 - хранить всегда)
+        :param compress: сжимать ротированные файлы
+        :param extension: расширение файлов (log для текста, jsonl для событий)
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name_prefix = name
+        self.max_bytes = max_bytes
+        self.backup_days = backup_days
+        self.compress = compress
+        self.extension = extension
+        super().__init__(os.path.join(directory, f"{name}.{extension}"), "a", encoding="utf-8")
+
+        # День, к которому относятся записи текущего файла
+        if os.path.getsize(self.baseFilename) > 0:
+            self.current_day = datetime.date.fromtimestamp(os.path.getmtime(self.baseFilename))
+        else:
+            self.current_day = datetime.date.today()
+        self.rotated_re = re.compile(
+            rf"^{re.escape(name)}_(\d{{4}}-\d{{2}}-\d{{2}})(\.\d+)?\.{re.escape(extension)}(\.gz)?$"
+        )
+
+        # Сжатие выполняется отдельным потоком, а не потоком записи
+        self.compressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="log-compress")
+
+        # Счетчики для мониторинга
+        self.written = 0             # Записано строк
+        self.rotations = 0           # Выполнено ротаций
+        self.compressed = 0          # Сжато файлов
+
+    def emit(self, record: logging.LogRecord):
+        super().emit(record)
+        self.written += 1
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        """Ротация при смене дня записи или при превышении размера файла"""
+        if datetime.date.fromtimestamp(record.created) != self.current_day:
+            return True
+        if self.max_bytes and self.stream is not None and self.stream.tell() >= self.max_bytes:
+            return True
+        return False
+
+    def _rotated_name(self) -> str:
+        """Свободное имя для ротированного файла текущего дня"""
+        base = os.path.join(self.directory, f"{self.name_prefix}_{self.current_day.isoformat()}")
+        candidate, index = f"{base}.{self.extension}", 0
+        while os.path.exists(candidate) or os.path.exists(f"{candidate}.gz"):
+            index += 1
+            candidate = f"{base}.{index}.{self.extension}"
+        return candidate
+
+    def doRollover(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            target = self._rotated_name()
+            os.replace(self.baseFilename, target)
+            self.rotations += 1
+            if self.compress:
+                self.compressor.submit(self._compress, target)
+
+        self.current_day = datetime.date.today()
+        self.stream = self._open()
+        self.compressor.submit(self._remove_expired)
+
+    def _compress(self, path: str):
+        """Сжатие ротированного файла (в потоке сжатия)"""
+        try:
+            with open(path, "rb") as source, gzip.open(f"{path}.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+            self.compressed += 1
+        except OSError as e:
+            logging.getLogger(__name__).warning(f"Не удалось сжать файл лога {path}: {e}")
+
+    def _remove_expired(self):
+        """Удаление ротированных файлов старше backup_days (в потоке сжатия)"""
+        if not self.backup_days:
+            return
+        border = datetime.date.today() - datetime.timedelta(days=self.backup_days)
+        for file_name in os.listdir(self.directory):
+            match = self.rotated_re.match(file_name)
+            if match and datetime.date.fromisoformat(match.group(1)) < border:
+                try:
+                    os.remove(os.path.join(self.directory, file_name))
+                except OSError:
+                    pass
+
+    def close(self):
+        super().close()
+        # Дожидаемся сжатия уже ротированных файлов
+        self.compressor.shutdown(wait=True)
+
+
+class LogPipeline:
+    """
+    Неблокирующая запись лога в файл
+
+    Логгер в цикле событий только кладет записи в ограниченную очередь, а отдельный поток
+    (QueueListener) забирает их и пишет в файл с ротацией. Поэтому задержки диска
+    (запись, ротация, сжатие) никогда не добавляются ко времени обработки обновлений.
+    Если запись не успевает за потоком событий, лишние записи отбрасываются, а в файл
+    пишется строка с количеством пропущенных записей.
+    """
+
+    def __init__(self, directory: str, name: str = "bot_log", max_bytes: int = 50 * 1024 * 1024,
+                 backup_days: int = 14, queue_size: int = 10000, compress: bool = True,
+                 extension: str = "log", fmt: str = "%(asctime)s - %(levelname)s - %(message)s",
+                 drop_format: str = "Пропущено записей лога (очередь переполнена): {count}"):
+        """
+        :param directory: каталог для файлов лога
+        :param name: имя файла без расширения
+        :param max_bytes: размер, при котором файл ротируется досрочно (0 - только по дням)
+        :param backup_days: сколько дней хранить ротированные файлы (0 - хранить всегда)
+        :param queue_size: максимальное количество записей, ожидающих записи в файл
+        :param compress: сжимать ротированные файлы
+        :param extension: расширение файлов
+        :param fmt: формат строки лога
+        :param drop_format: текст отметки о пропущенных записях ({count} - их количество)
+        """
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.backup_days = backup_days
+        self.queue_size = queue_size
+        self.compress = compress
+        self.extension = extension
+        self.fmt = fmt
+        self.drop_format = drop_format
+
+        self.queue: Optional[queue.Queue] = None
+        self.queue_handler: Optional[DroppingQueueHandler] = None
+        self.file_handler: Optional[RotatingLogFile] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.logger: Optional[logging.Logger] = None
+        self.reported_dropped = 0    # Сколько отброшенных записей уже отмечено в файле
+        self.lock = threading.Lock()
+
+    def start(self, logger: logging.Logger):
+        """
+        Подключение очереди к логгеру и запуск потока записи (повторный вызов ничего не делает)
+
+        :param logger: логгер, записи которого пишутся в файл
+        """
+        with self.lock:
+            if self.listener is not None:
+                return
+            self.file_handler = RotatingLogFile(
+                self.directory, self.name, self.max_bytes, self.backup_days, self.compress, self.extension
+            )
+            # Задаем формат записей лога (по умолчанию - с временной меткой, уровнем и сообщением)
+            self.file_handler.setFormatter(logging.Formatter(self.fmt))
+
+            self.queue = queue.Queue(self.queue_size)
+            self.queue_handler = DroppingQueueHandler(self.queue)
+            self.listener = _ReportingListener(self, self.queue, self.file_handler)
+            self.listener.start()
+            logger.addHandler(self.queue_handler)
+            self.logger = logger
+
+    def stop(self):
+        """Запись оставшихся в очереди записей и остановка потока записи (хук остановки бота)"""
+        with self.lock:
+            if self.listener is None:
+                return
+            self.logger.removeHandler(self.queue_handler)
+            self.listener.stop()
+            self.file_handler.close()
+            self.listener = None
+
+    def report_dropped(self):
+        """Отметка в файле о записях, отброшенных с прошлой отметки (в потоке записи)"""
+        dropped = self.queue_handler.dropped
+        if dropped > self.reported_dropped:
+            self.file_handler.handle(logging.makeLogRecord({
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": self.drop_format.format(count=dropped - self.reported_dropped),
+            }))
+            self.reported_dropped = dropped
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Показатели записи лога в файл
+
+        :return: Словарь с размером очереди, количеством записанных и отброшенных записей
+        """
+        if self.listener is None:
+            return {"running": False}
+        return {
+            "running": True,
+            "queue_size": self.queue.qsize(),
+            "written": self.file_handler.written,
+            "dropped": self.queue_handler.dropped,
+            "rotations": self.file_handler.rotations,
+            "compressed": self.file_handler.compressed,
+        }
+
+
+class _ReportingListener(logging.handlers.QueueListener):
+    """Поток записи, который перед каждой записью отмечает отброшенные записи"""
+
+    def __init__(self, pipeline: LogPipeline, log_queue: queue.Queue, *handlers: logging.Handler):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.pipeline = pipeline
+
+    def handle(self, record: logging.LogRecord):
+        self.pipeline.report_dropped()
+        super().handle(record)
+
+    def enqueue_sentinel(self):
+        # Сигнал остановки ждет места в очереди: при остановке ее разбирает поток записи
+        self.queue.put(self._sentinel)
+
+
+# Общая запись лога бота в файл
+log_pipeline = LogPipeline(
+    directory=config.file_log.directory,
+    max_bytes=config.file_log.max_bytes,
+    backup_days=config.file_log.backup_days,
+    queue_size=config.file_log.queue_size,
+    compress=config.file_log.compress,
+)
+
+
+# Журнал событий: одна строка JSON на событие (сообщение, callback) для подсчета
+# статистики без БД утилитой utils/log_analyzer.py. Отметка о пропущенных записях
+# тоже записывается строкой JSON, чтобы анализатор мог ее учесть
+event_log = LogPipeline(
+    directory=config.file_log.directory,
+    name="events",
+    max_bytes=config.file_log.max_bytes,
+    backup_days=config.file_log.backup_days,
+    queue_size=config.file_log.queue_size,
+    compress=config.file_log.compress,
+    extension="jsonl",
+    fmt="%(message)s",
+    drop_format='{{"dropped": {count}}}',
+)
@@ -0,0 +1,90 @@
+import os
+import sys
+import asyncio
+
+
+# Добавляем родительский каталог в sys.path для импорта config
+# Это позволяет импортировать модули из родительской директории
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import config
+from services.db import db
+from services.schema import create_tables
+from services.partitions import ensure_partitions, is_partitioned, partition_manager
+
+
+async def migrate_table(conn, table: str) -> int:
+    """
+    Перенос обычной таблицы старой схемы в секционированную
+
+    Старая таблица переименовывается, вместо нее создается секционированная,
+    данные копируются в секции по времени, после чего старая таблица удаляется.
+    Все выполняется в одной транзакции: при ошибке база останется в прежнем виде.
+
+    :param conn: Соединение asyncpg
+    :param table: Имя таблицы
+    :return: Количество перенесенных строк
+    """
+    old = f"{table}_unpartitioned"
+    # На время переноса запись в таблицу блокируется, фоновая запись логов подождет
+    await conn.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE")
+    await conn.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    # Имена ключа, индексов и последовательности освобождаются для новой таблицы
+    await conn.execute(f"ALTER TABLE {old} DROP CONSTRAINT IF EXISTS {table}_pkey")
+    indexes = await conn.fetch("SELECT indexname FROM pg_indexes WHERE tablename = $1", old)
+    for row in indexes:
+        await conn.execute(f"DROP INDEX {row['indexname']}")
+    await conn.execute(f"ALTER SEQUENCE IF EXISTS {table}_id_seq RENAME TO {old}_id_seq")
+
+    await create_tables(conn)
+
+    # Секции создаются заранее для всего диапазона старых данных, чтобы ничего не попало
+    # в секцию по умолчанию
+    first, last = await conn.fetchrow(f"SELECT MIN(timestamp)::date, MAX(timestamp)::date FROM {old}")
+    if first is not None:
+        await ensure_partitions(conn, table, first, last, partition_manager.interval)
+
+    status = await conn.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    # ID продолжаются с последнего значения старой таблицы
+    await conn.execute(f"""
+        SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT MAX(id) FROM {table}), 1))
+    """)
+    await conn.execute(f"DROP TABLE {old}")
+    return int(status.split()[-1])
+
+
+async def migrate_partitions():
+    """Перенос таблиц логов и ошибок на секционированную схему"""
+    try:
+        async with db.acquire() as conn:
+            for table in (config.bot.basic_logs_db_table_name, config.bot.errors_logs_db_table_name):
+                exists = await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", table)
+                if exists and await is_partitioned(conn, table):
+                    print(f"{table}: уже секционирована")
+                    continue
+
+                async with conn.transaction():
+                    if exists:
+                        rows = await migrate_table(conn, table)
+                        print(f"{table}: перенесено {rows} строк")
+                    else:
+                        await create_tables(conn)
+                        print(f"{table}: создана секционированная таблица")
+
+    except Exception as e:
+        # Обрабатываем возможные ошибки при подключении или выполнении запросов
+        print(f"Ошибка при переносе таблиц: {e}")
+
+
+async def main():
+    """Создание пула, перенос таблиц и корректное закрытие пула"""
+    await db.start()
+    try:
+        await migrate_partitions()
+    finally:
+        await db.stop()
+
+
+# Проверяем, запущен ли скрипт напрямую (а не импортирован)
+if __name__ == "__main__":
+    # Перенос нужен один раз для баз, созданных до секционирования таблиц логов
+    asyncio.run(main())
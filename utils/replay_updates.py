@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+import aiohttp
+
+
+# Добавляем родительский каталог в sys.path для импорта config
+# Это позволяет импортировать модули из родительской директории
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import config
+
+
+def load_updates(path: str) -> list:
+    """
+    Загрузка записанных обновлений
+
+    :param path: JSON-файл с массивом обновлений или JSONL-файл (одно обновление в строке)
+    :return: Список обновлений в виде словарей
+    """
+    with open(path, encoding="utf-8") as file:
+        content = file.read().strip()
+    if content.startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
+
+
+async def replay(updates: list, url: str, secret: str, concurrency: int):
+    """
+    Отправка обновлений на локальный webhook так, как это делает Telegram
+
+    :param updates: Обновления
+    :param url: Адрес webhook
+    :param secret: Секретный токен webhook
+    :param concurrency: Количество одновременных запросов
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret}
+    latencies = []
+
+    async with aiohttp.ClientSession(headers=headers) as session:
+        async def send(update: dict):
+            async with semaphore:
+                started = time.perf_counter()
+                async with session.post(url, json=update) as response:
+                    body = await response.text()
+                latencies.append(time.perf_counter() - started)
+                # Если обработчик ответил прямо в ответе на webhook, в теле (multipart/form-data)
+                # будет поле method с названием метода Bot API
+                match = re.search(r'name="method"\r?\n\r?\n(\w+)', body)
+                answer = match.group(1) if match else None
+                print(f"update_id={update.get('update_id')}: HTTP {response.status}"
+                      + (f", ответ в webhook: {answer}" if answer else ""))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(update) for update in updates))
+        total = time.perf_counter() - started
+
+    if latencies:
+        latencies.sort()
+        print(f"\nОтправлено {len(latencies)} обновлений за {total:.2f} сек "
+              f"({len(latencies) / total:.1f} в сек), "
+              f"p50 {latencies[len(latencies) // 2] * 1000:.1f} мс, "
+              f"макс. {latencies[-1] * 1000:.1f} мс")
+
+
+# Проверяем, запущен ли скрипт напрямую (а не импортирован)
+if __name__ == "__main__":
+    # Локальная проверка режима webhook: запустите бота с BOT_MODE=webhook без WEBHOOK_URL
+    # и отправьте ему записанные обновления
+    parser = argparse.ArgumentParser(description="Отправка записанных обновлений на webhook бота")
+    parser.add_argument("path", help="JSON или JSONL файл с обновлениями")
+    parser.add_argument("--url", default=f"http://localhost:{config.webhook.port}{config.webhook.path}",
+                        help="адрес webhook")
+    parser.add_argument("--secret", default=config.webhook.secret_token, help="секретный токен webhook")
+    parser.add_argument("--concurrency", type=int, default=1, help="количество одновременных запросов")
+    args = parser.parse_args()
+
+    asyncio.run(replay(load_updates(args.path), args.url, args.secret, args.concurrency))
@@ -0,0 +1,152 @@
+import os
+import time
+import logging
+import functools
+import inspect
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional, Tuple
+
+
+# Модуль импортируется первым в main.py, поэтому в нем нет тяжелых импортов (aiogram, config):
+# все, что загружается после него, попадает в замер
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+def _process_age() -> Optional[float]:
+    """
+    Сколько секунд назад запущен процесс (Linux, точность ~10 мс)
+
+    Время до первой строки main.py - запуск интерпретатора и импорт стандартных модулей.
+    На других системах возвращает None.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Имя процесса в скобках может содержать пробелы - разбираем поля после него
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        started = int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return max(uptime - started, 0.0)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfiler:
+    """
+    Замер фаз запуска бота и сигнал готовности
+
+    Фазы: запуск интерпретатора, группы импортов main.py, настройка диспетчера
+    и каждый хук запуска (db.start, log_writer.start и т.д.). Когда бот начинает принимать
+    обновления, вызывается mark_ready(): в лог выводится разбивка времени запуска,
+    а файл готовности (если задан) создается для проверки готовности контейнера.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []   # (название фазы, длительность в секундах)
+        self.ready_at: Optional[float] = None        # Время готовности от запуска процесса
+        self.ready_file = ""
+
+        # Время от запуска процесса до импорта этого модуля
+        self.boot = _process_age()
+        if self.boot is not None:
+            self.phases.append(("запуск интерпретатора", self.boot))
+
+    def elapsed(self) -> float:
+        """Секунд от запуска процесса (или от импорта модуля, если время запуска неизвестно)"""
+        return (self.boot or 0.0) + time.perf_counter() - self.started
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Замер фазы запуска
+
+        Пример:
+            with startup_profiler.phase("импорт: обработчики"):
+                from handlers import register_all_handlers
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    def instrument(self, observer: Any, prefix: str = "хук"):
+        """
+        Замер каждого хука, зарегистрированного в observer (dp.startup)
+
+        Функции хуков заменяются обертками с functools.wraps: aiogram определяет аргументы
+        хука по исходной функции, поэтому хуки получают те же аргументы, что и без замера.
+        """
+        for handler in observer.handlers:
+            callback = handler.callback
+            name = f"{prefix}: {getattr(callback, '__qualname__', repr(callback))}"
+            handler.callback = self._timed(name, callback)
+
+    def _timed(self, name: str, callback: Any) -> Any:
+        if inspect.iscoroutinefunction(inspect.unwrap(callback)):
+            @functools.wraps(callback)
+            async def timed(*args, **kwargs):
+                with self.phase(name):
+                    return await callback(*args, **kwargs)
+        else:
+            @functools.wraps(callback)
+            def timed(*args, **kwargs):
+                with self.phase(name):
+                    return callback(*args, **kwargs)
+        return timed
+
+    @property
+    def ready(self) -> bool:
+        """Принимает ли бот обновления"""
+        return self.ready_at is not None
+
+    def mark_ready(self, ready_file: str = "", verbose: bool = True):
+        """
+        Бот начал принимать обновления
+
+        :param ready_file: файл готовности (пустая строка - не создавать)
+        :param verbose: вывести в лог разбивку по фазам, иначе - только общее время
+        """
+        if self.ready_at is not None:
+            return
+        self.ready_at = self.elapsed()
+        if ready_file:
+            try:
+                with open(ready_file, "w") as f:
+                    f.write(f"{os.getpid()}\n")
+                self.ready_file = ready_file
+            except OSError as e:
+                logger.error(f"Не удалось создать файл готовности {ready_file}: {e}")
+        logger.info(self.report() if verbose else f"Бот готов к приему обновлений за {self.ready_at:.2f} сек")
+
+    def clear_ready(self):
+        """Снятие сигнала готовности при остановке"""
+        self.ready_at = None
+        if self.ready_file:
+            try:
+                os.remove(self.ready_file)
+            except OSError:
+                pass
+            self.ready_file = ""
+
+    def report(self) -> str:
+        """
+        Разбивка времени запуска по фазам
+
+        :return: Текст для лога
+        """
+        total = self.ready_at if self.ready_at is not None else self.elapsed()
+        lines = [f"Бот готов к приему обновлений за {total:.2f} сек:"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<45} {seconds * 1000:9.1f} мс")
+        accounted = sum(seconds for _, seconds in self.phases)
+        lines.append(f"  {'прочее':<45} {max(total - accounted, 0.0) * 1000:9.1f} мс")
+        return "\n".join(lines)
+
+
+# Один замер на процесс
+startup_profiler = StartupProfiler()
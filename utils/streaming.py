@@ -0,0 +1,142 @@
+import time
+import asyncio
+import logging
+from aiogram import types
+from contextlib import aclosing
+from typing import AsyncIterator, List
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+# Максимальная длина текста одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Текст сообщения-заглушки, которое отправляется сразу и затем дополняется ответом
+PLACEHOLDER_TEXT = "✍️ Думаю над ответом..."
+
+
+def split_text(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """
+    Разбивает текст на части не длиннее limit
+
+    По возможности разрез делается по переносу строки или пробелу, чтобы не рвать слова.
+
+    :param text: Исходный текст
+    :param limit: Максимальная длина части
+    :return: Список частей
+    """
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind(" ", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip()
+    parts.append(text)
+    return parts
+
+
+class StreamingReply:
+    """
+    Ответ, который показывается пользователю по мере генерации
+
+    Сразу отправляется сообщение-заглушка, а затем оно редактируется не чаще edit_interval.
+    Когда текст перестает помещаться в одно сообщение, заполненная часть фиксируется
+    и продолжение выводится в новом сообщении.
+    """
+
+    def __init__(self, message: types.Message, edit_interval: float = 1.0):
+        """
+        :param message: Сообщение пользователя, на которое отвечаем
+        :param edit_interval: минимальный интервал между редактированиями (в секундах)
+        """
+        self.message = message
+        self.edit_interval = edit_interval
+
+        self.current = None          # Сообщение бота, которое сейчас дополняется
+        self.text = ""               # Текст, относящийся к текущему сообщению
+        self.shown = ""              # Текст, который сейчас виден пользователю
+        self.next_edit_at = 0.0      # Время, раньше которого не редактируем сообщение
+
+    async def start(self):
+        """Отправка сообщения-заглушки"""
+        self.current = await self.message.answer(PLACEHOLDER_TEXT, parse_mode=None)
+        self.next_edit_at = time.monotonic() + self.edit_interval
+
+    async def append(self, delta: str):
+        """Добавление фрагмента ответа; сообщение обновляется не чаще edit_interval"""
+        self.text += delta
+
+        # Заполненные сообщения фиксируем и продолжаем ответ в новом
+        while len(self.text) > TELEGRAM_MESSAGE_LIMIT:
+            head, *rest = split_text(self.text)
+            await self._edit(head, final=True)
+            self.text = "".join(rest)
+            self.current = await self.message.answer(self.text or PLACEHOLDER_TEXT, parse_mode=None)
+            self.shown = self.text
+            self.next_edit_at = time.monotonic() + self.edit_interval
+
+        if time.monotonic() >= self.next_edit_at:
+            await self._edit(self.text)
+
+    async def finish(self):
+        """Финальное обновление сообщения полным текстом"""
+        await self._edit(self.text, final=True)
+
+    async def _edit(self, text: str, final: bool = False):
+        """
+        Редактирование текущего сообщения с учетом ограничений Telegram
+
+        Промежуточные версии отправляются без разметки, потому что незавершенный
+        HTML может оказаться некорректным. Финальная версия отправляется с разметкой
+        по умолчанию, а при ошибке разбора - обычным текстом.
+        """
+        if not text or (text == self.shown and not final):
+            return
+
+        try:
+            if final:
+                try:
+                    await self.current.edit_text(text)
+                except TelegramBadRequest as e:
+                    if "not modified" in str(e):
+                        return
+                    await self.current.edit_text(text, parse_mode=None)
+            else:
+                await self.current.edit_text(text, parse_mode=None)
+            self.shown = text
+            self.next_edit_at = time.monotonic() + self.edit_interval
+
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать - откладываем следующее редактирование
+            self.next_edit_at = time.monotonic() + e.retry_after
+            if final:
+                await asyncio.sleep(e.retry_after)
+                await self._edit(text, final=True)
+
+        except TelegramBadRequest as e:
+            # "message is not modified" и подобные ошибки не мешают дальнейшей генерации
+            logger.warning(f"Не удалось обновить сообщение с ответом: {e}")
+
+
+async def send_streaming_reply(message: types.Message, chunks: AsyncIterator[str],
+                               edit_interval: float = 1.0):
+    """
+    Отправляет ответ пользователю по мере поступления фрагментов
+
+    :param message: Сообщение пользователя, на которое отвечаем
+    :param chunks: Асинхронный итератор фрагментов ответа
+    :param edit_interval: минимальный интервал между редактированиями сообщения (в секундах)
+    """
+    reply = StreamingReply(message, edit_interval=edit_interval)
+    await reply.start()
+    # aclosing гарантирует освобождение запроса к API, даже если отправка прервется
+    async with aclosing(chunks) as stream:
+        async for delta in stream:
+            await reply.append(delta)
+    await reply.finish()
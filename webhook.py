@@ -0,0 +1,175 @@
+import asyncio
+import logging
+from aiohttp import web
+from config import config
+from typing import Any, Dict, Set
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from utils.startup import startup_profiler
+
+
+# Получаем экземпляр логгера
+logger = logging.getLogger('bot_logger')
+
+
+async def set_webhook(bot: Bot, dispatcher: Dispatcher):
+    """
+    Регистрация webhook в Telegram (хук запуска бота)
+
+    Повторная регистрация с теми же параметрами безопасна, поэтому ее может
+    выполнять каждая реплика бота за балансировщиком.
+    """
+    await bot.set_webhook(
+        url=config.webhook.url,
+        secret_token=config.webhook.secret_token,
+        max_connections=config.webhook.max_connections,
+        # Telegram присылает только те типы обновлений, для которых есть обработчики
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        drop_pending_updates=config.webhook.drop_pending_updates,
+    )
+    logger.info(f"Webhook зарегистрирован: {config.webhook.url}")
+
+
+async def healthcheck(request: web.Request) -> web.Response:
+    """Проверка доступности реплики для балансировщика нагрузки"""
+    return web.Response(text="ok")
+
+
+async def readiness(request: web.Request) -> web.Response:
+    """
+    Проверка готовности реплики: 200 после завершения запуска, до этого - 503
+
+    В отличие от /healthz, по этому адресу балансировщик или оркестратор узнает,
+    что реплике уже можно направлять обновления
+    """
+    if startup_profiler.ready:
+        return web.Response(text="ready")
+    return web.Response(status=503, text="starting")
+
+
+class FastPathRequestHandler(SimpleRequestHandler):
+    """
+    Обработчик запросов webhook с быстрым ответом в теле ответа
+
+    Каждое обновление обрабатывается в фоне, а запрос Telegram ждет не дольше answer_timeout.
+    Если обработчик успел вернуть метод Bot API (простые ответы: /start, /help, ключевые слова),
+    метод отправляется прямо в ответе на webhook. Медленные обработчики (запросы к OpenAI)
+    не держат соединение Telegram: запрос завершается пустым ответом, а метод,
+    который обработчик вернет позже, отправляется отдельным запросом к Bot API.
+
+    Переопределяется только публичный handle(); из внутренностей aiogram используется
+    лишь сборка тела ответа (_build_response_writer), поэтому версия aiogram
+    закреплена в requirements.txt, а поведение проверяется тестом tests/test_webhook.py
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, answer_timeout: float, **kwargs: Any):
+        """
+        :param answer_timeout: сколько ждать обработчик до пустого ответа (0 - не ждать)
+        """
+        super().__init__(dispatcher=dispatcher, bot=bot, **kwargs)
+        self.answer_timeout = answer_timeout
+        # Выполняющиеся обработки и отложенные отправки (ссылки не дают задачам пропасть)
+        self.tasks: Set[asyncio.Task] = set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+
+        update = await request.json(loads=bot.session.json_loads)
+        task = self._track(self._feed(bot, update))
+
+        if self.answer_timeout > 0:
+            # asyncio.wait не отменяет задачу по истечении времени - обработка продолжится в фоне
+            done, _ = await asyncio.wait({task}, timeout=self.answer_timeout)
+            if done:
+                result = None if task.cancelled() or task.exception() else task.result()
+                if not isinstance(result, TelegramMethod):
+                    result = None
+                return web.Response(body=self._build_response_writer(bot=bot, result=result))
+
+        # Обработчик не успел: ответ Telegram уже отправлен, метод отправляется отдельным запросом
+        task.add_done_callback(lambda finished: self._send_late(bot, finished))
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def _track(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _feed(self, bot: Bot, update: Dict[str, Any]) -> Any:
+        try:
+            return await self.dispatcher.feed_raw_update(bot=bot, update=update, **self.data)
+        except Exception as e:
+            # Ошибки обработчиков уже записаны в лог диспетчером, здесь - только необработанные
+            logger.error(f"Ошибка обработки обновления из webhook: {e}")
+            raise
+
+    def _send_late(self, bot: Bot, task: asyncio.Task):
+        if task.cancelled() or task.exception() or not isinstance(task.result(), TelegramMethod):
+            return
+        self._track(self.dispatcher.silent_call_request(bot=bot, result=task.result()))
+
+
+def create_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    """
+    Создание HTTP-приложения, передающего обновления из webhook в диспетчер
+
+    :param bot: Экземпляр бота
+    :param dp: Диспетчер с уже зарегистрированными middleware и обработчиками
+    :return: Приложение aiohttp
+    """
+    if not config.webhook.secret_token:
+        # Без секрета любой, кто знает адрес, может присылать боту поддельные обновления
+        raise ValueError("Для режима webhook необходимо задать WEBHOOK_SECRET")
+
+    app = web.Application()
+
+    # Обработчик проверяет заголовок X-Telegram-Bot-Api-Secret-Token и передает
+    # обновление в диспетчер в фоне. Метод, который быстро вернул обработчик
+    # (например, message.answer(...) без await), отправляется прямо в теле ответа
+    # на webhook - без отдельного запроса к Bot API
+    FastPathRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        answer_timeout=config.webhook.answer_timeout if config.webhook.answer_in_response else 0.0,
+        secret_token=config.webhook.secret_token,
+    ).register(app, path=config.webhook.path)
+    app.router.add_get("/healthz", healthcheck)
+    app.router.add_get("/ready", readiness)
+
+    # Хуки запуска и остановки диспетчера (пул БД, фоновые задачи) вызываются
+    # при запуске и остановке HTTP-сервера
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """
+    Запуск встроенного HTTP-сервера для режима webhook
+
+    :param bot: Экземпляр бота
+    :param dp: Диспетчер с уже зарегистрированными middleware и обработчиками
+    """
+    # Без публичного адреса webhook в Telegram не регистрируется - так сервер можно
+    # запустить локально и отправлять ему записанные обновления (utils/replay_updates.py)
+    if config.webhook.url:
+        dp.startup.register(set_webhook)
+
+    app = create_app(bot, dp)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.webhook.host, port=config.webhook.port)
+    await site.start()
+    logger.info(f"Webhook-сервер слушает {config.webhook.host}:{config.webhook.port}{config.webhook.path}")
+    # Хуки запуска уже выполнены при настройке сервера - реплика готова принимать обновления
+    startup_profiler.mark_ready(config.startup.ready_file, verbose=config.startup.profile)
+
+    try:
+        # Сервер работает до отмены задачи (Ctrl+C или остановка контейнера)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await bot.session.close()